@@ -0,0 +1,550 @@
+#!/usr/bin/python -u
+# Movie Battles II RTV/RTM benchmarks.
+#
+# Compares the hot paths of rtvrtm.py against their previous implementations.
+# Run from this folder: python benchmark.py <benchmark> [options] [files]
+
+from __future__ import with_statement
+from sys import argv, exit
+from optparse import OptionParser
+from os import close as close_fd, remove, listdir
+from os.path import getsize, basename, join as join_path
+from tempfile import mkstemp, mkdtemp
+from shutil import rmtree
+from zipfile import ZipFile, ZIP_STORED
+from multiprocessing import Pool, cpu_count
+from socket import socket, AF_INET, SOCK_DGRAM, SHUT_RDWR, timeout as socketTimeout, error as socketError
+from time import time
+from collections import defaultdict
+from random import Random
+
+try:
+
+  from resource import getrusage, RUSAGE_SELF
+
+except ImportError: # Windows.
+
+  getrusage = None
+
+import rtvrtm
+import fakeserver
+
+def timed(function, *args):
+
+  """Return the time taken by a function call along with its result."""
+
+  start = time()
+  result = function(*args)
+  return ((time() - start), result)
+
+def synthetic_log(size):
+
+  """Write a synthetic games.log of about size megabytes and return its path."""
+
+  random = Random(0)
+  names = ("Padawan", "^1Vader", "^4Obi-^7Wan", "Clone ^2#42", "Bob", "^bGrievous")
+  lines = []
+  append = lines.append
+  block_size = 0
+
+  while block_size < 4194304: # Build a 4 MB block of lines with a realistic event mix.
+
+    timestamp = "%3i:%02i " % (random.randint(0, 999), random.randint(0, 59))
+    event = random.random()
+    player_id = random.randint(0, 31)
+
+    if event < 0.4:
+
+      line = "%sKill: %i %i 12: %s killed %s by MOD_SABER\n" % (timestamp, player_id, random.randint(0, 31),
+                                                                  random.choice(names), random.choice(names))
+
+    elif event < 0.7:
+
+      line = "%s%i: say: %s: \"%s\"\n" % (timestamp, player_id, random.choice(names),
+                                           random.choice(("gg", "!rtv", "^1nice ^7one", "!nominate mb2_dotf", "lol")))
+
+    elif event < 0.9:
+
+      line = "%sItem: %i weapon_blaster\n" % (timestamp, player_id)
+
+    elif event < 0.93:
+
+      line = "%sClientConnect: %i\n" % (timestamp, player_id)
+
+    elif event < 0.96:
+
+      line = "%sClientDisconnect: %i\n" % (timestamp, player_id)
+
+    elif event < 0.965: # Client line missing its newline character.
+
+      line = "%s Client %i class: Jedi%sItem: %i weapon_blaster\n" % (timestamp, player_id, timestamp, player_id)
+
+    else:
+
+      line = "%sClientUserinfoChanged: %i n\\%s\\t\\0\\model\\kyle\n" % (timestamp, player_id, random.choice(names))
+
+    append(line)
+    block_size += len(line)
+
+  block = "".join(lines)
+  fd, path = mkstemp(".log", "rtvrtm-")
+  close_fd(fd)
+
+  with open(path, "wb") as log:
+
+    for i in xrange(max(((size * 1048576) / len(block)), 1)):
+
+      if not i % 16: # New session every 64 MB.
+
+        log.write(rtvrtm.RESTART_LINE)
+        log.write("  0:00 InitGame: \\sv_maxclients\\32\\g_authenticity\\%i\\mapname\\mb2_map%i\n" % ((i % 4), i))
+
+      log.write(block)
+
+  return path
+
+def read_log(opts, args, default_size=50):
+
+  """Return the lines of the given log file or of a synthetic one."""
+
+  path = args[0] if args else synthetic_log(opts.size or default_size)
+
+  try:
+
+    with open(path, "rt") as log:
+
+      return log.readlines()
+
+  finally:
+
+    if not args:
+
+      remove(path)
+
+def synthetic_pk3s(count, entries=500):
+
+  """Write a folder of count pk3 files with entries files each (a few of them maps) and return its path."""
+
+  folder = mkdtemp("", "rtvrtm-pk3-")
+
+  for i in xrange(count):
+
+    with ZipFile(join_path(folder, "mb2_pack%03i.pk3" % (i)), "w", ZIP_STORED) as pk3:
+
+      for j in xrange(entries):
+
+        if not j % 100:
+
+          pk3.writestr("maps/mb2_map%03i_%i.bsp" % (i, j), "IBSP")
+
+        else:
+
+          pk3.writestr("models/players/pack%03i/skin%i.jpg" % (i, j), "")
+
+  return folder
+
+def read_bsps_namelist(folder):
+
+  """MBII folder scan before the BSP index. Baseline for the pk3 benchmark."""
+
+  bsps = []
+
+  for pk3 in (pk3 for pk3 in iter(listdir(folder)) if pk3.lower().endswith(".pk3")):
+
+    pk3zip = ZipFile(join_path(folder, pk3), "r")
+    bsps += [basename(bsp)[:-4] for bsp in iter(pk3zip.namelist()) if bsp.lower().endswith(".bsp")]
+    pk3zip.close()
+
+  return bsps
+
+def read_bsps_zipinfo(path):
+
+  """Pk3 reader before the central directory reader. Baseline for the pk3read benchmark."""
+
+  pk3zip = ZipFile(path, "r")
+
+  try:
+
+    return tuple((basename(bsp)[:-4] for bsp in iter(pk3zip.namelist()) if bsp.lower().endswith(".bsp")))
+
+  finally:
+
+    pk3zip.close()
+
+def read_pk3s_measured(reader, paths):
+
+  """Read every pk3 file with reader in a fresh process and return the time taken, the growth of its peak memory
+  usage in kilobytes (None without the resource module) and the maps found."""
+
+  before = getrusage(RUSAGE_SELF).ru_maxrss if getrusage is not None else 0
+  elapsed, bsps = timed(map, reader, paths)
+  return (elapsed, ((getrusage(RUSAGE_SELF).ru_maxrss - before) if getrusage is not None else None), bsps)
+
+def fix_line_split(line):
+
+  """fix_line() before the single scan rewrite. Baseline for the fixline benchmark."""
+
+  startswith = str.startswith
+  split = str.split
+
+  while startswith(line[8:], "Client "):
+
+    line = split(line, ":", 3)
+
+    if len(line) < 4:
+
+      return ""
+
+    line[0] = int(line[0])
+
+    for i in xrange(-1, -7, -1):
+
+      substring = int(line[-2][i:])
+
+      if (substring - line[0]) >= 0 or line[-2][(i-1)] == " ":
+
+        line = "%3i:%s" % (substring, line[-1])
+        break
+
+  return line
+
+def bench_fixline(opts, args):
+
+  """Merged line fix: split based fix_line_split() against the single scan fix_line()."""
+
+  lines = read_log(opts, args)
+  results = []
+
+  for name, function in (("fix_line_split", fix_line_split), ("fix_line", rtvrtm.fix_line)):
+
+    elapsed, fixed = timed(map, function, lines)
+    results.append((elapsed, fixed))
+    print("[*] %-14s %8.2f s (%i lines/s)" % (name, elapsed, (len(lines) / elapsed)))
+
+  print("[*] Lines: %i | Merged: %i | Speedup: %.1fx | Same result: %s"
+        % (len(lines), sum((1 for line in iter(lines) if line.startswith("Client ", 8))),
+           (results[0][0] / results[1][0]), ("Yes" if results[0][1] == results[1][1] else "NO")))
+
+def remove_color_replace(item):
+
+  """remove_color() before the single pass rewrite. Baseline for the color benchmark."""
+
+  replace = str.replace
+
+  for i in xrange(10):
+
+    item = replace(item, "^%i" % (i), "")
+
+  return item
+
+def bench_color(opts, args):
+
+  """Color code removal on chat messages and player names: remove_color_replace() against remove_color()."""
+
+  texts = []
+  names = []
+
+  for event in rtvrtm.parse_log(read_log(opts, args)):
+
+    if isinstance(event, rtvrtm.Say):
+
+      texts.append(event.text)
+      names.append(event.name)
+
+    elif isinstance(event, rtvrtm.ClientUserinfoChanged) and event.name is not None:
+
+      names.append(event.name)
+
+  corpus = (texts + names)
+  cache = {}
+  results = []
+
+  for name, function, items in (("remove_color_replace", remove_color_replace, corpus),
+                                ("remove_color", rtvrtm.remove_color, corpus),
+                                ("remove_color_replace (names)", remove_color_replace, names),
+                                ("remove_color (names)", rtvrtm.remove_color, names),
+                                ("remove_color (names, cached)", (lambda item: rtvrtm.remove_color(item, cache)), names)):
+
+    elapsed, stripped = timed(map, function, items)
+    results.append(stripped)
+    print("[*] %-28s %8.2f s (%i strings/s)" % (name, elapsed, (len(items) / elapsed)))
+
+  print("[*] Messages: %i | Names: %i | Different results: %i (^a-style codes)"
+        % (len(texts), len(names), sum((1 for (old, new) in zip(results[0], results[1]) if old != new))))
+
+def send_new_socket(address, payload, buffer_size=1024):
+
+  """Rcon._send() before the persistent socket. Baseline for the rcon benchmark."""
+
+  sock = socket(AF_INET, SOCK_DGRAM)
+  sock.bind(("", 0))
+  sock.settimeout(1)
+  sock.connect(address)
+
+  while(True):
+
+    try:
+
+      sock.send(payload)
+      sock.recv(buffer_size)
+      break
+
+    except socketTimeout:
+
+      continue
+
+    except socketError:
+
+      break
+
+  sock.shutdown(SHUT_RDWR)
+  sock.close()
+
+def bench_rcon(opts, args):
+
+  """Rcon command bursts against the fake server: a new socket per command against the persistent socket."""
+
+  server = fakeserver.FakeServer(("127.0.0.1", 0), "secret")
+  server.start()
+  address = server.address
+  rcon = rtvrtm.Rcon(address, "", "secret")
+  payload = "\xff\xff\xff\xffrcon secret svsay ^2[Votes] ^71(2): mb2_dotf, 2(1): mb2_deathstar"
+  results = []
+
+  for name, send in (("new socket", (lambda: send_new_socket(address, payload))),
+                     ("persistent socket", (lambda: rcon._send(payload)))):
+
+    elapsed, result = timed(lambda: [send() for i in xrange(opts.count)])
+    results.append(elapsed)
+    print("[*] %-18s %8.2f s (%i commands/s)" % (name, elapsed, (opts.count / elapsed)))
+
+  server.close()
+  print("[*] Commands: %i | Speedup: %.1fx" % (opts.count, (results[0] / results[1])))
+
+def bench_scan(opts, args):
+
+  """Initial log pass: line iterator (replay_log) against mmap scanner (scan_log)."""
+
+  path = args[0] if args else synthetic_log(opts.size or 500)
+  size = (getsize(path) / 1048576.0)
+  results = []
+
+  try:
+
+    for name, function in (("replay_log", rtvrtm.replay_log), ("scan_log", rtvrtm.scan_log)):
+
+      players = {}
+
+      with open(path, "rt") as log:
+
+        elapsed, cvars = timed(function, log, players)
+
+      results.append((elapsed, cvars, players))
+      print("[*] %-10s %8.2f s (%.1f MB/s)" % (name, elapsed, (size / elapsed)))
+
+  finally:
+
+    if not args:
+
+      remove(path)
+
+  print("[*] Log size: %.1f MB | Speedup: %.1fx | Same result: %s"
+        % (size, (results[0][0] / results[1][0]), ("Yes" if results[0][1:] == results[1][1:] else "NO")))
+
+def bench_pk3(opts, args):
+
+  """MBII folder scan: opening every pk3 file against the BSP index (first scan, first scan with workers and cached
+  scan)."""
+
+  folder = args[0] if args else synthetic_pk3s(opts.pk3s)
+  fd, index_path = mkstemp(".bspindex", "rtvrtm-")
+  close_fd(fd)
+  remove(index_path)
+  results = []
+
+  try:
+
+    pk3s = sorted((pk3 for pk3 in iter(listdir(folder)) if pk3.lower().endswith(".pk3")), key=rtvrtm.fs_path_key)
+    elapsed, bsps = timed(read_bsps_namelist, folder)
+    results.append((elapsed, bsps))
+    print("[*] %-24s %8.3f s" % ("namelist", elapsed))
+
+    for name, workers, cold in (("index (cold)", 1, True), ("index (cold, %i workers)" % (opts.workers), opts.workers, True),
+                                ("index (warm)", 1, False)):
+
+      if cold:
+
+        try:
+
+          remove(index_path)
+
+        except OSError:
+
+          pass
+
+      index = rtvrtm.BSPIndex(index_path, workers) # Loaded from disk like on a restart.
+      elapsed, (archives, warnings) = timed(index.scan, folder, pk3s)
+      results.append((elapsed, [bsp for (pk3, bsps) in iter(archives) for bsp in iter(bsps)]))
+      print("[*] %-24s %8.3f s (%i cached, %i read)" % (name, elapsed, index.hits, index.misses))
+
+  finally:
+
+    if not args:
+
+      rmtree(folder)
+
+    try:
+
+      remove(index_path)
+
+    except OSError: # Not written.
+
+      pass
+
+  print("[*] Pk3 files: %i | Maps: %i | Speedup (workers): %.1fx | Speedup (warm): %.1fx | Same result: %s"
+        % (len(pk3s), len(results[0][1]), (results[1][0] / results[2][0]), (results[0][0] / results[3][0]),
+           ("Yes" if (sorted(results[0][1]) == sorted(results[1][1]) and
+                      results[1][1] == results[2][1] == results[3][1]) else "NO")))
+
+def bench_pk3read(opts, args):
+
+  """Pk3 reader alone: ZipFile.namelist against walking the central directory, on the largest archives of a folder."""
+
+  if args:
+
+    folder = args[0]
+    pk3s = sorted((join_path(folder, pk3) for pk3 in iter(listdir(folder)) if pk3.lower().endswith(".pk3")),
+                  key=getsize, reverse=True)[:5]
+
+  else:
+
+    print("[*] Writing %i synthetic pk3 files with %i entries each..." % (3, opts.entries))
+    folder = synthetic_pk3s(3, opts.entries)
+    pk3s = [join_path(folder, pk3) for pk3 in sorted(listdir(folder))]
+
+  size = (sum((getsize(pk3) for pk3 in pk3s)) / 1048576.0)
+  results = []
+
+  try:
+
+    for name, reader in (("ZipFile.namelist", read_bsps_zipinfo), ("central directory", rtvrtm.read_bsps)):
+
+      pool = Pool(1) # A new process each time, so the peak memory usage of one reader doesn't hide the other's.
+
+      try:
+
+        elapsed, memory, bsps = pool.apply(read_pk3s_measured, (reader, pk3s))
+
+      finally:
+
+        pool.terminate()
+
+      results.append((elapsed, bsps))
+      print("[*] %-18s %8.3f s %s" % (name, elapsed, ("(peak memory +%i KB)" % (memory) if memory is not None else "")))
+
+  finally:
+
+    if not args:
+
+      rmtree(folder)
+
+  print("[*] Pk3 files: %i | Size: %.1f MB | Maps: %i | Speedup: %.1fx | Same result: %s"
+        % (len(pk3s), size,
+           sum((len(bsps) for bsps in results[0][1])), (results[0][0] / results[1][0]),
+           ("Yes" if results[0][1] == results[1][1] else "NO")))
+
+def nominate_scan(maps, secondary_maps, nominations):
+
+  """!nominate lookup before the map catalog. Baseline for the nominate benchmark."""
+
+  lower = str.lower
+  return [[mapname for mapname in iter(maps + secondary_maps) if lower(mapname) == nominated_map][:1]
+          for nominated_map in iter(nominations)]
+
+def nominate_catalog(catalog, nominations):
+
+  get = catalog.get
+  return [[get(nominated_map)[0]] if nominated_map in catalog else [] for nominated_map in iter(nominations)]
+
+def bench_nominate(opts, args):
+
+  """Map lookups of !nominate against the map lists of automatic maps: scanning both lists and the map catalog."""
+
+  random = Random(0)
+  maps = tuple(("mb2_Map%05i" % (i)) for i in xrange(opts.maps))
+  secondary_maps = tuple(("mb2_Extra%05i" % (i)) for i in xrange((opts.maps / 10)))
+  nominations = [str.lower(random.choice((maps + secondary_maps))) for i in xrange(opts.count / 10)]
+  nominations += ["mb2_nope"] * (len(nominations) / 10) # Typos.
+  elapsed, old = timed(nominate_scan, maps, secondary_maps, nominations)
+  print("[*] scan     %8.3f s" % (elapsed))
+  start = time()
+  catalog = rtvrtm.MapCatalog(maps, secondary_maps, (0, 1, 2))
+  build = (time() - start)
+  new_elapsed, new = timed(nominate_catalog, catalog, nominations)
+  print("[*] catalog  %8.3f s (built in %.3f s)" % (new_elapsed, build))
+  print("[*] Maps: %i | Lookups: %i | Speedup: %.1fx | Same result: %s"
+        % (len(catalog), len(nominations), (elapsed / new_elapsed), ("Yes" if old == new else "NO")))
+
+def bench_parse(opts, args):
+
+  """Parser stage alone: raw log lines into event records (parse_log)."""
+
+  lines = read_log(opts, args) # Keep file reads out of the measurement.
+  counts = defaultdict(int)
+  elapsed, events = timed(sum, (1 for event in rtvrtm.parse_log(lines, counts)))
+  print("[*] parse_log  %8.2f s (%i lines/s)" % (elapsed, (len(lines) / elapsed)))
+  print("[*] Lines: %i | Events: %i | %s"
+        % (len(lines), events, ", ".join(("%s %i" % ((event_type.__name__ if event_type else "Other"), counts[event_type])
+                                           for event_type in rtvrtm.EVENT_TYPES))))
+
+BENCHMARKS = {
+              "rcon": bench_rcon,
+              "color": bench_color,
+              "fixline": bench_fixline,
+              "nominate": bench_nominate,
+              "parse": bench_parse,
+              "pk3": bench_pk3,
+              "pk3read": bench_pk3read,
+              "scan": bench_scan
+             }
+
+def main(argv):
+
+  parser = OptionParser(usage="Usage: %s <%s> [options] [file or folder]" % (argv[0], "|".join(sorted(BENCHMARKS))))
+  parser.add_option("-s", type="int", dest="size",
+                    help="Size of the synthetic log in megabytes when no log file is given. Default: 500 for scan, 50 "
+                         "for the others", metavar="<megabytes>")
+  parser.add_option("-n", type="int", dest="count",
+                    help="Number of rcon commands to send. Default: 20000", metavar="<commands>", default=20000)
+  parser.add_option("-w", type="int", dest="workers",
+                    help="Number of pk3 worker processes compared with reading them in one process (--workers of "
+                         "rtvrtm.py, 1 by default). Default: number of CPUs, at least 2", metavar="<workers>",
+                    default=max(cpu_count(), 2))
+  parser.add_option("-k", type="int", dest="pk3s",
+                    help="Number of pk3 files in the synthetic MBII folder when no folder is given. Default: 200",
+                    metavar="<pk3 files>", default=200)
+  parser.add_option("-m", type="int", dest="maps",
+                    help="Number of primary maps in the nominate benchmark (plus 10% secondary maps). Default: 2000",
+                    metavar="<maps>", default=2000)
+  parser.add_option("-e", type="int", dest="entries",
+                    help="Number of files in each synthetic pk3 file of the pk3read benchmark. Default: 30000",
+                    metavar="<entries>", default=30000)
+  opts, args = parser.parse_args(argv[1:])
+
+  if not args or args[0] not in BENCHMARKS:
+
+    parser.error("Choose a benchmark: %s" % (", ".join(sorted(BENCHMARKS))))
+
+  benchmark = BENCHMARKS[args[0]]
+  print("%s\n" % (benchmark.__doc__))
+  benchmark(opts, args[1:])
+
+if __name__ == "__main__":
+
+  try:
+
+    main(argv)
+
+  except KeyboardInterrupt:
+
+    exit(2)
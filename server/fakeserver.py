@@ -0,0 +1,298 @@
+#!/usr/bin/python -u
+# Movie Battles II RTV/RTM fake game server.
+#
+# Stands in for linuxjampded when testing rtvrtm.py: answers rcon, getstatus and getinfo over UDP, records every
+# command it receives and appends synthetic lines to a log file.
+# Run from this folder: python fakeserver.py [options]
+
+from __future__ import with_statement
+from sys import argv, exit, stdout
+from optparse import OptionParser
+from socket import socket, AF_INET, SOCK_DGRAM, error as socketError
+from threading import Thread, Lock
+from time import time, sleep
+from random import Random
+
+RESTART_LINE = "  0:00 ------------------------------------------------------------\n"
+NAMES = ("Padawan", "^1Vader", "^4Obi-^7Wan", "Clone ^2#42", "Bob", "^bGrievous")
+CHATTER = ("gg", "lol", "^1nice ^7one", "!rtv", "!unrtv", "!rtm", "!nominate mb2_dotf", "!maplist", "!elapsed")
+
+class FakeServer(object):
+
+  """Answer rcon commands and connectionless queries like a game server does. Lost datagrams never reach the
+  server, dropped ones are executed but their reply never makes it back."""
+
+  def __init__(self, address=("127.0.0.1", 29070), rcon_pwd="", reply="", latency=0, loss=0, drop=0, seed=None):
+
+    self.sock = socket(AF_INET, SOCK_DGRAM)
+    self.sock.bind(address)
+    self.address = self.sock.getsockname()
+    self.rcon_pwd = rcon_pwd
+    self.reply = reply # Text after "print\n" in every rcon reply.
+    self.latency = latency # Seconds before each reply.
+    self.loss = loss # Probability of an incoming datagram being lost.
+    self.drop = drop # Probability of a reply being lost.
+    self.random = Random(seed)
+    self.commands = [] # Time received, command (without the password).
+    self.record = None # File object every command is also written to.
+    self.log = None # Log file object game events are written to.
+    self.lock = Lock()
+    self.started = time()
+    self.mapname = "mb2_dotf"
+    self.mode = 0
+    self.players = {} # Player id -> name.
+
+  def write_log(self, line):
+
+    """Append a line to the log file with the game timestamp in front of it."""
+
+    if self.log is not None:
+
+      elapsed = int((time() - self.started))
+
+      with self.lock:
+
+        self.log.write("%3i:%02i %s\n" % ((elapsed / 60), (elapsed % 60), line))
+        self.log.flush()
+
+  def infostring(self):
+
+    return ("\\sv_maxclients\\32\\g_authenticity\\%i\\mapname\\%s\\sv_hostname\\Fake Server" %
+            (self.mode, self.mapname))
+
+  def init_game(self, restart=False):
+
+    """Start a new map. The log gets the server start line (on a restart), the InitGame line and every player
+    connecting again."""
+
+    self.started = time()
+
+    if restart and self.log is not None:
+
+      with self.lock:
+
+        self.log.write(RESTART_LINE)
+
+    self.write_log("InitGame: %s" % (self.infostring()))
+
+    for player_id, name in sorted(self.players.iteritems()):
+
+      self.write_log("ClientConnect: %i" % (player_id))
+      self.write_log("ClientUserinfoChanged: %i n\\%s\\t\\0\\model\\kyle" % (player_id, name))
+
+  def execute(self, command):
+
+    """Run an rcon command. Map changes and kicks show up in the log file."""
+
+    command = command.split(" ", 1)
+
+    if command[0] == "mbmode":
+
+      args = command[1].split()
+      self.mode = int(args[0])
+
+      if len(args) > 1:
+
+        self.mapname = args[1].lower()
+
+      self.init_game()
+
+    elif command[0] == "clientkick":
+
+      player_id = int(command[1])
+
+      if self.players.pop(player_id, None) is not None:
+
+        self.write_log("ClientDisconnect: %i" % (player_id))
+
+  def handle(self, data):
+
+    """Return the reply to a datagram or None."""
+
+    if not data.startswith("\xff\xff\xff\xff"):
+
+      return None
+
+    data = data[4:]
+
+    if data.startswith("getstatus"):
+
+      return ("\xff\xff\xff\xffstatusResponse\n%s\n%s" %
+              (self.infostring(), "".join(('%i %i "%s"\n' % (0, 50, name)) for (player_id, name)
+                                          in sorted(self.players.iteritems()))))
+
+    elif data.startswith("getinfo"):
+
+      return ("\xff\xff\xff\xffinfoResponse\n%s\\clients\\%i\\hostname\\Fake Server" %
+              (self.infostring(), len(self.players)))
+
+    elif data.startswith("rcon "):
+
+      data = data[5:].split(" ", 1)
+
+      if len(data) < 2:
+
+        return None
+
+      elif not self.rcon_pwd:
+
+        return "\xff\xff\xff\xffprint\nNo rconpassword set on the server.\n"
+
+      elif data[0] != self.rcon_pwd:
+
+        return "\xff\xff\xff\xffprint\nBad rconpassword.\n"
+
+      self.commands.append((time(), data[1]))
+
+      if self.record is not None:
+
+        self.record.write("%.3f %s\n" % (time(), data[1]))
+        self.record.flush()
+
+      self.execute(data[1])
+      return "\xff\xff\xff\xffprint\n%s" % (self.reply)
+
+    return None
+
+  def serve(self):
+
+    sock = self.sock
+    random = self.random.random
+
+    while(True):
+
+      try:
+
+        data, address = sock.recvfrom(4096)
+
+      except socketError: # Closed.
+
+        break
+
+      if self.loss and random() < self.loss:
+
+        continue
+
+      reply = self.handle(data)
+
+      if reply is None or (self.drop and random() < self.drop):
+
+        continue
+
+      if self.latency:
+
+        sleep(self.latency)
+
+      sock.sendto(reply, address)
+
+  def start(self):
+
+    """Serve from a background thread."""
+
+    server = Thread(target=self.serve)
+    server.daemon = True
+    server.start()
+
+  def close(self):
+
+    self.sock.close()
+
+def chatter(server, rate):
+
+  """Start the game and append chat lines of the connected players to the log file at rate lines per second. Runs
+  forever."""
+
+  random = Random(0)
+  server.init_game(True)
+  interval = (1.0 / rate) if rate else None
+
+  while(True):
+
+    if interval is None or not server.players:
+
+      sleep(1)
+      continue
+
+    player_id = random.choice(server.players.keys())
+    name = server.players.get(player_id) # May have been kicked meanwhile.
+
+    if name is not None:
+
+      server.write_log("%i: say: %s: \"%s\"" % (player_id, name, random.choice(CHATTER)))
+
+    sleep(interval)
+
+def main(argv):
+
+  parser = OptionParser(usage="Usage: %s [options]" % (argv[0]))
+  parser.add_option("-a", dest="address", help="Address to listen on. Default: 127.0.0.1:29070",
+                    metavar="<ip:port>", default="127.0.0.1:29070")
+  parser.add_option("-p", dest="rcon_pwd", help="Rcon password. Commands with any other password are answered with "
+                    "\"Bad rconpassword.\". Default: none, every command is refused", metavar="<password>", default="")
+  parser.add_option("-r", dest="reply", help="Text of every rcon reply. Default: empty", metavar="<text>", default="")
+  parser.add_option("--latency", type="float", dest="latency", help="Seconds before each reply. Default: 0",
+                    metavar="<seconds>", default=0)
+  parser.add_option("--loss", type="float", dest="loss",
+                    help="Probability of a command being lost before reaching the server. Default: 0",
+                    metavar="<0-1>", default=0)
+  parser.add_option("--drop", type="float", dest="drop",
+                    help="Probability of a reply being lost after the command is executed. Default: 0",
+                    metavar="<0-1>", default=0)
+  parser.add_option("--record", dest="record", help="File every rcon command is written to. Default: standard output",
+                    metavar="<file>", default=None)
+  parser.add_option("--log", dest="log", help="Log file to append synthetic game lines to. Default: none",
+                    metavar="<file>", default=None)
+  parser.add_option("--players", type="int", dest="players", help="Players connected to the server. Default: 8",
+                    metavar="<players>", default=8)
+  parser.add_option("--rate", type="float", dest="rate",
+                    help="Chat lines per second appended to the log file (0 = none). Default: 1",
+                    metavar="<lines>", default=1)
+  parser.add_option("--seed", type="int", dest="seed", help="Seed for the packet loss simulation.",
+                    metavar="<seed>", default=None)
+  opts, args = parser.parse_args(argv[1:])
+
+  if args:
+
+    parser.error("Too many arguments or invalid arguments.")
+
+  try:
+
+    host, port = opts.address.rsplit(":", 1)
+    address = (host, int(port))
+
+  except ValueError:
+
+    parser.error("Invalid address.")
+
+  if not 0 <= opts.loss <= 1 or not 0 <= opts.drop <= 1:
+
+    parser.error("Loss and drop probabilities must range from 0 to 1.")
+
+  elif not 0 <= opts.players <= 32:
+
+    parser.error("The amount of players must range from 0 to 32.")
+
+  server = FakeServer(address, opts.rcon_pwd, opts.reply, opts.latency, opts.loss, opts.drop, opts.seed)
+  server.record = open(opts.record, "a") if opts.record else stdout
+  server.players.update(((player_id, NAMES[(player_id % len(NAMES))]) for player_id in xrange(opts.players)))
+  print("[*] Listening on %s:%i" % server.address)
+
+  if opts.log:
+
+    server.log = open(opts.log, "a")
+    server.start()
+    chatter(server, opts.rate)
+
+  else:
+
+    server.serve()
+
+if __name__ == "__main__":
+
+  try:
+
+    main(argv)
+
+  except KeyboardInterrupt:
+
+    exit(2)
@@ -35,21 +35,66 @@
 from __future__ import with_statement
 from sys import platform, setcheckinterval, argv, exit
 from optparse import OptionParser, OptionGroup
-from os import listdir, fsync
-from os.path import getsize, basename, dirname, normpath, realpath, normcase, join as join_path
+from os import listdir, fsync, fstat, stat, rename, remove, read as read_fd, close as close_fd
+from os.path import basename, dirname, normpath, realpath, normcase, join as join_path
 from socket import (socket, AF_INET, SOCK_STREAM, SOCK_DGRAM, SHUT_RDWR, gethostbyname_ex,
                     gaierror, timeout as socketTimeout, error as socketError)
 from time import time, sleep
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime
-from random import choice, sample
+from random import choice, sample, uniform
 from zipfile import ZipFile, BadZipfile
-from tarfile import open as TarFile
+from gzip import GzipFile
+from threading import Thread, Event, Condition
 from traceback import format_exc
+from select import select, error as selectError
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from cPickle import dump as dump_pickle, load as load_pickle, HIGHEST_PROTOCOL
+from signal import signal, SIGTERM
+from atexit import register as register_exit
+from mmap import mmap, ACCESS_READ
+from re import compile as compile_regex
+from itertools import chain
+from bisect import bisect
+from struct import Struct
+from multiprocessing import Pool, freeze_support
+
+try:
+
+  from backports.lzma import LZMACompressor
+
+except ImportError:
+
+  try:
+
+    from lzma import LZMACompressor
+
+  except ImportError:
+
+    LZMACompressor = None
+
+try:
+
+  from zstandard import ZstdCompressor
+
+except ImportError:
+
+  ZstdCompressor = None
 
 VERSION = "3.6b"
 CFG = "3.6b"
 SLEEP_INTERVAL = 0.075
+CHECKPOINT_INTERVAL = 60
+ROTATION_GRACE = 30 # Seconds the renamed log file must go unwritten before an empty new one is followed.
+RESTART_LINE = "  0:00 ------------------------------------------------------------\n"
+COMPRESSION_FORMATS = { # Format -> Extension, minimum level, maximum level, default level, required module (None if present).
+                       "gzip": (".gz", 1, 9, 9, None),
+                       "xz": (".xz", 0, 9, 6, (None if LZMACompressor else "backports.lzma")),
+                       "zstd": (".zst", 1, 22, 3, (None if ZstdCompressor else "zstandard"))
+                      }
+COLOR_CODE = compile_regex(r"\^[0-9A-Za-z]") # ^0-^9 and the ^a-^z/^A-^Z codes of newer clients.
+COLOR_CACHE_SIZE = 512
 MAPLIST_MAX_SIZE = 750
 REPORT_UNHANDLED_EXCEPTION = False
 
@@ -368,6 +413,9 @@ class Config(object):
   def __init__(self, config_path):
 
     self.config_path = config_path
+    self.bsp_index = BSPIndex(join_path(dirname(config_path), "rtvrtm.bspindex"))
+    self.map_index = None # Set when the MBII folder is scanned.
+    self.map_catalog = None # Set when the map lists are read.
     self.fields = {
                    # General settings.
                    "log": "logfile",
@@ -380,6 +428,9 @@ class Config(object):
                    "name protection": "name_protection",
                    "default game": "default_game",
                    "clean log": "clean_log",
+                   "compression": "compression",
+                   "rcon rate": "rcon_rate",
+                   "message expiry": "message_expiry",
                    # Admin voting settings.
                    "admin voting": "admin_voting",
                    "admin minimum votes": "admin_minimum_votes",
@@ -427,9 +478,28 @@ class Config(object):
                    "rtm second turn": "rtm_second_turn",
                    "rtm change immediately": "rtm_change_immediately"
                   }
-    self.bindaddr = self.default_game = self.maps = self.secondary_maps = "" # Optional configuration.
+    self.bindaddr = self.default_game = self.maps = self.secondary_maps = self.compression = \
+    self.rcon_rate = self.message_expiry = "" # Optional configuration.
     self.cvar = 0
 
+  def map_report(self):
+
+    """Return the map index summary lines printed after reading the configuration. Pk3 files providing none of the
+    listed maps are only reported when there are map lists (RTV, roundlimit or timelimit enabled)."""
+
+    report = ["Map index: %i maps from %i pk3 files, %i overridden by later pk3 files." %
+              (len(self.map_index), len(self.map_index.archives), len(self.map_index.shadowed))]
+
+    if self.maps:
+
+      unused_pk3s = self.map_index.unused(chain(self.maps, (self.secondary_maps or ())))
+
+      if unused_pk3s:
+
+        report.append("Pk3 files without any map of the map lists: %s" % (", ".join(unused_pk3s)))
+
+    return report
+
   def create_maplist(self, bsps):
 
     """Interactive map list creation."""
@@ -554,8 +624,6 @@ class Config(object):
     lstrip = str.lstrip
     rstrip = str.rstrip
     split = str.split
-    namelist = ZipFile.namelist
-    pk3close = ZipFile.close
     bind = socket.bind
     settimeout = socket.settimeout
     connect = socket.connect
@@ -670,37 +738,24 @@ class Config(object):
       try:
 
         self.MBII_Folder = normpath(strip(self.MBII_Folder))
-        pk3s = (pk3 for pk3 in iter(listdir(self.MBII_Folder))
-                if endswith(lower(pk3), ".pk3")) # Get all PK3 files within the MBII folder.
-        bsps = []
-
-        for pk3 in pk3s:
-
-          try:
-
-            pk3zip = ZipFile(join_path(self.MBII_Folder, pk3), "r")
-            bsps += [basename(bsp)[:-4] for bsp in iter(namelist(pk3zip)) if endswith(lower(bsp), ".bsp")] # Get all BSP files.
-            pk3close(pk3zip)
+        pk3s = sorted((pk3 for pk3 in iter(listdir(self.MBII_Folder))
+                       if endswith(lower(pk3), ".pk3")), key=fs_path_key) # Get all PK3 files within the MBII folder
+                                                                          # in the order the engine loads them.
+        archives, pk3_warnings = self.bsp_index.scan(self.MBII_Folder, pk3s) # Get all BSP files.
 
-          except IOError, err:
+        for pk3_warning in iter(pk3_warnings):
 
-            warning("Error while trying to read %s (ERRNO: %i)." % (pk3, err.errno))
-            print("[*] Checking options for errors..."),
+          warning(pk3_warning)
+          print("[*] Checking options for errors..."),
 
-          except BadZipfile:
+        self.map_index = MapIndex(archives) # Replacements override the maps of earlier pk3 files.
 
-            warning("%s is not a valid pk3 file." % (pk3))
-            print("[*] Checking options for errors..."),
-
-        if not bsps:
+        if not self.map_index.maps:
 
           error("No BSP map files detected. Make sure MBII folder path is correct.")
 
-        map_duplicates = defaultdict(bool)
-        bsps = [bsp for bsp in iter(bsps)
-                if (lower(bsp) not in map_duplicates and
-                    not map_duplicates[lower(bsp)])] # Ensure that we don't get duplicates from replacements.
-        lower_bsps = tuple((lower(bsp) for bsp in iter(bsps)))
+        bsps = list(self.map_index.maps)
+        lower_bsps = self.map_index.providers
 
       except AttributeError:
 
@@ -906,6 +961,76 @@ class Config(object):
 
         error("Incorrect format for clean log.")
 
+      try:
+
+        self.compression = split(lower(self.compression)) or ["gzip"]
+
+        if len(self.compression) > 2:
+
+          raise IndexError
+
+        elif self.compression[0] not in COMPRESSION_FORMATS:
+
+          error("Invalid format for compression (%s)." % (", ".join(sorted(COMPRESSION_FORMATS))))
+
+        extension, minimum_level, maximum_level, default_level, module = COMPRESSION_FORMATS[self.compression[0]]
+
+        if module:
+
+          error("%s compression requires the %s module." % (self.compression[0], module))
+
+        self.compression = (self.compression[0],
+                            (int(self.compression[1]) if len(self.compression) == 2 else default_level))
+
+        if not minimum_level <= self.compression[1] <= maximum_level:
+
+          error("Compression level for %s must be between %i and %i." % (self.compression[0], minimum_level,
+                                                                          maximum_level))
+
+      except ValueError:
+
+        error("Compression level is not an integer.")
+
+      except IndexError:
+
+        error("Incorrect format for compression (format level).")
+
+      try:
+
+        self.rcon_rate = split(self.rcon_rate)
+
+        if not self.rcon_rate or self.rcon_rate == ["0"]: # Unthrottled unless set, so a whole vote goes out at once.
+
+          self.rcon_rate = False
+
+        elif len(self.rcon_rate) != 2:
+
+          raise ValueError
+
+        else:
+
+          self.rcon_rate = (int(self.rcon_rate[0]), float(self.rcon_rate[1]))
+
+          if self.rcon_rate[0] < 1 or self.rcon_rate[1] <= 0:
+
+            raise ValueError
+
+      except ValueError:
+
+        error("Rcon rate must be either 0 (disabled) or a burst size and a number of commands per second.")
+
+      try:
+
+        self.message_expiry = (int(self.message_expiry) if self.message_expiry else 10)
+
+        if self.message_expiry < 1:
+
+          raise ValueError
+
+      except ValueError:
+
+        error("Message expiry must be a positive integer (seconds).")
+
 # Admin voting settings.
 
       try:
@@ -1706,6 +1831,8 @@ class Config(object):
         self.pick_secondary_maps = self.map_priority = self.nomination_type = None
         self.enable_recently_played = 0
 
+      self.map_catalog = MapCatalog(self.maps, self.secondary_maps, self.map_priority)
+
 # Rock the Mode settings.
 
       try:
@@ -2077,14 +2204,13 @@ class Config(object):
     lstrip = str.lstrip
     rstrip = str.rstrip
     split = str.split
-    namelist = ZipFile.namelist
-    pk3close = ZipFile.close
     bind = socket.bind
     settimeout = socket.settimeout
     connect = socket.connect
     shutdown = socket.shutdown
     close = socket.close
-    self._bindaddr = self._default_game = self._maps = self._secondary_maps = "" # Optional configuration.
+    self._bindaddr = self._default_game = self._maps = self._secondary_maps = self._compression = \
+    self._rcon_rate = self._message_expiry = "" # Optional configuration.
     cvar = 0
     print("[*] Checking configuration file..."),
 
@@ -2151,38 +2277,25 @@ class Config(object):
       try:
 
         self._MBII_Folder = normpath(strip(self._MBII_Folder))
-        pk3s = (pk3 for pk3 in iter(listdir(self._MBII_Folder))
-                if endswith(lower(pk3), ".pk3")) # Get all PK3 files within the MBII folder.
-        bsps = []
-
-        for pk3 in pk3s:
+        pk3s = sorted((pk3 for pk3 in iter(listdir(self._MBII_Folder))
+                       if endswith(lower(pk3), ".pk3")), key=fs_path_key) # Get all PK3 files within the MBII folder
+                                                                          # in the order the engine loads them.
+        archives, pk3_warnings = self.bsp_index.scan(self._MBII_Folder, pk3s) # Get all BSP files.
 
-          try:
-
-            pk3zip = ZipFile(join_path(self._MBII_Folder, pk3), "r")
-            bsps += [basename(bsp)[:-4] for bsp in iter(namelist(pk3zip)) if endswith(lower(bsp), ".bsp")] # Get all BSP files.
-            pk3close(pk3zip)
-
-          except IOError, err:
-
-            warning("Error while trying to read %s (ERRNO: %i)." % (pk3, err.errno))
-            print("[*] Checking options for errors..."),
+        for pk3_warning in iter(pk3_warnings):
 
-          except BadZipfile:
+          warning(pk3_warning)
+          print("[*] Checking options for errors..."),
 
-            warning("%s is not a valid pk3 file." % (pk3))
-            print("[*] Checking options for errors..."),
+        map_index = MapIndex(archives) # Replacements override the maps of earlier pk3 files.
 
-        if not bsps:
+        if not map_index.maps:
 
           warning("No BSP map files detected. Make sure MBII folder path is correct.", rehash=True)
           return False
 
-        map_duplicates = defaultdict(bool)
-        bsps = tuple((bsp for bsp in iter(bsps)
-                      if (lower(bsp) not in map_duplicates and
-                          not map_duplicates[lower(bsp)]))) # Ensure that we don't get duplicates from replacements.
-        lower_bsps = tuple((lower(bsp) for bsp in iter(bsps)))
+        bsps = map_index.maps
+        lower_bsps = map_index.providers
 
       except AttributeError:
 
@@ -2415,6 +2528,84 @@ class Config(object):
         warning("Incorrect format for clean log.", rehash=True)
         return False
 
+      try:
+
+        self._compression = split(lower(self._compression)) or ["gzip"]
+
+        if len(self._compression) > 2:
+
+          raise IndexError
+
+        elif self._compression[0] not in COMPRESSION_FORMATS:
+
+          warning("Invalid format for compression (%s)." % (", ".join(sorted(COMPRESSION_FORMATS))), rehash=True)
+          return False
+
+        extension, minimum_level, maximum_level, default_level, module = COMPRESSION_FORMATS[self._compression[0]]
+
+        if module:
+
+          warning("%s compression requires the %s module." % (self._compression[0], module), rehash=True)
+          return False
+
+        self._compression = (self._compression[0],
+                             (int(self._compression[1]) if len(self._compression) == 2 else default_level))
+
+        if not minimum_level <= self._compression[1] <= maximum_level:
+
+          warning("Compression level for %s must be between %i and %i." % (self._compression[0], minimum_level,
+                                                                            maximum_level), rehash=True)
+          return False
+
+      except ValueError:
+
+        warning("Compression level is not an integer.", rehash=True)
+        return False
+
+      except IndexError:
+
+        warning("Incorrect format for compression (format level).", rehash=True)
+        return False
+
+      try:
+
+        self._rcon_rate = split(self._rcon_rate)
+
+        if not self._rcon_rate or self._rcon_rate == ["0"]: # Unthrottled unless set, so a whole vote goes out at once.
+
+          self._rcon_rate = False
+
+        elif len(self._rcon_rate) != 2:
+
+          raise ValueError
+
+        else:
+
+          self._rcon_rate = (int(self._rcon_rate[0]), float(self._rcon_rate[1]))
+
+          if self._rcon_rate[0] < 1 or self._rcon_rate[1] <= 0:
+
+            raise ValueError
+
+      except ValueError:
+
+        warning("Rcon rate must be either 0 (disabled) or a burst size and a number of commands per second.",
+                rehash=True)
+        return False
+
+      try:
+
+        self._message_expiry = (int(self._message_expiry) if self._message_expiry else 10)
+
+        if self._message_expiry < 1:
+
+          raise ValueError
+
+      except ValueError:
+
+        warning("Message expiry must be a positive integer (seconds).", rehash=True)
+        return False
+
 # Admin voting settings.
 
       try:
@@ -3276,6 +3467,8 @@ class Config(object):
         self._pick_secondary_maps = self._map_priority = self._nomination_type = None
         self._enable_recently_played = 0
 
+      map_catalog = MapCatalog(self._maps, self._secondary_maps, self._map_priority)
+
 # Rock the Mode settings.
 
       try:
@@ -3632,6 +3825,9 @@ class Config(object):
       self.name_protection = self._name_protection
       self.default_game = self._default_game
       self.clean_log = self._clean_log
+      self.compression = self._compression
+      self.rcon_rate = self._rcon_rate
+      self.message_expiry = self._message_expiry
       # Admin voting settings.
       self.admin_voting = self._admin_voting
       self.admin_minimum_votes = self._admin_minimum_votes
@@ -3666,6 +3862,8 @@ class Config(object):
       self.map_priority = self._map_priority
       self.nomination_type = self._nomination_type
       self.enable_recently_played = self._enable_recently_played
+      self.map_index = map_index
+      self.map_catalog = map_catalog
       # Rock the Mode settings.
       self.rtm = self._rtm
       self.mode_priority = self._mode_priority
@@ -3692,2212 +3890,4217 @@ class Config(object):
     print("Done!")
     return True
 
-class Rcon(object):
+class Histogram(object):
 
-  """Send commands to the server via rcon. Wrapper class."""
+  """Round trip times of one kind of rcon command in fixed buckets, along with the timeouts and errors seen."""
 
-  def __init__(self, address, bindaddr, rcon_pwd):
+  BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5) # Upper bucket bounds in seconds. One more for the rest.
 
-    self.address = address
-    self.bindaddr = bindaddr
-    self.rcon_pwd = rcon_pwd
+  def __init__(self):
 
-  def _send(self, payload, buffer_size=1024): # This method shouldn't be used outside the scope of this object's
-                                              # wrappers.
-    sock = socket(AF_INET, SOCK_DGRAM) # Socket descriptor sending/receiving rcon commands to/from the server.
-    sock.bind((self.bindaddr, 0)) # Setting port as 0 will let the OS pick an available port for us.
-    sock.settimeout(1)
-    sock.connect(self.address)
-    send = sock.send
-    recv = sock.recv
+    self.buckets = [0] * (len(self.BOUNDS) + 1)
+    self.count = self.timeouts = self.errors = 0
+    self.total = self.longest = 0.0
 
-    while(True): # Make sure an infinite loop is placed until
-                 # the command is successfully received.
-      try:
-      
-        send(payload)
-        recv(buffer_size)
-        break
+  def add(self, seconds):
 
-      except socketTimeout:
+    self.buckets[bisect(self.BOUNDS, seconds)] += 1
+    self.count += 1
+    self.total += seconds
 
-        continue
+    if seconds > self.longest:
 
-      except socketError:
+      self.longest = seconds
 
-        break
+  def percentile(self, fraction):
 
-    sock.shutdown(SHUT_RDWR)
-    sock.close()
+    """Return the upper bound (in seconds) of the bucket holding the given fraction of the samples. None when it's
+    past the last bound."""
 
-  def say(self, msg):
-      
-    self._send("\xff\xff\xff\xffrcon %s say %s" % (self.rcon_pwd, msg),
-               2048)
+    wanted = (fraction * self.count)
+    seen = 0
 
-  def svsay(self, msg):
+    for bound, count in zip((self.BOUNDS + (None,)), self.buckets):
 
-    if len(msg) > 141: # Message is too big for "svsay".
-                       # Use "say" instead.
-      self.say(msg)
+      seen += count
 
-    else:
+      if seen >= wanted:
 
-      self._send("\xff\xff\xff\xffrcon %s svsay %s" % (self.rcon_pwd, msg))
+        return bound
 
-  def mbmode(self, cmd):
+  def __str__(self):
 
-    self._send("\xff\xff\xff\xffrcon %s mbmode %s" % (self.rcon_pwd, cmd))
+    if not self.count:
 
-  def clientkick(self, player_id):
+      return "0 replies, %i timeouts, %i errors" % (self.timeouts, self.errors)
 
-    self._send("\xff\xff\xff\xffrcon %s clientkick %i" % (self.rcon_pwd, player_id))
+    return ("%i replies, %i timeouts, %i errors. Round trip: %.1f ms average, %.1f ms longest, 50%% %s, 95%% %s. %s" %
+            (self.count, self.timeouts, self.errors, ((self.total / self.count) * 1000), (self.longest * 1000),
+             self._bound(self.percentile(0.5)), self._bound(self.percentile(0.95)),
+             ", ".join(("%s %i" % (self._bound(bound), count))
+                       for (bound, count) in zip((self.BOUNDS + (None,)), self.buckets) if count)))
 
-class Features(object):
+  def _bound(self, bound):
 
-  """Feature (RTV/RTM) handler and container class."""
+    return "<%g ms" % (bound * 1000) if bound is not None else ">%g ms" % (self.BOUNDS[-1] * 1000)
 
-  def __init__(self, svsay):
+class Rcon(object):
 
-    self.rtv = self.rtm = False
-    self.times = [0, 0]
-    self.svsay = svsay
+  """Send commands to the server via rcon. Wrapper class. Commands are queued and sent in order by a background thread,
+  so the log loop never waits for the server."""
 
-  def Check(self):
+# Priority classes, higher classes are always sent first. Delivery policy of each class: maximum attempts and seconds
+# after being queued before giving up.
 
-    current_time = time()
+  CRITICAL, VOTING, INFO = xrange(3)
+  POLICIES = (
+              (10, 120), # Map/mode changes and kicks must get through.
+              (3, 30), # Voting countdowns and results.
+              (3, 10) # Replies and announcements are worthless once late (lifetime set by "Message expiry").
+             )
+  MAX_REPLY_TIMEOUT = 8
+  SVSAY_LENGTH = 141 # Longest message "svsay" accepts.
 
-    if not self.rtv and not self.rtm:
+  def __init__(self, address, bindaddr, rcon_pwd, rate=False, expiry=10):
 
-      if self.times[0] <= current_time and self.times[1] <= current_time:
+    self.address = address
+    self.bindaddr = bindaddr
+    self.rcon_pwd = rcon_pwd
+    self.rate = rate # Token bucket burst size and refill rate (commands per second). False means unlimited.
+    self.expiry = expiry # Seconds an informational message may wait before being dropped.
+    self.tokens = 0
+    self.refilled = 0
+    self.sock = None # Long-lived socket descriptor sending/receiving rcon commands to/from the server.
+    self.endpoint = None # Bind and server addresses the socket was created for.
+    self.queues = (deque(), deque(), deque()) # Payloads, buffer size, time queued, priority. One queue per class.
+                                              # The payloads of a command are sent back to back.
+    self.current = None # Command being sent.
+    self.counters = {"sent": 0, "retried": 0, "timed out": 0, "expired": 0, "failed": 0, "coalesced": 0}
+    self.waits = [0, 0, 0] # Commands, total and longest time waited before being sent.
+    self.metrics = defaultdict(Histogram) # Command (say, svsay, mbmode...) -> round trip times.
+    self.ready = Condition()
+    self.sender = Thread(target=self._sender)
+    self.sender.daemon = True
+    self.sender.start()
 
-        self._enable_all()
-        return 0
+  def _connect(self):
 
-      elif self.times[0] <= current_time:
+    """Return the connected socket, creating it again after an error or an address change (rehash)."""
 
-        self._enable_rtv()
-        return 0
+    if self.sock is None or self.endpoint != (self.bindaddr, self.address):
 
-      elif self.times[1] <= current_time:
+      self.close()
+      sock = socket(AF_INET, SOCK_DGRAM)
+      sock.bind((self.bindaddr, 0)) # Setting port as 0 will let the OS pick an available port for us.
+      sock.settimeout(1)
+      sock.connect(self.address)
+      self.sock = sock
+      self.endpoint = (self.bindaddr, self.address)
 
-        self._enable_rtm()
-        return 0
+    return self.sock
 
-    elif not self.rtv:
+  def close(self):
 
-      if self.times[0] <= current_time:
+    if self.sock is not None:
 
-        self._enable_rtv()
-        return 0
+      self.sock.close()
+      self.sock = None
 
-    elif not self.rtm and self.times[1] <= current_time:
+  def _throttle(self):
 
-      self._enable_rtm()
-      return 0
+    """Token bucket pacing every datagram so the engine's rcon flood protection doesn't drop any."""
 
-    return SLEEP_INTERVAL
+    if not self.rate:
 
-  def _enable_rtv(self):
+      return
 
-    self.rtv = True
-    self.svsay("^2[Status] ^7RTV is now enabled.")
-    print("CONSOLE: (%s) [Status] RTV is now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
+    burst, refill = self.rate
+    now = time()
+    self.tokens = min(burst, (self.tokens + ((now - self.refilled) * refill)))
+    self.refilled = now
 
-  def _enable_rtm(self):
+    if self.tokens < 1:
 
-    self.rtm = True
-    self.svsay("^2[Status] ^7RTM is now enabled.")
-    print("CONSOLE: (%s) [Status] RTM is now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
+      sleep(((1 - self.tokens) / refill))
+      self.tokens = 1
+      self.refilled = time()
 
-  def _enable_all(self):
+    self.tokens -= 1
 
-    self.rtv = self.rtm = True
-    self.svsay("^2[Status] ^7RTV and RTM are now enabled.")
-    print("CONSOLE: (%s) [Status] RTV and RTM are now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
+  def _send(self, payload, buffer_size=1024, attempts=3, deadline=None, queued=None): # This method shouldn't be used
+                                                                                      # outside the scope of this
+                                                                                      # object's wrappers.
+    """Send a command until the server replies, the attempts run out or the deadline passes. Return True on success."""
 
-def fix_line(line):
+    counters = self.counters
+    metrics = self.metrics[payload.split(" ", 3)[2]]
+    reply_timeout = 1
 
-  """Fix for the Client log line missing the \n (newline) character."""
+    try:
 
-  startswith = str.startswith
-  split = str.split
+      sock = self._connect()
 
-  while startswith(line[8:], "Client "):
+      while select((sock,), (), (), 0)[0]: # Discard late replies to previous commands.
 
-    line = split(line, ":", 3)
+        sock.recv(buffer_size)
 
-    if len(line) < 4: # If this bug is ever fixed within the MBII code,
-                      # make sure this fix is not processed.
-      return ""
+    except socketError: # Pending error (e.g. ICMP port unreachable) from a previous command, or no socket at all.
 
-    line[0] = int(line[0]) # Timestamp.
+      self.close() # Created again for the first attempt.
 
-    for i in xrange(-1, -7, -1):
+    for attempt in xrange(attempts):
 
-      substring = int(line[-2][i:])
+      self._throttle() # May sleep, so the deadline is checked afterwards.
+      wait = (reply_timeout * uniform(1, 1.25)) # Jitter keeps retries from lining up with server hitches.
 
-      if (substring - line[0]) >= 0 or line[-2][(i-1)] == " ":
+      if deadline is not None:
 
-        line = "%3i:%s" % (substring, line[-1])
-        break
+        left = (deadline - time())
 
-  return line
+        if left <= 0: # Never sent late (nor with a zero or negative socket timeout).
 
-def remove_color(item):
+          counters["timed out"] += 1
+          return False
 
-  """Remove Quake3 color codes from a str object."""
+        wait = min(wait, left)
 
-  replace = str.replace
+      if attempt:
 
-  for i in xrange(10):
+        counters["retried"] += 1
 
-    item = replace(item, "^%i" % (i), "")
+      elif queued is not None:
 
-  return item
+        waited = (time() - queued)
+        self.waits[0] += 1
+        self.waits[1] += waited
+        self.waits[2] = max(self.waits[2], waited)
 
-def switch_default(default_game, current_mode, current_map, mbmode):
+      try:
 
-  """Set default game whether player count drops to 0."""
+        sock = self._connect()
+        sock.settimeout(wait)
+        sent = time()
+        sock.send(payload)
+        sock.recv(buffer_size) # A late reply to a previous attempt of the same command is just as good.
+        metrics.add((time() - sent))
+        counters["sent"] += 1
+        return True
 
-  if len(default_game) == 2:
+      except socketTimeout:
 
-    if current_mode != default_game[0] or current_map != default_game[1].lower():
+        metrics.timeouts += 1
 
-      mbmode("%i %s" % (default_game[0], default_game[1]))
-      return True
+      except socketError: # Unreachable or refused (e.g. server restarting).
 
-  elif isinstance(default_game[0], int):
+        metrics.errors += 1
+        self.close() # Created again for the next attempt.
+        sleep(wait)
 
-    if current_mode != default_game[0]:
-   
-      mbmode(default_game[0])
-      return True
+      reply_timeout = min((reply_timeout * 2), self.MAX_REPLY_TIMEOUT) # Exponential backoff.
 
-  elif current_map != default_game[0].lower(): 
+    counters["failed"] += 1
+    return False
 
-    mbmode("%i %s" % (current_mode, default_game[0]))
-    return True
+  def _queue(self, payloads, buffer_size=1024, priority=INFO):
 
-  return False
+    with self.ready:
 
-def calculate_time(time1, time2):
+      queue = self.queues[priority]
 
-  """Calculate time difference in hours:minutes:seconds format."""
+      for waiting in iter(queue):
 
-  minutes, seconds = divmod(int((time2 - time1)), 60)
-  hours, minutes = divmod(minutes, 60)
+        if waiting[0] == payloads: # Same command already waiting to be sent.
 
-  if hours:
+          self.counters["coalesced"] += 1
+          return
 
-    time_type = "hour"
+      queue.append((payloads, buffer_size, time(), priority))
+      self.ready.notify_all()
 
-  elif minutes:
+  def _sender(self):
 
-    time_type = "minute"
+    critical, voting, info = queues = self.queues
+    counters = self.counters
+    wait = self.ready.wait
 
-  else:
+    while(True):
 
-    time_type = "second"
+      with self.ready:
 
-  return ("%02i:%02i:%02i %s%s" % (hours, minutes, seconds, time_type,
-                                   ("" if (hours + minutes + seconds) == 1 else "s")))
+        while not (critical or voting or info):
 
-def send_voting_message(voting_name, countdown, countdown_type, total_votes, total_players, votes_items, svsay):
+          wait()
 
-  """Send voting related messages (countdown and voting options)."""
+        for queue in queues: # Drain higher classes first.
 
-  svsay("^2[%s] ^7Type !number to vote. Voting will complete in ^2%i ^7%s%s (%i/%i)."
-        % (voting_name, countdown, countdown_type, ("" if countdown == 1 else "s"),
-           total_votes, total_players))
-  svsay("^2[Votes] ^7%s" % (", ".join(("%i(%i): %s" % (vote_id, vote_count, vote_display_value)
-                                       for (vote_id, (vote_count, priority, vote_value, vote_display_value))
-                                       in votes_items()))))
+          if queue:
 
-def main(argv):
+            payloads, buffer_size, queued, priority = self.current = queue.popleft()
+            break
 
-  global REPORT_UNHANDLED_EXCEPTION
+      attempts, lifetime = self.POLICIES[priority]
 
-  setcheckinterval(2147483647)
-  lower = str.lower
-  startswith = str.startswith
-  endswith = str.endswith
-  split = str.split
-  isdigit = str.isdigit
-  index = str.index
-  strip = str.strip
-  lstrip = str.lstrip
-  join = str.join
-  count = list.count
-  remove = list.remove
-  sort = list.sort
-  clear = dict.clear
-  bind = socket.bind
-  settimeout = socket.settimeout
-  connect = socket.connect
-  shutdown = socket.shutdown
-  close = socket.close
-  timenow = datetime.now
-  strftime = datetime.strftime
+      if priority == self.INFO:
 
-  if endswith(lower(argv[0]), ".exe"):
+        lifetime = self.expiry
 
-    argv[:] = argv[1:]
-    filecode = 0x01
+      deadline = (queued + lifetime)
 
-  else:
+      if time() >= deadline: # Waited too long behind higher classes.
 
-    filecode = 0x00
+        counters["expired"] += 1
 
-# Initialize RTV/RTM.
+      else:
 
-  print("*****************************************************")
-  print("*%s*" % ("Movie Battles II RTV/RTM %s" % (VERSION)).center(51))
-  print("*****************************************************\n")
-  parser = OptionParser(usage="Usage: %s [--noupdate --quit] [-c <configuration file> -t <tries>]" % (argv[0]))
-  parser.add_option("-c", dest="config_path",
-                    help="Set the path of the configuration file. Default: rtvrtm.cfg", metavar="<configuration file>",
-                    default=join_path(dirname(normpath(argv[0])), "rtvrtm.cfg"))
-  parser.add_option("-t", type="int", dest="tries",
-                    help="Set the amount of server connection tries before giving up (0 = infinite). Default: 5",
-                    metavar="<0-100>", default=5)
-  parser_updater = OptionGroup(parser, "Built-in Updater Options")
-  parser_updater.add_option("--noupdate", action="store_true", dest="noupdate",
-                            help="Skip the update check.", default=False)
-  parser_updater.add_option("--quit", action="store_true", dest="quit",
-                            help="Quit after checking for updates. This option will have no effect if --noupdate is set.",
-                            default=False)
-  parser_bugreport = OptionGroup(parser, "Bug Report Options")
-  parser_bugreport.add_option("--noreport", action="store_false", dest="report",
-                              help="Do not send bug reports.", default=True)  
-  parser.add_option_group(parser_updater)
-  parser.add_option_group(parser_bugreport)
-  opts, args = parser.parse_args()
-  REPORT_UNHANDLED_EXCEPTION = opts.report
+        for payload in iter(payloads):
 
-  if args:
+          try:
 
-    parser.error("Too many arguments or invalid arguments.")
+            sent = self._send(payload, buffer_size, attempts, deadline, queued)
 
-  config_path = strip(opts.config_path)
+          except Exception, err: # Whatever goes wrong, the commands queued after this one still get sent.
 
-  try:
+            counters["failed"] += 1
+            self.close()
+            print("CONSOLE: (%s) [Rcon] Error while sending command to the server (%s): %s" %
+                  (datetime.now().strftime("%d/%m/%Y %H:%M:%S"), err, payload.split(" ", 2)[2]))
+            break
 
-    while config_path[-1] in (" ", "\\", "/"):
+          if not sent:
 
-      config_path = config_path[:-1]
+            if priority == self.CRITICAL:
 
-    config_path = normpath(config_path)
+              print("CONSOLE: (%s) [Rcon] Could not deliver command to the server: %s" %
+                    (datetime.now().strftime("%d/%m/%Y %H:%M:%S"), payload.split(" ", 2)[2])) # Without the password.
 
-  except IndexError:
+            break # The rest of the batch makes no sense without this part.
 
-    parser.error("Invalid configuration path.")
+          queued = None # Only the first part waited in the queue.
 
-  if opts.tries < 0 or opts.tries > 100:
+      with self.ready:
 
-    parser.error("The amount of server connection tries must range from 0 to 100.")
+        self.current = None
+        self.ready.notify_all() # Wake up flush().
 
-  if not opts.noupdate: # Skip update check?
+  def pending(self):
 
-    updater(normpath(argv[0]), filecode)
+    """Return the number of commands waiting to be sent and the age (in seconds) of the oldest one."""
 
-    if opts.quit:
+    with self.ready:
 
-      exit(0)
+      queued = [command[2] for queue in iter(self.queues) for command in iter(queue)]
 
-  config = Config(config_path)
-  config.create(opts.tries)
-  parser.destroy()
-  del (filecode, parser, parser_updater, parser_bugreport, opts, args, config_path)
-  print("[*] Creating data structures and setting parameters..."),
-  players = {}
-  nomination_order = []
-  add_nomination = nomination_order.append
-  remove_nomination = nomination_order.remove
-  voting_description = change_instructions = None
-  admin_choices = []
-  admin_choice = admin_choices.append
-  gamemodes = ("Open", "Semi Authentic", "Full Authentic", "Duel")
-  recently_played = defaultdict(int)
-  check_votes = voting_instructions = start_voting = start_second_turn = \
-  reset = recover = start_line = False
-  rcon = Rcon(config.address, config.bindaddr, config.rcon_pwd)
-  say = rcon.say
-  svsay = rcon.svsay if not config.use_say_only else say
-  mbmode = rcon.mbmode
-  clientkick = rcon.clientkick
-  status = Features(svsay)
+      if self.current is not None:
 
-  if not config.rtv:
+        queued.append(self.current[2])
 
-    status.times[0] = object()
+    return ((len(queued), (time() - min(queued))) if queued else (0, 0.0))
 
-  if not config.rtm:
+  def wait_times(self):
 
-    status.times[1] = object()
+    """Return the average and longest time (in seconds) commands waited before being sent since the last call."""
 
-  Check_Status = status.Check
-  print("Done!")
-  print("[*] Reading log file until EOF..."),
+    commands, total, longest = self.waits
+    self.waits = [0, 0, 0]
+    return (((total / commands) if commands else 0.0), longest)
 
-  with open(config.logfile, "rt+") as log:
+  def flush(self, timeout):
 
-    seek = log.seek
-    truncate  = log.truncate
-    flush = log.flush
-    fileno = log.fileno()
+    """Wait up to timeout seconds for the queued commands to be sent."""
 
-# Do a fast iteration over the log file to avoid needing to make getinfo calls
-# to get the current status.
+    deadline = (time() + timeout)
 
-    for line in log:
-      
-      if endswith(line, "\n"): # Check for valid line.
+    with self.ready:
 
-        line = fix_line(line)
+      while (self.current is not None or any(self.queues)) and time() < deadline:
 
-        if line == "  0:00 ------------------------------------------------------------\n": # Server restart.
+        self.ready.wait((deadline - time()))
 
-          players = {}
-          cvars = None
-          start_line = True
+  def say(self, msg, priority=INFO):
+      
+    self._queue(("\xff\xff\xff\xffrcon %s say %s" % (self.rcon_pwd, msg),),
+                2048, priority)
 
-        else:
+  def svsay(self, msg, priority=INFO):
 
-          line = line[7:-1]
+    parts = split_message(msg, self.SVSAY_LENGTH) if len(msg) > self.SVSAY_LENGTH else (msg,)
 
-          if startswith(line, "ClientConnect: "):
+    if parts is None: # Message is too big for "svsay" and can't be split.
+                      # Use "say" instead.
+      self.say(msg, priority)
 
-            players[int(line[15:17])] = [0, False, False, None, None] # Timer, RTV, RTM, Nomination, Vote Option.
+    else: # Long messages (e.g. votes) are sent as several "svsay" commands in one paced batch.
 
-          elif startswith(line, "ClientDisconnect: "):
+      self._queue(tuple(("\xff\xff\xff\xffrcon %s svsay %s" % (self.rcon_pwd, part)) for part in iter(parts)),
+                  priority=priority)
 
-            try:
+  def mbmode(self, cmd):
 
-              del players[int(line[18:])]
+    self._queue(("\xff\xff\xff\xffrcon %s mbmode %s" % (self.rcon_pwd, cmd),), priority=self.CRITICAL)
 
-            except KeyError:
+  def clientkick(self, player_id):
 
-              pass
+    self._queue(("\xff\xff\xff\xffrcon %s clientkick %i" % (self.rcon_pwd, player_id),), priority=self.CRITICAL)
 
-          elif startswith(line, "InitGame: "):
+class ServerQuery(object):
 
-            cvars = line
+  """Query the server's connectionless getstatus/getinfo endpoints for its authoritative state. Replies are cached for
+  ttl seconds."""
 
-    if not start_line:
+  def __init__(self, address, bindaddr, ttl=5, timeout=0.5):
 
-      error("Server start line was not detected. Please restart your server and turn RTV/RTM on.")
+    self.address = address
+    self.bindaddr = bindaddr
+    self.ttl = ttl
+    self.timeout = timeout # Seconds to wait for a reply. Queries are made from the log loop, so keep it short.
+    self.cache = {} # Command -> time received, parsed reply.
 
-    elif not cvars:
+  def _request(self, command, response):
 
-      error("Lastest cvars values were not retrieved. Please try restarting RTV/RTM.")
+    """Send a connectionless command. Return the reply lines after the response header, or None without a valid
+    reply."""
 
-    del start_line
-    cvars = split(cvars[11:], "\\")
-    cvars = dict((lower(cvars[i]), cvars[i+1]) for i in xrange(0, len(cvars), 2)) # Create cvar dictionary through the dict constructor.
+    sock = socket(AF_INET, SOCK_DGRAM)
 
     try:
 
-      current_mode = int(cvars["g_authenticity"])
+      sock.bind((self.bindaddr, 0)) # Setting port as 0 will let the OS pick an available port for us.
+      sock.settimeout(self.timeout)
+      sock.connect(self.address)
+      sock.send("\xff\xff\xff\xff%s\n" % (command))
+      reply = sock.recv(16384)
 
-      if current_mode not in (0, 1, 2, 3):
+    except socketError: # Timed out, unreachable or refused.
 
-        raise ValueError
+      return None
 
-    except KeyError:
+    finally:
 
-      error("No current game mode detected.")
+      sock.close()
 
-    except ValueError:
+    header = "\xff\xff\xff\xff%s\n" % (response)
+    return reply[len(header):].split("\n") if reply.startswith(header) else None
 
-      error("Invalid value for game mode.")
+  def _cached(self, command, parse):
 
     try:
 
-      current_map = cvars["mapname"]
+      received, result = self.cache[command]
 
-    except KeyError:
+      if (time() - received) < self.ttl:
 
-      error("No current map detected.")
+        return result
 
-    print("Done!")
+    except KeyError:
 
-    try:
-    
-      print("[Server Status] Map: %s | Mode: %s | Players: %i/%i\n"
-            % (current_map, gamemodes[current_mode], len(players), int(cvars["sv_maxclients"])))
+      pass
 
-    except (KeyError, ValueError):
+    result = parse()
 
-      print("[Server Status] Map: %s | Mode: %s | Players: %i\n"
-            % (current_map, gamemodes[current_mode], len(players)))
-    
-    current_map = lower(current_map)
-    current_time = time()
-    gameinfo = { # Time of detection, extensions.
-                "mode": [current_time, 0],
-                "map": [current_time, 0]
-               }
-    players_values = players.itervalues
-    players_items = players.iteritems
+    if result is not None:
 
-# Initial RTV/RTM calculation.
+      self.cache[command] = (time(), result)
 
-    rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
-                                                                 int(round(((rate * len(players)) / 100.0)))
-                                                                 for rate in (config.rtv_rate, config.rtm_rate))]
+    return result
 
-    if not players and config.default_game:
-    
-      reset = switch_default(config.default_game, current_mode, current_map, mbmode)
+  def _status(self):
 
-    while(True): # Infinite loop and parsing from here.
-                 # Ctrl+C or kill to close the process.
-      line = None
-      seek(0, 1) # Seek relative to the pointer's current position.
-                 # Intended to re-create the generator for the file descriptor.
-      for line in log:
+    lines = self._request("getstatus", "statusResponse")
 
-        if endswith(line, "\n"): # Check for valid line.
+    if not lines:
 
-          line = fix_line(line)
+      return None
 
-          if line == "  0:00 ------------------------------------------------------------\n": # Server restart.
+    server_players = []
 
-            print("CONSOLE: (%s) Server restart detected!" % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-            clear(players)
-            nomination_order[:] = []
-            current_map = current_mode = voting_description = change_instructions = None
-            admin_choices[:] = []
-            gameinfo["mode"][1] = gameinfo["map"][1] = 0
-            recently_played = defaultdict(int)
-            status.rtv = status.rtm = voting_instructions = start_voting = \
-            start_second_turn = recover = False
-            reset = True
+    for line in iter(lines[1:]): # score ping "name"
 
-            if config.rtv:
-            
-              status.times[0] = 0
+      if not line: # Trailing newline.
 
-            if config.rtm:
+        continue
 
-              status.times[1] = 0
+      line = line.split(" ", 2)
 
-# Open a new socket descriptor to reset the cvar and
-# confirm server status.
+      try:
 
-            while(True):
+        if len(line) != 3 or len(line[2]) < 2 or line[2][0] != '"' or line[2][-1] != '"':
 
-              sock = socket(AF_INET, SOCK_DGRAM)
-              bind(sock, (config.bindaddr, 0))
-              settimeout(sock, 3)
-              connect(sock, config.address)
-              sock.send("\xff\xff\xff\xffrcon %s sets RTVRTM %i/%s" % (config.rcon_pwd, config.cvar, VERSION))
+          raise ValueError
 
-              try:
+        server_players.append((int(line[0]), int(line[1]), line[2][1:-1]))
 
-                sock.recv(1024)
-                break
+      except ValueError: # Malformed or truncated reply. A partial player list would make players look gone.
 
-              except socketTimeout:
+        return None
 
-                continue
+    return (lines[0], parse_infostring(lines[0]), server_players)
 
-              except socketError:
+  def _info(self):
 
-                sleep(3)
+    lines = self._request("getinfo", "infoResponse")
+    return parse_infostring(lines[0]) if lines else None
 
-              finally:
+  def status(self):
 
-                shutdown(sock, SHUT_RDWR)
-                close(sock)
+    """Return the server info string (the cvars of the InitGame line), its dictionary and the players as (score, ping,
+    name) tuples. None when the server doesn't reply."""
 
-          else:
+    return self._cached("getstatus", self._status)
 
-            Check_Status() # Check for the status of each feature (RTV/RTM).
-            line = line[7:-1]
+  def info(self):
 
-            if startswith(line, "ClientConnect: "):
+    """Return the getinfo dictionary (hostname, mapname, clients, sv_maxclients...). None when the server doesn't
+    reply."""
 
-              player_id = int(line[15:17])
+    return self._cached("getinfo", self._info)
 
-              if player_id not in players:
+class Features(object):
 
-                players[player_id] = [0, False, False, None, None] # Timer, RTV, RTM, Nomination, Vote Option.
-                rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
-                                                                             int(round(((rate * len(players)) / 100.0)))
-                                                                             for rate in (config.rtv_rate, config.rtm_rate))]
+  """Feature (RTV/RTM) handler and container class."""
 
-            elif startswith(line, "ClientDisconnect: "):
+  def __init__(self, svsay):
 
-              player_id = int(line[18:])
+    self.rtv = self.rtm = False
+    self.times = [0, 0]
+    self.svsay = svsay
 
-              try:
+  def Check(self):
 
-                if players[player_id][4]:
+    """Enable RTV/RTM once their wait time is over. Returns 0 when a feature was just enabled, otherwise the seconds
+    left until the next one is, or None when nothing is scheduled (wait_log() then waits without a time limit)."""
 
-                  votes[players[player_id][4]][0] -= 1 # Remove -1 from the player's voted option.
+    current_time = time()
 
-                if player_id in nomination_order:
+    if not self.rtv and not self.rtm:
 
-                  remove_nomination(player_id)
+      if self.times[0] <= current_time and self.times[1] <= current_time:
 
-                del players[player_id]
-                rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
-                                                                             int(round(((rate * len(players)) / 100.0)))
-                                                                             for rate in (config.rtv_rate, config.rtm_rate))]
+        self._enable_all()
+        return 0
 
-                if not players:
+      elif self.times[0] <= current_time:
 
-                  voting_description = None
-                  admin_choices[:] = []
+        self._enable_rtv()
+        return 0
 
-                  if start_voting: # Cancel a running voting or map/mode change
-                                   # when player count drops to 0.
-                    status.rtv = status.rtm = voting_instructions = start_voting = start_second_turn = False
-                    change_instructions = None
+      elif self.times[1] <= current_time:
 
-                    if config.default_game:
+        self._enable_rtm()
+        return 0
 
-                      reset = switch_default(config.default_game, current_mode, current_map, mbmode)
+    elif not self.rtv:
 
-                  elif config.default_game:
+      if self.times[0] <= current_time:
 
-                    switch_default(config.default_game, current_mode, current_map, mbmode)
+        self._enable_rtv()
+        return 0
 
-                elif not start_voting:
+    elif not self.rtm and self.times[1] <= current_time:
 
-                  check_votes = True
+      self._enable_rtm()
+      return 0
 
-              except KeyError:
+    # Time left until the next feature is enabled (None when nothing is scheduled).
+    timeouts = [(feature_time - current_time) for (enabled, feature_time) in ((self.rtv, self.times[0]),
+                                                                               (self.rtm, self.times[1]))
+                if not enabled and isinstance(feature_time, (int, float))]
+    return min(timeouts) if timeouts else None
 
-                pass
+  def _enable_rtv(self):
 
-            elif startswith(line, "InitGame: "):
+    self.rtv = True
+    self.svsay("^2[Status] ^7RTV is now enabled.")
+    print("CONSOLE: (%s) [Status] RTV is now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
 
-              cvars = split(lower(line[11:]), "\\")
-              cvars = dict(cvars[i:i+2] for i in xrange(0, len(cvars), 2)) # Create cvar dictionary through the dict constructor.
-              cvars["g_authenticity"] = int(cvars["g_authenticity"])
+  def _enable_rtm(self):
 
-              if current_mode != cvars["g_authenticity"] or current_map != cvars["mapname"]:
+    self.rtm = True
+    self.svsay("^2[Status] ^7RTM is now enabled.")
+    print("CONSOLE: (%s) [Status] RTM is now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
 
-                players = dict((player_id, [timer, False, False, None, None])
-                               for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                               in players_items()) # Reset players options with the exception of their timer.
-                players_values = players.itervalues
-                players_items = players.iteritems
-                nomination_order[:] = []
-                voting_description = change_instructions = None
-                admin_choices[:] = []
-                gameinfo["mode"][1] = gameinfo["map"][1] = 0
+  def _enable_all(self):
 
-                if not reset:
-                 
-                  status.rtv = status.rtm = False
+    self.rtv = self.rtm = True
+    self.svsay("^2[Status] ^7RTV and RTM are now enabled.")
+    print("CONSOLE: (%s) [Status] RTV and RTM are now enabled." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
 
-                else:
+class LogTailer(object):
 
-                  reset = False
-                    
-                voting_instructions = start_voting = start_second_turn = recover = False
-                current_time = time()
+  """Wait for the log file to change through inotify (Linux only) or fall back to polling."""
 
-                if current_mode != cvars["g_authenticity"]:
+  IN_MODIFY = 0x00000002
+  IN_MOVE_SELF = 0x00000800
+  IN_DELETE_SELF = 0x00000400
 
-                  gameinfo["mode"][0] = current_time
-                  current_mode = cvars["g_authenticity"]
+  def __init__(self, logfile, poll=False, max_wait=None):
 
-                if current_map != cvars["mapname"]:
-                
-                  recently_played[current_map] = (current_time + config.enable_recently_played)
-                  gameinfo["map"][0] = current_time
-                  current_map = cvars["mapname"]
+    self.logfile = logfile
+    self.max_wait = max_wait # Upper bound for a single wait (periodic tasks).
+    self.fd = None # inotify file descriptor. None means polling.
+    self.wd = None # inotify watch descriptor of the log file.
 
-              elif start_voting:
+    if not poll and platform.startswith("linux"):
 
-                if not change_instructions:
+      try:
 
-                  if voting_method: # Round-based voting.
+        self.libc = CDLL(find_library("c"), use_errno=True)
+        fd = self.libc.inotify_init()
 
-                    if start_second_turn: # Start a second turn voting.
+        if fd < 0:
 
-                      start_second_turn = skip_voting = False
-                      voting_countdown = _voting_countdown
-                      svsay("^2[%s] ^7Second turn voting for the next %s has begun. Type !number to vote. Voting will complete in ^2%i ^7round%s."
-                            % (voting_name, voting_type, voting_countdown,
-                               ("" if voting_countdown == 1 else "s")))
-                      voting_countdown -= 1
-                      svsay("^2[Votes] ^71: %s, 2: %s" % (votes[1][3], votes[2][3]))
-                      voting_time = object()
+          raise OSError(get_errno(), "inotify_init")
 
-                    elif not voting_instructions:
+        self.fd = fd
 
-                      if voting_countdown:
+        if not self.watch():
 
-                        if voting_type == "admin":
+          raise OSError(get_errno(), "inotify_add_watch")
 
-                          svsay("^2[Description] ^7%s" % (voting_description))
+      except (OSError, AttributeError): # No inotify support (old kernel/libc). Use polling instead.
 
-                        send_voting_message(voting_name, voting_countdown, "round",
-                                            sum((vote_count for (vote_count, priority, vote_value, vote_display_value) in votes_values())),
-                                            len(players), votes_items, svsay)
-                        voting_countdown -= 1
+        self.close()
 
-                      else:
+  def watch(self):
 
-                        voting_time = 0
+    """(Re)watch the log file path, e.g. after it was replaced by log rotation. Return False on failure."""
 
-                elif change_instructions is not True: # Next round map/mode change.
+    if self.fd is None:
 
-                  mbmode(("%i %s" % (current_mode, change_instructions[0]) if voting_type == "map" else
-                          change_instructions[0]))
-                  wait_time = (time() + change_instructions[2])
-                  
-                  if wait_time > status.times[change_instructions[1]]:
+      return True
 
-                    status.times[change_instructions[1]] = wait_time
-                    
-                  change_instructions = recover = True
+    if self.wd is not None: # The old file is gone or no longer written by the server.
 
-            elif startswith(line, "ClientUserinfoChanged: "):
+      self.libc.inotify_rm_watch(self.fd, self.wd)
 
-              if config.name_protection: # Kick players using restricted nicknames.
+    self.wd = self.libc.inotify_add_watch(self.fd, self.logfile,
+                                          (self.IN_MODIFY | self.IN_MOVE_SELF | self.IN_DELETE_SELF))
 
-                line = line[23:]
-                player_id = int(line[:2])
+    if self.wd < 0:
 
-                try:
+      self.wd = None
+      return False
 
-                  player_name = index(line, " n\\")
+    return True
 
-                except ValueError:
+  def wait(self, timeout=None):
 
-                  try:
+    """Block until the log file is modified or the timeout (in seconds) expires."""
 
-                    player_name = index(line, "\\n\\")
+    if self.max_wait and (timeout is None or timeout > self.max_wait):
 
-                  except ValueError:
+      timeout = self.max_wait
 
-                    continue
+    if self.fd is not None and self.wd is None and not self.watch(): # Log file is missing (rotation in progress).
+                                                                     # Check again for its new copy soon.
+      timeout = 1 if timeout is None or timeout > 1 else timeout
 
-                player_name = line[(player_name + 3):]
-                player_name = player_name[:index(player_name, "\\")]
+    if self.fd is None: # Polling "wait" time.
+                        # Prevents overloading CPU with I/O polling.
+      sleep(SLEEP_INTERVAL if timeout is None or timeout > SLEEP_INTERVAL else max(timeout, 0))
 
-                if lower(strip(remove_color(player_name))) in ("admin", "server"):
+    elif timeout is None or timeout > 0:
 
-                  say("^3Restricted nickname in use. Kicking player %i (^7%s^3)..."
-                      % (player_id, player_name))
-                  clientkick(player_id)
+      try:
 
-            elif startswith(line, "say: Admin: ") or startswith(line, "say: Server: "): # Admin commands (/smod say).
+        if select((self.fd,), (), (), timeout)[0]:
 
-              if not recover:
+          read_fd(self.fd, 65536) # Drain pending events. Leftovers just cause an early wake up.
 
-		if startswith(line, "say: Admin: "):
-                	original_admin_cmd = strip(remove_color(line[12:]))
-		elif startswith(line, "say: Server: "):
-			original_admin_cmd = strip(remove_color(line[13:]))
-                admin_cmd = lower(original_admin_cmd)
+      except selectError: # Interrupted system call.
 
-                if admin_cmd == "!rehash": # Rehash configuration.
+        pass
 
-                  svsay("^2[Status] ^7Rehashing configuration...")
-                  print("CONSOLE: (%s) [Status] Rehashing configuration..." %
-                        (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                  sleep(1)
-                  
-                  if config.rehash():
+  def close(self):
 
-                    rcon.address = config.address
-                    rcon.bindaddr =  config.bindaddr
-                    rcon.rcon_pwd = config.rcon_pwd
+    if self.fd is not None:
 
-                    if not config.use_say_only:
+      close_fd(self.fd)
+      self.fd = self.wd = None
 
-                      svsay = status.svsay = rcon.svsay
+ZIP_END = Struct("<4s4H2LH") # End of central directory record.
+ZIP_END_SIZE = ZIP_END.size
+ZIP_FILE = Struct("<4s6H3L5H2L") # Central directory file header.
+ZIP_FILE_SIZE = ZIP_FILE.size
 
-                    else:
+def iter_bsps(pk3):
 
-                      svsay = status.svsay = say
-                    
-                    svsay("^2[Status] ^7Rehash successful!")
+  """Yield the names of the BSP maps inside an open pk3 file. Only the central directory is read, straight from its
+  headers, so no ZipInfo object is built for the thousands of textures and sounds of an MBII archive."""
 
-                  else:
+  pk3.seek(0, 2)
+  size = pk3.tell()
+  tail_size = min(size, (ZIP_END_SIZE + 65535)) # The record is followed by a comment of up to 64 KB.
+  pk3.seek((size - tail_size))
+  tail = pk3.read(tail_size)
+  end = tail.rfind("PK\x05\x06")
 
-                    svsay("^2[Status] ^7Rehash failed!")
-                  
-                  print("[*] Resetting parameters..."),
-                  players = dict((player_id, [0, False, False, None, None])
-                                 for player_id in iter(players)) # Reset players data.
-                  players_values = players.itervalues
-                  players_items = players.iteritems
-                  nomination_order[:] = []
-                  voting_description = change_instructions = None
-                  admin_choices[:] = []
-                  gameinfo["mode"][1] = gameinfo["map"][1] = 0
-                  recently_played = defaultdict(int)
-                  status.rtv = status.rtm = voting_instructions = start_voting = start_second_turn = False
-                  status.times[0] = 0 if config.rtv else object()
-                  status.times[1] = 0 if config.rtm else object()
-                  rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
-                                                                               int(round(((rate * len(players)) / 100.0)))
-                                                                               for rate in (config.rtv_rate, config.rtm_rate))]
-                  recover = True
-                  print("Done!\n")
+  while end != -1 and (end + ZIP_END_SIZE) > tail_size: # Signature inside the comment.
 
-                elif not start_voting:
+    end = tail.rfind("PK\x05\x06", 0, end)
 
-                  if admin_cmd == "!erase": # Erase the Admin voting options pool.
+  if end == -1:
 
-                    admin_choices[:] = []
-                    svsay("^2[Admin] ^7Admin voting options were erased.")
+    raise BadZipfile("File is not a zip file")
 
-                  elif startswith(admin_cmd, "!description "): # Set the admin's voting description.
+  signature, disk, start_disk, disk_entries, entries, directory_size, directory_offset, \
+  comment_size = ZIP_END.unpack_from(tail, end)
 
-                    if voting_description:
+  if entries == 0xFFFF or directory_offset == 0xFFFFFFFF: # Zip64, which no pk3 needs.
 
-                      svsay("^2[Admin] ^7Admin voting description changed!")
+    for bsp in (bsp for bsp in iter(ZipFile(pk3).namelist()) if bsp[-4:].lower() == ".bsp"):
 
-                    else:
-                      
-                      svsay("^2[Admin] ^7Admin voting description added!")
+      yield basename(bsp)[:-4]
 
-                    voting_description = lstrip(original_admin_cmd[13:])
+    return
 
-                  elif startswith(admin_cmd, "!vote "): # Add a voting option to the Admin voting options pool.
+  directory_start = (size - tail_size + end - directory_size) # Data prepended to the archive shifts the offsets.
 
-                    if len(admin_choices) < 10: # A total maximum of 10 voting options.
+  if directory_start < 0:
 
-                      voting_choice = lstrip(original_admin_cmd[6:])
+    raise BadZipfile("Bad central directory offset")
 
-                      if lower(voting_choice) in (lower(voting_option) for voting_option in iter(admin_choices)):
+  pk3.seek(directory_start)
+  directory = pk3.read(directory_size)
+  unpack_from = ZIP_FILE.unpack_from
+  lower = str.lower
+  rfind = directory.rfind
+  offset = 0
 
-                        say("^2[Admin] ^7%s is already present within the admin voting options." % (voting_choice))
+  for i in xrange(entries):
 
-                      else:
+    if (offset + ZIP_FILE_SIZE) > directory_size:
 
-                        admin_choice(voting_choice)
-                        svsay("^2[Admin] ^7%s was added as an admin voting option." % (voting_choice))
+      raise BadZipfile("Truncated central directory")
 
-                    else:
+    header = unpack_from(directory, offset)
 
-                      say("^2[Admin] ^7Admin voting is full.")
+    if header[0] != "PK\x01\x02":
 
-                  else:
+      raise BadZipfile("Bad magic number for central directory")
 
-                    admin_cmd = split(admin_cmd)
+    name_start = (offset + ZIP_FILE_SIZE)
+    name_end = (name_start + header[10])
 
-                    if len(admin_cmd) == 2:
+    if header[10] >= 4 and lower(directory[(name_end - 4):name_end]) == ".bsp": # Only map names get sliced out.
 
-                      if admin_cmd[0] == "!enable": # Enable RTV/RTM/Recently played maps immediately.
+      yield directory[(max(rfind("/", name_start, name_end), (name_start - 1)) + 1):(name_end - 4)]
 
-                        if admin_cmd[1] == "maps":
+    offset = (name_end + header[11] + header[12]) # Skip the extra field and the comment.
 
-                          recently_played = defaultdict(int)
+def fs_path_key(name):
 
-                        elif admin_cmd[1] == "rtv":
+  """Sort key matching the engine's FS_PathCmp, which orders pk3 files by their uppercase names with backslashes and
+  colons read as slashes. Lowercasing instead misorders names with "_", "[", "\\", "]", "^" or "`" next to a
+  letter: the engine loads mb2a.pk3 before mb2_x.pk3."""
 
-                          if config.rtv:
+  return str.upper(name).replace("\\", "/").replace(":", "/")
 
-                            status.times[0] = 0
+def read_bsps(path):
 
-                        elif admin_cmd[1] == "rtm" and config.rtm:
+  """Return the names of the BSP maps inside a pk3 file."""
 
-                          status.times[1] = 0
+  with open(path, "rb") as pk3:
 
-                      elif admin_cmd[0] == "!force": # Force a RTV/RTM/Admin voting immediately.
+    return tuple(iter_bsps(pk3))
 
-                        if admin_cmd[1] == "rtv":
+def inspect_pk3(path):
 
-                          if config.rtv:
+  """Return the BSP names inside a pk3 file and None, or None and a warning when it can't be read. Runs in the scan
+  workers, so nothing is raised."""
 
-                            players = dict((player_id, [timer, True, rtm_vote, nomination, None])
-                                           for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                           in players_items()) # Force RTV for all connected players.
-                            players_values = players.itervalues
-                            players_items = players.iteritems
-                            check_votes = True
+  try:
 
-                        elif admin_cmd[1] == "rtm":
+    return (read_bsps(path), None)
 
-                          if config.rtm:
+  except (IOError, OSError), err:
 
-                            players = dict((player_id, [timer, rtv_vote, True, nomination, None])
-                                           for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                           in players_items()) # Force RTM for all connected players.
-                            players_values = players.itervalues
-                            players_items = players.iteritems
-                            check_votes = True
+    return (None, "Error while trying to read %s (ERRNO: %s)." % (basename(path), err.errno))
 
-                        elif admin_cmd[1] == "admin":
+  except BadZipfile:
 
-                          if not voting_description:
+    return (None, "%s is not a valid pk3 file." % (basename(path)))
 
-                            svsay("^2[Admin] ^7Admin voting failed to start! No voting description is set.")
-                            print("CONSOLE: (%s) [Admin] Admin voting failed to start! No voting description is set."
-                                  % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+  except Exception, err: # Anything else zipfile may choke on.
 
-                          elif not admin_choices:
+    return (None, "Error while trying to read %s (%s)." % (basename(path), err))
 
-                            svsay("^2[Admin] ^7Admin voting failed to start! No voting options were added.")
-                            print("CONSOLE: (%s) [Admin] Admin voting failed to start! No voting options were added."
-                                  % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+class BSPIndex(object):
 
-                          elif len(admin_choices) < 2:
+  """Persistent index of the BSP maps inside each pk3 file, keyed by path, size and modification time, so only new or
+  changed archives are opened when the MBII folder is scanned. Those can be read by a pool of worker processes, which
+  is only safe to fork while no other thread is running."""
 
-                            svsay("^2[Admin] ^7Admin voting failed to start! Two or more voting options are required.")
-                            print("CONSOLE: (%s) [Admin] Admin voting failed to start! Two or more voting options are required."
-                                  % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+  def __init__(self, path, workers=1):
 
-                          else:
+    self.path = path
+    self.workers = workers # Worker processes reading pk3 files (1 = read them in this process).
+    self.hits = self.misses = 0 # Archives found in the index and archives read during the last scan.
+    self.changed = False
 
-                            votes = SortableDict(((i+1), [0, None, None, admin_choices[i]])
-                                                 for i in xrange(len(admin_choices)))
-                            votes_values = votes.itervalues
-                            votes_items = votes.sorteditems
-                            voting_name = "Admin"
-                            voting_type = "admin"
-                            voting_method, voting_countdown = config.admin_voting
-                            voting_minimum_votes = config.admin_minimum_votes
-                            voting_skip_voting = config.admin_skip_voting
-                            voting_second_turn = None
-                            status.rtv = status.rtm = voting_instructions = start_voting = True
+    try:
 
-                    elif len(admin_cmd) == 3 and admin_cmd[0] == "!disable" and isdigit(admin_cmd[2]): # Disable RTV/RTM.
+      with open(path, "rb") as index:
 
-                      if admin_cmd[1] == "rtv":
+        self.entries = load_pickle(index) # Path -> (size, modification time), BSP names.
 
-                        if config.rtv:
+      if not isinstance(self.entries, dict):
 
-                          svsay("^2[RTV] ^7Rock the vote was forcefully disabled!")
-                          print("CONSOLE: (%s) [RTV] Rock the vote was forcefully disabled!" %
-                                (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                          disable_time = int(admin_cmd[2])
-                          status.rtv = False
-                          status.times[0] = (time() + disable_time) if disable_time else object()
-                          players = dict((player_id, [timer, False, rtm_vote, nomination, None])
-                                         for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                         in players_items()) # Reset RTV votes.
-                          players_values = players.itervalues
-                          players_items = players.iteritems
+        raise ValueError
 
-                      elif admin_cmd[1] == "rtm" and config.rtm:
+    except Exception: # Missing, unreadable or corrupt index.
 
-                        svsay("^2[RTM] ^7Rock the mode was forcefully disabled!")
-                        print("CONSOLE: (%s) [RTM] Rock the mode was forcefully disabled!" %
-                              (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                        disable_time = int(admin_cmd[2])
-                        status.rtm = False
-                        status.times[1] = (time() + disable_time) if disable_time else object()
-                        players = dict((player_id, [timer, rtv_vote, False, nomination, None])
-                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                       in players_items()) # Reset RTM votes.
-                        players_values = players.itervalues
-                        players_items = players.iteritems
+      self.entries = {}
 
-                elif admin_cmd == "!cancel":
+  def _read(self, paths):
 
-                  if not change_instructions: # Cancel current voting.
+    """Return inspect_pk3() of every path, in order."""
 
-                    if not voting_instructions and not start_second_turn:
+    if self.workers > 1 and len(paths) > 1:
 
-                      svsay("^2[Voting] ^7The %s voting was canceled!" % (voting_type))
-                      print("CONSOLE: (%s) [Voting] The %s voting was canceled!" %
-                            (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_type))
-                      players = dict((player_id, [timer, False, False, None, None])
-                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                     in players_items()) # Reset players options with the exception of their timer.
-                      players_values = players.itervalues
-                      players_items = players.iteritems
-                      nomination_order[:] = []
-                      voting_description = None
-                      admin_choices[:] = []
-                      status.rtv = status.rtm = start_voting = False
-                      recover = True
-                      del votes
-
-                  elif change_instructions is not True: # Cancel next map/mode change.
-
-                    svsay("^2[Nextgame] ^7The next %s (%s) was canceled!" %
-                          (voting_type,
-                           (change_instructions[0] if voting_type == "map" else
-                            gamemodes[change_instructions[0]])))
-                    print("CONSOLE: (%s) [Nextgame] The next %s (%s) was canceled!" %
-                          (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_type,
-                           (change_instructions[0] if voting_type == "map" else
-                            gamemodes[change_instructions[0]])))
-                           
-                    change_instructions = None
-                    status.rtv = status.rtm = start_voting = False
-                    recover = True
+      try:
 
-                elif admin_cmd == "!nextgame" and change_instructions > True: # Force a queued map/mode change
-                                                                              # before the next round.
-                  mbmode(("%i %s" % (current_mode, change_instructions[0]) if voting_type == "map" else
-                          change_instructions[0]))
-                  wait_time = (time() + change_instructions[2])
+        pool = Pool(min(self.workers, len(paths)))
 
-                  if wait_time > status.times[change_instructions[1]]:
-                            
-                    status.times[change_instructions[1]] = wait_time
+      except (OSError, ImportError): # No semaphores or processes available. Read them here instead.
 
-                  change_instructions = recover = True
+        pool = None
 
-            elif not start_voting:
+      if pool is not None:
 
-              if line == "Exit: Kill limit hit.":
+        try:
 
-                if config.roundlimit and players: # Initiate an automatic Roundlimit voting.
+          return pool.map(inspect_pk3, paths)
 
-                  nominated_maps = [nomination
-                                    for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                    in players_values() if nomination]
+        finally:
 
-                  if config.nomination_type:
+          pool.close()
+          pool.join()
 
-                    map_duplicates = defaultdict(bool)
-                    voting_maps = [(count(nominated_maps, players[player_id][3]),
-                                    (config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                    players[player_id][3])
-                                   for player_id in iter(nomination_order)
-                                   if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
-                                       not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
-                    sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
+    return map(inspect_pk3, paths)
 
-                    while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
+  def scan(self, folder, pk3s):
 
-                      min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
-                                             iter(voting_maps)))
-                      compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
-                                             iter(voting_maps) if nomination_count == min_nominations]
+    """Return the pk3 files of a folder that could be read along with the BSP names inside each one, in the pk3 files
+    order, and a warning for each archive that couldn't be read (also in order). The index is saved when anything
+    changed."""
 
-                      if (len(voting_maps) - len(compare_nominations)) >= 5:
+    entries = {}
+    archives_bsps = [] # Pk3 file, BSP names.
+    warnings = []
+    archives = [] # Path, size and modification time (None when it can't be read).
+    self.hits = self.misses = 0
 
-                        voting_maps[:] = voting_maps[:-len(compare_nominations)]
+    for pk3 in pk3s:
 
-                      else: # Compare maps with the map priority system
-                            # to define which maps remain.
-                        for i in xrange(3):
+      path = join_path(folder, pk3)
 
-                          decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
+      try:
 
-                          if not decrease_maps:
+        pk3_stat = stat(path)
 
-                            break
-                          
-                          filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
-                                                  if priority == i] # Map priority.
+      except OSError, err:
 
-                          if filtered_nominations:
+        archives.append((path, None, "Error while trying to read %s (ERRNO: %s)." % (pk3, err.errno)))
+        continue
+
+      key = (pk3_stat.st_size, pk3_stat.st_mtime)
+      entry = self.entries.get(path)
+
+      if entry is not None and entry[0] == key:
+
+        self.hits += 1
+        entries[path] = entry
+
+      archives.append((path, key, None))
+
+    paths = [path for (path, key, message) in iter(archives) if key is not None and path not in entries]
+    self.misses = len(paths)
+    read = dict(zip(paths, self._read(paths)))
+
+    for (path, key, message), pk3 in zip(archives, pk3s): # Merge in order, whichever worker read each archive.
+
+      if path in read:
+
+        names, message = read[path]
+
+        if message is None:
+
+          entries[path] = (key, names)
+          self.changed = True
+
+      if message is not None:
+
+        warnings.append(message)
+
+      else:
+
+        archives_bsps.append((pk3, entries[path][1]))
+
+    if len(entries) != len(self.entries): # Archives were removed.
+
+      self.changed = True
+
+    self.entries = entries
+
+    if self.changed:
+
+      try:
+
+        self.save()
+
+      except (IOError, OSError), err:
+
+        warnings.append("Could not write the BSP index (ERRNO: %s)." % (err.errno))
+
+    return (archives_bsps, warnings)
+
+  def save(self):
+
+    """Atomically write the index."""
+
+    with open("%s.tmp" % (self.path), "wb") as index:
+
+      dump_pickle(self.entries, index, HIGHEST_PROTOCOL)
+
+    if platform == "win32": # rename() doesn't replace existing files on Windows.
+
+      try:
+
+        remove(self.path)
+
+      except OSError:
+
+        pass
+
+    rename(("%s.tmp" % (self.path)), self.path)
+    self.changed = False
+
+class MapIndex(object):
+
+  """The maps of the MBII folder as the engine's virtual filesystem sees them. Pk3 files are loaded in sorted order
+  and a later archive overrides any map of an earlier one, so each map comes from the last pk3 file holding it."""
+
+  def __init__(self, archives):
+
+    lower = str.lower
+    self.providers = providers = {} # Lowercase map name -> pk3 file the engine loads it from.
+    self.names = names = {} # Lowercase map name -> map name as spelled in that pk3 file.
+    self.shadowed = [] # Map name, pk3 file overridden, pk3 file overriding it.
+    self.archives = [] # Pk3 files with maps, in load order.
+    order = [] # Lowercase map names in the order they first appear.
+
+    for pk3, bsps in iter(archives):
+
+      if bsps:
+
+        self.archives.append(pk3)
+
+      for bsp in iter(bsps):
+
+        key = lower(bsp)
+        provider = providers.get(key)
+
+        if provider is None:
+
+          order.append(key)
+
+        elif provider == pk3: # Same map in two folders of one archive.
+
+          continue
+
+        else:
+
+          self.shadowed.append((bsp, provider, pk3))
+
+        providers[key] = pk3
+        names[key] = bsp
+
+    self.maps = tuple((names[key] for key in iter(order)))
+
+  def __len__(self):
+
+    return len(self.providers)
+
+  def __contains__(self, mapname):
+
+    return str.lower(mapname) in self.providers
+
+  def provider(self, mapname):
+
+    """Return the pk3 file a map is loaded from or None."""
+
+    return self.providers.get(str.lower(mapname))
+
+  def unused(self, maps=None):
+
+    """Return the pk3 files with maps that provide none of the given maps (every map they hold is overridden when maps
+    is None), in load order."""
+
+    providers = self.providers
+
+    if maps is None:
+
+      used = set(providers.itervalues())
+
+    else:
+
+      lower = str.lower
+      used = set((providers.get(lower(mapname)) for mapname in iter(maps)))
+
+    return tuple((pk3 for pk3 in iter(self.archives) if pk3 not in used))
+
+class MapCatalog(object):
+
+  """Primary and secondary maps of the configuration, built once per configuration load. Every map is found by its
+  name as written in the map lists or in lowercase with a single dict lookup."""
+
+  def __init__(self, maps, secondary_maps, map_priority):
+
+    lower = str.lower
+    maps = maps or () # No map lists when RTV is disabled.
+    secondary_maps = secondary_maps or ()
+    self.names = tuple(maps) + tuple(secondary_maps) # Both map lists, primary maps first.
+    self.secondary_priority = map_priority[1] if map_priority else None
+    self.entries = entries = {} # Map name or lowercase map name -> map name, secondary map, priority.
+
+    for secondary, priority, mapnames in ((False, (map_priority[0] if map_priority else None), maps),
+                                          (True, self.secondary_priority, secondary_maps)):
+
+      for mapname in iter(mapnames):
+
+        if lower(mapname) not in entries: # A map in both lists is a primary map.
+
+          entries[lower(mapname)] = entries[mapname] = (mapname, secondary, priority)
+
+  def __len__(self):
+
+    return len(self.names)
+
+  def __contains__(self, mapname):
+
+    return mapname in self.entries
+
+  def get(self, mapname):
+
+    """Return the map name, whether it's a secondary map and its priority, or None."""
+
+    return self.entries.get(mapname)
+
+  def priority(self, mapname):
+
+    """Return the voting priority of a map. Maps outside the primary list get the secondary one."""
+
+    entry = self.entries.get(mapname)
+    return entry[2] if entry is not None else self.secondary_priority
+
+class Checkpoint(object):
+
+  """Persistent log position and game state so a restart doesn't need to replay the whole log file."""
+
+  FINGERPRINT_SIZE = 256
+
+  def __init__(self, path, logfile):
+
+    self.path = path
+    self.logfile = logfile
+    self.inode = None # Device and inode of the log file being read.
+    self.next_save = 0
+
+  def load(self, log):
+
+    """Return the saved state whether it still matches the open log file, otherwise None."""
+
+    log_stat = fstat(log.fileno())
+    self.inode = (log_stat.st_dev, log_stat.st_ino)
+
+    try:
+
+      with open(self.path, "rb") as checkpoint:
+
+        state = load_pickle(checkpoint)
+
+      offset = state["offset"]
+
+      if state["inode"] != self.inode or log_stat.st_size < offset: # Replaced or truncated.
+
+        return None
+
+      log.seek(max((offset - len(state["fingerprint"])), 0))
+
+      if log.read(len(state["fingerprint"])) != state["fingerprint"]: # Truncated and written again past the offset.
+
+        return None
+
+      return state
+
+    except Exception: # Missing, unreadable or corrupt checkpoint.
+
+      return None
+
+    finally:
+
+      log.seek(0)
+
+  def save(self, offset, players, gameinfo, recently_played, cvars):
+
+    """Atomically write the current state."""
+
+    self.next_save = (time() + CHECKPOINT_INTERVAL)
+    renamed = False
+
+    try:
+
+      with open(self.logfile, "rb") as logcopy: # Use a separate descriptor to keep the main iterator intact.
+
+        log_stat = fstat(logcopy.fileno())
+
+        if (log_stat.st_dev, log_stat.st_ino) != self.inode: # Log file was replaced.
+
+          return
+
+        logcopy.seek(max((offset - self.FINGERPRINT_SIZE), 0))
+        fingerprint = logcopy.read((offset - logcopy.tell()))
+
+      with open("%s.tmp" % (self.path), "wb") as checkpoint:
+
+        dump_pickle({
+                     "offset": offset,
+                     "inode": self.inode,
+                     "fingerprint": fingerprint,
+                     "players": tuple(players),
+                     "gameinfo": gameinfo,
+                     "recently_played": dict(recently_played),
+                     "cvars": cvars
+                    }, checkpoint, HIGHEST_PROTOCOL)
+        checkpoint.flush()
+        fsync(checkpoint.fileno())
+
+      if platform == "win32": # rename() doesn't replace existing files on Windows.
+
+        try:
+
+          remove(self.path)
+
+        except OSError:
+
+          pass
+
+      rename(("%s.tmp" % (self.path)), self.path)
+      renamed = True
+
+    except (IOError, OSError), err:
+
+      print("CONSOLE: (%s) Could not write checkpoint (ERRNO: %s)."
+            % (datetime.now().strftime("%d/%m/%Y %H:%M:%S"), err.errno))
+
+    finally:
+
+      if not renamed: # Failed or interrupted (e.g. exit() from a signal handler) halfway.
+
+        try:
+
+          remove("%s.tmp" % (self.path))
+
+        except OSError:
+
+          pass
+
+class Handshake(Thread):
+
+  """Set the RTVRTM cvar after a server restart from a background thread, retrying with backoff until the booting
+  server answers. The log loop holds its events until then."""
+
+  MAX_REPLY_TIMEOUT = 4 # Keep noticing a booted server quickly.
+
+  def __init__(self, address, bindaddr, payload, metrics):
+
+    Thread.__init__(self)
+    self.daemon = True
+    self.address = address
+    self.bindaddr = bindaddr
+    self.payload = payload
+    self.metrics = metrics # Histogram of the "sets" command.
+    self.done = Event() # Set once the server answers.
+    self.started = time()
+
+  def run(self):
+
+    reply_timeout = 1
+
+    while(True):
+
+      wait = (reply_timeout * uniform(1, 1.25))
+      sock = socket(AF_INET, SOCK_DGRAM)
+
+      try:
+
+        sock.bind((self.bindaddr, 0)) # Setting port as 0 will let the OS pick an available port for us.
+        sock.settimeout(wait)
+        sock.connect(self.address)
+        sent = time()
+        sock.send(self.payload)
+        sock.recv(1024)
+        self.metrics.add((time() - sent))
+        self.done.set()
+        return
+
+      except socketTimeout:
+
+        self.metrics.timeouts += 1
+
+      except socketError: # Unreachable or refused while the server boots.
+
+        self.metrics.errors += 1
+        sleep(wait)
+
+      finally:
+
+        sock.close()
+
+      reply_timeout = min((reply_timeout * 2), self.MAX_REPLY_TIMEOUT) # Exponential backoff.
+
+class LogArchiver(Thread):
+
+  """Compress the log file up to a snapshot size in a background thread while the main loop keeps tailing it.
+  Whatever gets written after the snapshot is handed over through finish() right before the log file is truncated."""
+
+  CHUNK_SIZE = 1048576
+  RETRY_DELAY = 300 # Seconds before compressing again after a failure. The log file is kept meanwhile.
+
+  def __init__(self, logfile, size, compression):
+
+    Thread.__init__(self)
+    self.daemon = True
+    self.logfile = logfile
+    self.size = size # Snapshot size.
+    self.compression, self.level = compression
+    self.path = join_path(dirname(logfile), "%s-%s%s" % (basename(logfile), datetime.now().strftime("%Y%m%d%H%M%S"),
+                                                         COMPRESSION_FORMATS[self.compression][0]))
+    self.compressed = Event() # Set once the snapshot is compressed (or compression failed).
+    self.error = None
+    self.tail = None
+    self.tail_ready = Event()
+
+  def finish(self, tail):
+
+    """Append the bytes written after the snapshot and close the archive. None (with error set) drops the archive."""
+
+    self.tail = tail
+    self.tail_ready.set()
+
+  def run(self):
+
+    start = time()
+
+    try:
+
+      with open(self.path, "wb") as archive:
+
+        if self.compression == "gzip":
+
+          compressor = GzipFile(basename(self.logfile), "wb", self.level, archive)
+          write = compressor.write
+          close = compressor.close
+
+        else:
+
+          compressor = (LZMACompressor(preset=self.level) if self.compression == "xz" else
+                        ZstdCompressor(level=self.level).compressobj())
+          write = lambda data: archive.write(compressor.compress(data))
+          close = lambda: archive.write(compressor.flush())
+
+        with open(self.logfile, "rb") as log:
+
+          remaining = self.size
+
+          while remaining > 0: # Stream the snapshot in chunks. zlib, lzma and zstd release the GIL while compressing.
+
+            data = log.read(min(self.CHUNK_SIZE, remaining))
+
+            if not data: # Truncated meanwhile.
+
+              break
+
+            write(data)
+            remaining -= len(data)
+
+        self.compressed.set()
+        self.tail_ready.wait()
+
+        if self.tail is None: # The main loop couldn't read the tail.
+
+          raise self.error
+
+        write(self.tail)
+        close()
+
+    except Exception, err:
+
+      self.error = err
+      self.compressed.set()
+
+      try:
+
+        remove(self.path)
+
+      except OSError:
+
+        pass
+
+      print("CONSOLE: (%s) Log file compression failed (%s)." % (datetime.now().strftime("%d/%m/%Y %H:%M:%S"), err))
+      return
+
+    print("CONSOLE: (%s) Log file was compressed into %s (%.1f MB in %.1f seconds)."
+          % (datetime.now().strftime("%d/%m/%Y %H:%M:%S"), basename(self.path),
+             ((self.size + len(self.tail)) / 1048576.0), (time() - start)))
+
+class Restart(object):
+
+  """Server restart line."""
+
+  __slots__ = ()
+
+class ClientConnect(object):
+
+  """A player joined the server."""
+
+  __slots__ = ("player_id",)
+
+  def __init__(self, player_id):
+
+    self.player_id = player_id
+
+class ClientDisconnect(object):
+
+  """A player left the server."""
+
+  __slots__ = ("player_id",)
+
+  def __init__(self, player_id):
+
+    self.player_id = player_id
+
+class InitGame(object):
+
+  """A new map/round started. Holds the raw "InitGame: \\cvar\\value..." line."""
+
+  __slots__ = ("line",)
+
+  def __init__(self, line):
+
+    self.line = line
+
+class ClientUserinfoChanged(object):
+
+  """A player's userinfo changed. The name is None when the userinfo has none."""
+
+  __slots__ = ("player_id", "name")
+
+  def __init__(self, player_id, name):
+
+    self.player_id = player_id
+    self.name = name
+
+class Say(object):
+
+  """Player chat message (say or sayteam) with color codes still in place."""
+
+  __slots__ = ("player_id", "team", "name", "text")
+
+  def __init__(self, player_id, team, name, text):
+
+    self.player_id = player_id
+    self.team = team
+    self.name = name
+    self.text = text
+
+class AdminSay(object):
+
+  """Message sent through the server console or /smod say."""
+
+  __slots__ = ("text",)
+
+  def __init__(self, text):
+
+    self.text = text
+
+class Exit(object):
+
+  """End of a map/round (e.g. "Kill limit hit.")."""
+
+  __slots__ = ("reason",)
+
+  def __init__(self, reason):
+
+    self.reason = reason
+
+class Kill(object):
+
+  """A player killed another one. Only counted, RTV/RTM doesn't need its details."""
+
+  __slots__ = ()
+
+class Item(object):
+
+  """A player picked up an item. Only counted."""
+
+  __slots__ = ()
+
+class ClientBegin(object):
+
+  """A player entered the game after connecting. Only counted."""
+
+  __slots__ = ()
+
+EVENT_TYPES = (None, Restart, ClientConnect, ClientBegin, ClientDisconnect, InitGame, ClientUserinfoChanged, Say,
+               AdminSay, Exit, Kill, Item) # Stats order. None stands for every other line.
+LOG_EVENTS = { # Event keyword (everything up to the first ": " after the timestamp) -> event type.
+              "ClientConnect: ": ClientConnect,
+              "ClientBegin: ": ClientBegin,
+              "Kill: ": Kill,
+              "Item: ": Item,
+              "ClientDisconnect: ": ClientDisconnect,
+              "InitGame: ": InitGame,
+              "ClientUserinfoChanged: ": ClientUserinfoChanged,
+              "say: ": AdminSay,
+              "Exit: ": Exit
+             }
+LOG_EVENTS.update((("%i: " % (player_id), Say) for player_id in xrange(100))) # "<player id>: say: ..." lines.
+SCAN_NEEDLES = ("ClientConnect: ", "ClientDisconnect: ", "InitGame: ", RESTART_LINE[2:]) # fix_line() output is always made of
+                                                                                         # a suffix of the original line.
+def parse_log(lines, counts=None):
+
+  """Turn raw log lines into event records. Lines that don't matter to RTV/RTM are only counted (kills, item pickups
+  and ClientBegin lines under their own type, anything else as None)."""
+
+  startswith = str.startswith
+  endswith = str.endswith
+  find = str.find
+  get_event = LOG_EVENTS.get
+
+  if counts is None:
+
+    counts = defaultdict(int)
+
+  for line in lines:
+
+    if not endswith(line, "\n"): # Incomplete line.
+
+      continue
+
+    if startswith(line, "Client ", 8): # Client line missing its newline character.
+
+      line = fix_line(line)
+
+    if line == RESTART_LINE: # Server restart.
+
+      counts[Restart] += 1
+      yield Restart()
+      continue
+
+    line = line[7:-1]
+    keyword_end = (find(line, ": ") + 2) # Lines without ": " give a 1 character keyword.
+    event = get_event(line[:keyword_end])
+    counts[event] += 1
+
+    if event is Say: # <player id>: say: <name>: "<text>"
+
+      if startswith(line, "say: ", keyword_end):
+
+        team = False
+        message = line[(keyword_end + 5):]
+
+      elif startswith(line, "sayteam: ", keyword_end):
+
+        team = True
+        message = line[(keyword_end + 9):]
+
+      else:
+
+        continue
+
+      quote = find(message, '"')
+
+      if quote > 1:
+
+        yield Say(int(line[:(keyword_end - 2)]), team, message[:(quote - 2)], message[(quote + 1):-1])
+
+    elif event is ClientConnect:
+
+      yield ClientConnect(int(line[15:17]))
+
+    elif event is ClientDisconnect:
+
+      yield ClientDisconnect(int(line[18:]))
+
+    elif event is InitGame:
+
+      yield InitGame(line)
+
+    elif event is ClientUserinfoChanged:
+
+      line = line[23:]
+      name_start = find(line, " n\\")
+
+      if name_start == -1:
+
+        name_start = find(line, "\\n\\")
+
+      if name_start == -1:
+
+        player_name = None
+
+      else:
+
+        player_name = line[(name_start + 3):]
+        name_end = find(player_name, "\\")
+
+        if name_end != -1:
+
+          player_name = player_name[:name_end]
+
+      yield ClientUserinfoChanged(int(line[:2]), player_name)
+
+    elif event is AdminSay:
+
+      if startswith(line, "say: Admin: "):
+
+        yield AdminSay(line[12:])
+
+      elif startswith(line, "say: Server: "):
+
+        yield AdminSay(line[13:])
+
+    elif event is Exit:
+
+      yield Exit(line[6:])
+
+def read_lines(log):
+
+  """Iterate over the complete lines from the log file's current position. A line still being written at EOF is left
+  in the file for the next read instead of being lost."""
+
+  for line in log:
+
+    if not line.endswith("\n"):
+
+      log.seek(-len(line), 1) # The read ahead buffer ended at EOF, so the real file position is right past this line.
+      break
+
+    yield line
+
+def replay_log(lines, players, cvars=None, start_line=False):
+
+  """Fast iteration over log lines (e.g. the log file from its current position) to rebuild the players table and
+  the latest cvars."""
+
+  for event in parse_log(lines):
+
+    event_type = event.__class__
+
+    if event_type is ClientConnect:
+
+      players[event.player_id] = [0, False, False, None, None] # Timer, RTV, RTM, Nomination, Vote Option.
+
+    elif event_type is ClientDisconnect:
+
+      try:
+
+        del players[event.player_id]
+
+      except KeyError:
+
+        pass
+
+    elif event_type is InitGame:
+
+      cvars = event.line
+
+    elif event_type is Restart:
+
+      players.clear()
+      cvars = None
+      start_line = True
+
+  return (cvars, start_line)
+
+def map_lines(log, needles, chunk_size=8388608):
+
+  """Yield the complete lines holding any of the needles from the log file's current position through a memory map.
+  The file position is left past the last complete line."""
+
+  start = log.tell()
+
+  if fstat(log.fileno()).st_size <= start:
+
+    return
+
+  try:
+
+    data = mmap(log.fileno(), 0, access=ACCESS_READ)
+
+  except (EnvironmentError, ValueError): # Not mappable (e.g. address space exhausted). Yield every line instead.
+
+    for line in log:
+
+      yield line
+
+    return
+
+  size = len(data)
+
+  try:
+
+    while start < size:
+
+# mmap.find() is a naive byte loop, so search line aligned slices of the map with str.find() instead.
+
+      end = (data.find("\n", (min((start + chunk_size), size) - 1)) + 1) or size
+      chunk = data[start:end]
+      find = chunk.find
+      rfind = chunk.rfind
+      positions = [find(needle) for needle in iter(needles)]
+      position = 0
+
+      while(True):
+
+        hit = [needle_position for needle_position in iter(positions) if needle_position != -1]
+
+        if not hit: # No more relevant lines.
+
+          position = (rfind("\n", position) + 1) or position
+          break
+
+        hit = min(hit)
+        line_end = find("\n", hit)
+
+        if line_end == -1: # Incomplete line at EOF.
+
+          break
+
+        line = chunk[(rfind("\n", position, hit) + 1 or position):(line_end + 1)]
+        position = (line_end + 1)
+        yield line
+
+        for i in xrange(len(needles)): # Search again for needles found within the yielded line.
+
+          if -1 < positions[i] < position:
+
+            positions[i] = find(needles[i], position)
+
+      start += position
+
+      if position < len(chunk): # Incomplete line at EOF.
+
+        break
+
+  finally:
+
+    data.close()
+    log.seek(start) # Past the last complete line.
+
+def scan_log(log, players, cvars=None, start_line=False, chunk_size=8388608):
+
+  """Memory-mapped replay_log(). Jumps straight to the lines holding relevant events instead of iterating every line."""
+
+  return replay_log(map_lines(log, SCAN_NEEDLES, chunk_size), players, cvars, start_line)
+
+def find_last_restart(logfile, block_size=1048576):
+
+  """Search the log file backwards from EOF for the last server restart line and return its offset (None if not found)."""
+
+  rfind = str.rfind
+  startswith = str.startswith
+  marker = "\n%s" % (RESTART_LINE[:-1]) # Line terminator is checked separately (\n or \r\n).
+  marker_size = len(marker)
+
+  with open(logfile, "rb") as log:
+
+    log.seek(0, 2)
+    position = log.tell()
+    data = ""
+
+    while position > 0:
+
+      read_size = min(block_size, position)
+      position -= read_size
+      log.seek(position)
+      data = "%s%s" % (log.read(read_size), data[:(marker_size + 1)]) # Keep enough of the previous block to match
+      end = len(data)                                                  # a restart line crossing the block boundary.
+
+      while(True):
+
+        offset = rfind(data, marker, 0, end)
+
+        if offset == -1:
+
+          break
+
+        terminator = data[(offset + marker_size):(offset + marker_size + 2)]
+
+        if startswith(terminator, "\n") or terminator == "\r\n":
+
+          return (position + offset + 1)
+
+        end = (offset + marker_size - 1)
+
+  if startswith(data, RESTART_LINE) or startswith(data, "%s\r\n" % (RESTART_LINE[:-1])): # Restart at the very first line.
+
+    return 0
+
+  return None
+
+def fix_line(line):
+
+  """Fix for the Client log line missing the \n (newline) character. Returns the last record glued to it (an empty
+  string when it can't be recovered). Other lines are returned as they are."""
+
+  if not line.startswith("Client ", 8): # Nearly every line. Passed through without any allocation.
+
+    return line
+
+  startswith = str.startswith
+  find = str.find
+  offset = 0 # Start of the current record within the line.
+
+  while(True):
+
+    first = find(line, ":", offset) # Timestamp.
+    second = find(line, ":", (first + 1)) # Within the Client record.
+    third = find(line, ":", (second + 1)) # Timestamp of the glued record.
+
+    if first == -1 or second == -1 or third == -1: # If this bug is ever fixed within the MBII code,
+                                                   # make sure this fix is not processed.
+      return ""
+
+    try:
+
+      minutes = int(line[offset:first])
+
+    except ValueError:
+
+      return ""
+
+    start = third
+    value = 0
+    scale = 1
+
+# Scan back over the glued record's minutes (6 digits at most). Its padding may be missing, so the first
+# candidate that isn't earlier than the current record or that follows a space is taken.
+
+    while(True):
+
+      start -= 1
+
+      if start <= second or (third - start) > 6 or not "0" <= line[start] <= "9":
+
+        return ""
+
+      value += ((ord(line[start]) - 48) * scale)
+      scale *= 10
+
+      if value >= minutes or line[(start - 1)] == " " or (start - 1) == second:
+
+        break
+
+    width = (third - start)
+
+    if width >= 3 or ((third - 3) > second and startswith(line, ("  ", " ")[(width - 1)], (third - 3))):
+
+      offset = min(start, (third - 3)) # Padding is already in place.
+
+    else:
+
+      line = "%s%s" % (("  ", " ")[(width - 1)], line[start:])
+      offset = 0
+
+    if not startswith(line, "Client ", (offset + 8)): # Several records may be glued together.
+
+      return line[offset:] if offset else line
+
+def remove_color(item, cache=None):
+
+  """Remove Quake3 color codes from a str object in a single pass. Strings that keep coming back (player names) can
+  be memoized in a cache dictionary."""
+
+  if "^" not in item: # No color codes at all.
+
+    return item
+
+  elif cache is None:
+
+    return COLOR_CODE.sub("", item)
+
+  try:
+
+    return cache[item]
+
+  except KeyError:
+
+    if len(cache) >= COLOR_CACHE_SIZE: # Bounded. Players come and go.
+
+      cache.clear()
+
+    cache[item] = stripped = COLOR_CODE.sub("", item)
+    return stripped
+
+def split_message(msg, size):
+
+  """Split a message at ", " boundaries into parts of up to size characters. Every part after the first starts with
+  the color code in effect where the previous part ended. Return None when the message can't be split that way."""
+
+  parts = []
+  rfind = str.rfind
+  findall = COLOR_CODE.findall
+  color = ""
+
+  while len(msg) > size:
+
+    cut = rfind(msg, ", ", 0, (size + 1))
+
+    if cut <= len(color): # Nothing to split at (besides the carried color code).
+
+      return None
+
+    part = msg[:(cut + 1)] # Keep the comma, drop the space.
+    parts.append(part)
+    colors = findall(part)
+
+    if colors:
+
+      color = colors[-1]
+
+    msg = (color + msg[(cut + 2):])
+
+  parts.append(msg)
+  return parts
+
+def parse_infostring(infostring):
+
+  """Turn a \\key\\value\\... info string into a dictionary with lowercase keys."""
+
+  items = infostring.split("\\")[1:]
+  return dict((items[i].lower(), items[i+1]) for i in xrange(0, (len(items) - 1), 2))
+
+def stale_players(players, client_names, server_players):
+
+  """Return the ids of tracked players the server no longer lists (see ServerQuery.status()). Players are told apart
+  by name, so only those whose name was seen in the log can be found, unless the server is empty."""
+
+  if not server_players:
+
+    return sorted(players)
+
+  surplus = (len(players) - len(server_players))
+
+  if surplus <= 0:
+
+    return []
+
+  listed = defaultdict(int)
+  stale = []
+
+  for (score, ping, name) in iter(server_players):
+
+    listed[name] += 1
+
+  for player_id in sorted(players):
+
+    name = client_names.get(player_id)
+
+    if name is None:
+
+      continue
+
+    elif listed[name]:
+
+      listed[name] -= 1
+
+    else:
+
+      stale.append(player_id)
+
+  return stale[:surplus] # Never drop more players than the server is missing.
+
+def drain(queue):
+
+  """Yield the items of a deque from the left until it's empty."""
+
+  popleft = queue.popleft
+
+  while queue:
+
+    yield popleft()
+
+def switch_default(default_game, current_mode, current_map, mbmode):
+
+  """Set default game whether player count drops to 0."""
+
+  if len(default_game) == 2:
+
+    if current_mode != default_game[0] or current_map != default_game[1].lower():
+
+      mbmode("%i %s" % (default_game[0], default_game[1]))
+      return True
+
+  elif isinstance(default_game[0], int):
+
+    if current_mode != default_game[0]:
+   
+      mbmode(default_game[0])
+      return True
+
+  elif current_map != default_game[0].lower(): 
+
+    mbmode("%i %s" % (current_mode, default_game[0]))
+    return True
+
+  return False
+
+def calculate_time(time1, time2):
+
+  """Calculate time difference in hours:minutes:seconds format."""
+
+  minutes, seconds = divmod(int((time2 - time1)), 60)
+  hours, minutes = divmod(minutes, 60)
+
+  if hours:
+
+    time_type = "hour"
+
+  elif minutes:
+
+    time_type = "minute"
+
+  else:
+
+    time_type = "second"
+
+  return ("%02i:%02i:%02i %s%s" % (hours, minutes, seconds, time_type,
+                                   ("" if (hours + minutes + seconds) == 1 else "s")))
+
+def send_voting_message(voting_name, countdown, countdown_type, total_votes, total_players, votes_items, svsay):
+
+  """Send voting related messages (countdown and voting options)."""
+
+  svsay(("^2[%s] ^7Type !number to vote. Voting will complete in ^2%i ^7%s%s (%i/%i)."
+         % (voting_name, countdown, countdown_type, ("" if countdown == 1 else "s"),
+            total_votes, total_players)), Rcon.VOTING)
+  svsay("^2[Votes] ^7%s" % (", ".join(("%i(%i): %s" % (vote_id, vote_count, vote_display_value)
+                                       for (vote_id, (vote_count, priority, vote_value, vote_display_value))
+                                       in votes_items()))), Rcon.VOTING)
+
+def main(argv):
+
+  global REPORT_UNHANDLED_EXCEPTION
+
+  setcheckinterval(2147483647)
+  lower = str.lower
+  startswith = str.startswith
+  endswith = str.endswith
+  split = str.split
+  isdigit = str.isdigit
+  strip = str.strip
+  lstrip = str.lstrip
+  join = str.join
+  count = list.count
+  remove = list.remove
+  sort = list.sort
+  clear = dict.clear
+  timenow = datetime.now
+  strftime = datetime.strftime
+
+  if endswith(lower(argv[0]), ".exe"):
+
+    argv[:] = argv[1:]
+    filecode = 0x01
+
+  else:
+
+    filecode = 0x00
+
+# Initialize RTV/RTM.
+
+  print("*****************************************************")
+  print("*%s*" % ("Movie Battles II RTV/RTM %s" % (VERSION)).center(51))
+  print("*****************************************************\n")
+  parser = OptionParser(usage="Usage: %s [--noupdate --quit] [-c <configuration file> -t <tries>]" % (argv[0]))
+  parser.add_option("-c", dest="config_path",
+                    help="Set the path of the configuration file. Default: rtvrtm.cfg", metavar="<configuration file>",
+                    default=join_path(dirname(normpath(argv[0])), "rtvrtm.cfg"))
+  parser.add_option("-t", type="int", dest="tries",
+                    help="Set the amount of server connection tries before giving up (0 = infinite). Default: 5",
+                    metavar="<0-100>", default=5)
+  parser.add_option("--poll", action="store_true", dest="poll",
+                    help="Poll the log file every %i ms instead of waiting for inotify events." % (SLEEP_INTERVAL * 1000),
+                    default=False)
+  parser.add_option("--workers", type="int", dest="workers",
+                    help="Set the amount of processes reading new or changed pk3 files in the MBII folder on startup (1 = no extra processes). Default: 1",
+                    metavar="<workers>", default=1)
+  parser.add_option("--stats", type="int", dest="stats",
+                    help="Print statistics to the console every <seconds> seconds (0 = disabled). Default: 0",
+                    metavar="<seconds>", default=0)
+  parser.add_option("--stats-file", dest="stats_file",
+                    help="Also write the statistics to this file every time they are printed (requires --stats).",
+                    metavar="<file>", default=None)
+  parser.add_option("--query", type="int", dest="query",
+                    help="Query the server status (getstatus) every <seconds> seconds to correct the players, map and mode read from the log file (0 = disabled). Default: 0",
+                    metavar="<seconds>", default=0)
+  parser.add_option("--checkpoint", dest="checkpoint",
+                    help="Set the path of the checkpoint file used to resume reading the log file after a restart. Default: rtvrtm.checkpoint next to the configuration file",
+                    metavar="<checkpoint file>", default=None)
+  parser.add_option("--nocheckpoint", action="store_false", dest="use_checkpoint",
+                    help="Do not read or write a checkpoint file. The whole log file is read on startup.", default=True)
+  parser_updater = OptionGroup(parser, "Built-in Updater Options")
+  parser_updater.add_option("--noupdate", action="store_true", dest="noupdate",
+                            help="Skip the update check.", default=False)
+  parser_updater.add_option("--quit", action="store_true", dest="quit",
+                            help="Quit after checking for updates. This option will have no effect if --noupdate is set.",
+                            default=False)
+  parser_bugreport = OptionGroup(parser, "Bug Report Options")
+  parser_bugreport.add_option("--noreport", action="store_false", dest="report",
+                              help="Do not send bug reports.", default=True)  
+  parser.add_option_group(parser_updater)
+  parser.add_option_group(parser_bugreport)
+  opts, args = parser.parse_args()
+  REPORT_UNHANDLED_EXCEPTION = opts.report
+
+  if args:
+
+    parser.error("Too many arguments or invalid arguments.")
+
+  config_path = strip(opts.config_path)
+
+  try:
+
+    while config_path[-1] in (" ", "\\", "/"):
+
+      config_path = config_path[:-1]
+
+    config_path = normpath(config_path)
+
+  except IndexError:
+
+    parser.error("Invalid configuration path.")
+
+  if opts.tries < 0 or opts.tries > 100:
+
+    parser.error("The amount of server connection tries must range from 0 to 100.")
+
+  if opts.workers < 1:
+
+    parser.error("The amount of pk3 workers must be greater than or equal 1.")
+
+  if opts.stats < 0:
+
+    parser.error("The statistics interval must be greater than or equal 0 seconds.")
+
+  if opts.stats_file and not opts.stats:
+
+    parser.error("The statistics file requires a statistics interval (--stats).")
+
+  if opts.query < 0:
+
+    parser.error("The server query interval must be greater than or equal 0 seconds.")
+
+  if not opts.noupdate: # Skip update check?
+
+    updater(normpath(argv[0]), filecode)
+
+    if opts.quit:
+
+      exit(0)
+
+  config = Config(config_path)
+  config.bsp_index.workers = opts.workers # Worker processes are forked before any thread is started.
+  config.create(opts.tries)
+  config.bsp_index.workers = 1 # Rehashes run alongside the rcon sender thread, forking isn't safe anymore.
+  print("[*] BSP index: %i pk3 files cached, %i read." % (config.bsp_index.hits, config.bsp_index.misses))
+
+  for line in iter(config.map_report()):
+
+    print("[*] %s" % (line))
+
+  poll = opts.poll
+  stats_interval = opts.stats
+  stats_file = normpath(strip(opts.stats_file)) if opts.stats_file else None
+  query_interval = opts.query
+  checkpoint = (Checkpoint(normpath(strip(opts.checkpoint) if opts.checkpoint else
+                                    join_path(dirname(config_path), "rtvrtm.checkpoint")),
+                           config.logfile)
+                if opts.use_checkpoint else None)
+  parser.destroy()
+  del (filecode, parser, parser_updater, parser_bugreport, opts, args, config_path)
+  print("[*] Creating data structures and setting parameters..."),
+  players = {}
+  nomination_order = []
+  add_nomination = nomination_order.append
+  remove_nomination = nomination_order.remove
+  voting_description = change_instructions = None
+  admin_choices = []
+  admin_choice = admin_choices.append
+  gamemodes = ("Open", "Semi Authentic", "Full Authentic", "Duel")
+  recently_played = defaultdict(int)
+  check_votes = voting_instructions = start_voting = start_second_turn = \
+  reset = recover = start_line = False
+  rcon = Rcon(config.address, config.bindaddr, config.rcon_pwd, config.rcon_rate, config.message_expiry)
+  register_exit(rcon.flush, 3) # Give the last messages a chance to be sent.
+  say = rcon.say
+  svsay = rcon.svsay if not config.use_say_only else say
+  mbmode = rcon.mbmode
+  clientkick = rcon.clientkick
+  VOTING = Rcon.VOTING # Voting messages are sent before any informational message.
+  status = Features(svsay)
+
+  if not config.rtv:
+
+    status.times[0] = object()
+
+  if not config.rtm:
+
+    status.times[1] = object()
+
+  Check_Status = status.Check
+  event_counts = defaultdict(int) # Lines read per event type.
+  next_stats = (time() + stats_interval)
+  tailer = LogTailer(config.logfile, poll)
+  archiver = None # Background log compression (clean log mode 2).
+  next_archive = 0 # No compression before this time (after a failed one).
+  rotation = None # Time the renamed log file was last seen growing and its size, while the new one is empty.
+  player_names = {} # remove_color() cache.
+  client_names = {} # Player id -> name, to match the players listed by the server.
+  query = ServerQuery(config.address, config.bindaddr) if query_interval else None
+  next_query = (time() + query_interval)
+
+  def wait_log(timeout=None):
+
+    """Wait for new log lines or the timeout, waking up in time for the periodic tasks of the idle loop (server
+    status query, statistics, checkpoint and log compression). A quiet log would otherwise put them off forever."""
+
+    current_time = time()
+    deadlines = [(current_time + timeout)] if timeout is not None else []
+
+    if query:
+
+      deadlines.append(next_query)
+
+    if stats_interval:
+
+      deadlines.append(next_stats)
+
+    if checkpoint:
+
+      deadlines.append(checkpoint.next_save)
+
+    if archiver: # Check whether the compression is done.
+
+      deadlines.append((current_time + 1))
+
+    elif next_archive > current_time: # Compress again after a failure.
+
+      deadlines.append(next_archive)
+
+    if rotation: # The new log file isn't watched yet.
+
+      deadlines.append((current_time + 1))
+
+    tailer.wait((max((min(deadlines) - current_time), 0) if deadlines else None))
+
+  injected = deque() # Events made up from the server status, handled before the next log lines.
+  held = deque() # Events read while the server restarts.
+  handshake = None # Restart handshake running in the background.
+  del poll
+  print("Done!")
+
+  with open(config.logfile, "rt+") as log:
+
+    seek = log.seek
+    tell = log.tell
+    truncate  = log.truncate
+    flush = log.flush
+    fileno = log.fileno()
+    saved_state = checkpoint.load(log) if checkpoint else None
+
+# Do a fast iteration over the log file to get the current status. The server status (getstatus) lists
+# no player ids, so it only replaces the log file when nobody is playing or when the log file misses the
+# server start.
+
+    server_status = query.status() if query and not saved_state else None
+
+    if saved_state:
+
+      print("[*] Resuming log file from checkpoint..."),
+      players = dict((player_id, [0, False, False, None, None]) for player_id in iter(saved_state["players"]))
+      seek(saved_state["offset"])
+      cvars, start_line = scan_log(log, players, saved_state["cvars"], True)
+
+    elif server_status and not server_status[2]: # Empty server.
+
+      print("[*] Reading server status..."),
+      seek(max((fstat(fileno).st_size - 4096), 0))
+      log_tail = log.read()
+      seek(((tell() - len(log_tail)) + log_tail.rfind("\n") + 1)) # Skip to the end of the last complete line.
+      cvars, start_line = (("InitGame: %s" % (server_status[0])), True)
+      del log_tail
+
+    else:
+
+      print("[*] Reading log file until EOF..."),
+      restart_offset = find_last_restart(config.logfile) # Anything before the last restart is irrelevant.
+
+      if restart_offset:
+
+        seek(restart_offset)
+
+      cvars, start_line = scan_log(log, players)
+      del restart_offset
+
+      if server_status and not (start_line and cvars): # Log file rotated or cleaned since the server started.
+
+        cvars, start_line = (("InitGame: %s" % (server_status[0])), True)
+
+    del server_status
+
+    if not start_line:
+
+      error("Server start line was not detected. Please restart your server and turn RTV/RTM on.")
+
+    elif not cvars:
+
+      error("Lastest cvars values were not retrieved. Please try restarting RTV/RTM.")
+
+    del start_line
+    cvars_line = cvars
+    cvars = split(cvars[11:], "\\")
+    cvars = dict((lower(cvars[i]), cvars[i+1]) for i in xrange(0, len(cvars), 2)) # Create cvar dictionary through the dict constructor.
+
+    try:
+
+      current_mode = int(cvars["g_authenticity"])
+
+      if current_mode not in (0, 1, 2, 3):
+
+        raise ValueError
+
+    except KeyError:
+
+      error("No current game mode detected.")
+
+    except ValueError:
+
+      error("Invalid value for game mode.")
+
+    try:
+
+      current_map = cvars["mapname"]
+
+    except KeyError:
+
+      error("No current map detected.")
+
+    print("Done!")
+
+    try:
+    
+      print("[Server Status] Map: %s | Mode: %s | Players: %i/%i\n"
+            % (current_map, gamemodes[current_mode], len(players), int(cvars["sv_maxclients"])))
+
+    except (KeyError, ValueError):
+
+      print("[Server Status] Map: %s | Mode: %s | Players: %i\n"
+            % (current_map, gamemodes[current_mode], len(players)))
+    
+    current_map = lower(current_map)
+    current_time = time()
+    gameinfo = { # Time of detection, extensions.
+                "mode": [current_time, 0],
+                "map": [current_time, 0]
+               }
+
+    if saved_state:
+
+      if cvars_line == saved_state["cvars"]: # Still the same game.
+
+        gameinfo = saved_state["gameinfo"]
+
+      recently_played.update(saved_state["recently_played"])
+
+    del saved_state
+    log_offset = tell()
+
+    def save_checkpoint():
+
+      checkpoint.save(log_offset, players, gameinfo, recently_played, cvars_line)
+
+    def truncate_log(size):
+
+      """Empty the log file if every line in it was read, which is checked again right before truncating. Returns
+      False and leaves the file alone when the server wrote more meanwhile, so those lines get read first. The server
+      appends without any locking, so a line written between that last check and the truncate itself (two system
+      calls apart) is still lost. Renaming the file instead isn't an option: the server keeps writing to the file it
+      has open."""
+
+      if tell() != size or fstat(fileno).st_size != size:
+
+        return False
+
+      truncate(0)
+      flush()
+      fsync(fileno)
+      seek(0)
+      print("CONSOLE: (%s) Log file was cleaned." % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+      return True
+
+    terminated = [] # Signals received. The loop exits on its own so no state is left half updated.
+
+    if checkpoint:
+
+      register_exit(save_checkpoint)
+      signal(SIGTERM, lambda signum, frame: terminated.append(signum)) # Make sure the checkpoint is written when
+                                                                      # terminated.
+    players_values = players.itervalues
+    players_items = players.iteritems
+
+# Initial RTV/RTM calculation.
+
+    rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
+                                                                 int(round(((rate * len(players)) / 100.0)))
+                                                                 for rate in (config.rtv_rate, config.rtm_rate))]
+
+    if not players and config.default_game:
+    
+      reset = switch_default(config.default_game, current_mode, current_map, mbmode)
+
+    while(True): # Infinite loop and parsing from here.
+                 # Ctrl+C or kill to close the process.
+      if terminated: # SIGTERM interrupted the last wait. atexit saves the checkpoint.
+
+        exit(2)
+
+      event = None
+      seek(0, 1) # Seek relative to the pointer's current position.
+                 # Intended to re-create the generator for the file descriptor.
+      for event in chain(drain(injected), parse_log(read_lines(log), event_counts)):
+
+        if handshake: # Server is still booting.
+
+          held.append(event)
+          continue
+
+        event_type = event.__class__
+
+        if event_type is Restart: # Server restart.
+
+          print("CONSOLE: (%s) Server restart detected!" % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+          clear(players)
+          client_names.clear()
+          nomination_order[:] = []
+          current_map = current_mode = voting_description = change_instructions = None
+          admin_choices[:] = []
+          gameinfo["mode"][1] = gameinfo["map"][1] = 0
+          recently_played = defaultdict(int)
+          status.rtv = status.rtm = voting_instructions = start_voting = \
+          start_second_turn = recover = False
+          reset = True
+
+          if config.rtv:
+            
+            status.times[0] = 0
+
+          if config.rtm:
+
+            status.times[1] = 0
+
+# Reset the cvar and confirm server status in the background.
+# Lines keep being read meanwhile, their events are held until the server answers.
+
+          handshake = Handshake(config.address, config.bindaddr,
+                                ("\xff\xff\xff\xffrcon %s sets RTVRTM %i/%s" % (config.rcon_pwd, config.cvar, VERSION)),
+                                rcon.metrics["sets"])
+          handshake.start()
+
+        else:
+
+          Check_Status() # Check for the status of each feature (RTV/RTM).
+
+          if event_type is ClientConnect:
+
+            player_id = event.player_id
+
+            if player_id not in players:
+
+              players[player_id] = [0, False, False, None, None] # Timer, RTV, RTM, Nomination, Vote Option.
+              rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
+                                                                           int(round(((rate * len(players)) / 100.0)))
+                                                                           for rate in (config.rtv_rate, config.rtm_rate))]
+
+          elif event_type is ClientDisconnect:
+
+            player_id = event.player_id
+
+            try:
+
+              if players[player_id][4]:
+
+                votes[players[player_id][4]][0] -= 1 # Remove -1 from the player's voted option.
+
+              if player_id in nomination_order:
+
+                remove_nomination(player_id)
+
+              del players[player_id]
+              client_names.pop(player_id, None)
+              rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
+                                                                           int(round(((rate * len(players)) / 100.0)))
+                                                                           for rate in (config.rtv_rate, config.rtm_rate))]
+
+              if not players:
+
+                voting_description = None
+                admin_choices[:] = []
+
+                if start_voting: # Cancel a running voting or map/mode change
+                                 # when player count drops to 0.
+                  status.rtv = status.rtm = voting_instructions = start_voting = start_second_turn = False
+                  change_instructions = None
+
+                  if config.default_game:
+
+                    reset = switch_default(config.default_game, current_mode, current_map, mbmode)
+
+                elif config.default_game:
+
+                  switch_default(config.default_game, current_mode, current_map, mbmode)
+
+              elif not start_voting:
+
+                check_votes = True
+
+            except KeyError:
+
+              pass
+
+          elif event_type is InitGame:
+
+            cvars_line = event.line
+            cvars = split(lower(cvars_line[11:]), "\\")
+            cvars = dict(cvars[i:i+2] for i in xrange(0, len(cvars), 2)) # Create cvar dictionary through the dict constructor.
+            cvars["g_authenticity"] = int(cvars["g_authenticity"])
+
+            if current_mode != cvars["g_authenticity"] or current_map != cvars["mapname"]:
+
+              players = dict((player_id, [timer, False, False, None, None])
+                             for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                             in players_items()) # Reset players options with the exception of their timer.
+              players_values = players.itervalues
+              players_items = players.iteritems
+              nomination_order[:] = []
+              voting_description = change_instructions = None
+              admin_choices[:] = []
+              gameinfo["mode"][1] = gameinfo["map"][1] = 0
+
+              if not reset:
+                 
+                status.rtv = status.rtm = False
+
+              else:
+
+                reset = False
+                    
+              voting_instructions = start_voting = start_second_turn = recover = False
+              current_time = time()
+
+              if current_mode != cvars["g_authenticity"]:
+
+                gameinfo["mode"][0] = current_time
+                current_mode = cvars["g_authenticity"]
+
+              if current_map != cvars["mapname"]:
+                
+                recently_played[current_map] = (current_time + config.enable_recently_played)
+                gameinfo["map"][0] = current_time
+                current_map = cvars["mapname"]
+
+            elif start_voting:
+
+              if not change_instructions:
+
+                if voting_method: # Round-based voting.
+
+                  if start_second_turn: # Start a second turn voting.
+
+                    start_second_turn = skip_voting = False
+                    voting_countdown = _voting_countdown
+                    svsay("^2[%s] ^7Second turn voting for the next %s has begun. Type !number to vote. Voting will complete in ^2%i ^7round%s."
+                          % (voting_name, voting_type, voting_countdown,
+                             ("" if voting_countdown == 1 else "s")), VOTING)
+                    voting_countdown -= 1
+                    svsay("^2[Votes] ^71: %s, 2: %s" % (votes[1][3], votes[2][3]), VOTING)
+                    voting_time = object()
+
+                  elif not voting_instructions:
+
+                    if voting_countdown:
+
+                      if voting_type == "admin":
+
+                        svsay("^2[Description] ^7%s" % (voting_description), VOTING)
+
+                      send_voting_message(voting_name, voting_countdown, "round",
+                                          sum((vote_count for (vote_count, priority, vote_value, vote_display_value) in votes_values())),
+                                          len(players), votes_items, svsay)
+                      voting_countdown -= 1
+
+                    else:
+
+                      voting_time = 0
+
+              elif change_instructions is not True: # Next round map/mode change.
+
+                mbmode(("%i %s" % (current_mode, change_instructions[0]) if voting_type == "map" else
+                        change_instructions[0]))
+                wait_time = (time() + change_instructions[2])
+                  
+                if wait_time > status.times[change_instructions[1]]:
+
+                  status.times[change_instructions[1]] = wait_time
+                    
+                change_instructions = recover = True
+
+          elif event_type is ClientUserinfoChanged:
+
+            if event.name is not None:
+
+              client_names[event.player_id] = event.name
+
+            if config.name_protection and event.name is not None: # Kick players using restricted nicknames.
+
+              player_id = event.player_id
+              player_name = event.name
+
+              if lower(strip(remove_color(player_name, player_names))) in ("admin", "server"):
+
+                say("^3Restricted nickname in use. Kicking player %i (^7%s^3)..."
+                    % (player_id, player_name))
+                clientkick(player_id)
+
+          elif event_type is AdminSay: # Admin commands (/smod say).
+
+            if not recover:
+
+              original_admin_cmd = strip(remove_color(event.text))
+              admin_cmd = lower(original_admin_cmd)
+
+              if admin_cmd == "!rehash": # Rehash configuration.
+
+                svsay("^2[Status] ^7Rehashing configuration...")
+                print("CONSOLE: (%s) [Status] Rehashing configuration..." %
+                      (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                sleep(1)
+                  
+                if config.rehash():
+
+                  rcon.address = config.address
+                  rcon.bindaddr =  config.bindaddr
+                  rcon.rcon_pwd = config.rcon_pwd
+                  rcon.rate = config.rcon_rate
+                  rcon.expiry = config.message_expiry
+
+                  if query:
+
+                    query.address = config.address
+                    query.bindaddr = config.bindaddr
+
+                  if not config.use_say_only:
+
+                    svsay = status.svsay = rcon.svsay
+
+                  else:
+
+                    svsay = status.svsay = say
+                    
+                  svsay("^2[Status] ^7Rehash successful!")
+                  print("[*] BSP index: %i pk3 files cached, %i read." % (config.bsp_index.hits, config.bsp_index.misses))
+
+                  for line in iter(config.map_report()):
+
+                    print("[*] %s" % (line))
+
+                else:
+
+                  svsay("^2[Status] ^7Rehash failed!")
+                  
+                print("[*] Resetting parameters..."),
+                players = dict((player_id, [0, False, False, None, None])
+                               for player_id in iter(players)) # Reset players data.
+                players_values = players.itervalues
+                players_items = players.iteritems
+                nomination_order[:] = []
+                voting_description = change_instructions = None
+                admin_choices[:] = []
+                gameinfo["mode"][1] = gameinfo["map"][1] = 0
+                recently_played = defaultdict(int)
+                status.rtv = status.rtm = voting_instructions = start_voting = start_second_turn = False
+                status.times[0] = 0 if config.rtv else object()
+                status.times[1] = 0 if config.rtm else object()
+                rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
+                                                                             int(round(((rate * len(players)) / 100.0)))
+                                                                             for rate in (config.rtv_rate, config.rtm_rate))]
+                recover = True
+                print("Done!\n")
+
+              elif not start_voting:
+
+                if admin_cmd == "!erase": # Erase the Admin voting options pool.
+
+                  admin_choices[:] = []
+                  svsay("^2[Admin] ^7Admin voting options were erased.")
+
+                elif startswith(admin_cmd, "!description "): # Set the admin's voting description.
+
+                  if voting_description:
+
+                    svsay("^2[Admin] ^7Admin voting description changed!")
+
+                  else:
+                      
+                    svsay("^2[Admin] ^7Admin voting description added!")
+
+                  voting_description = lstrip(original_admin_cmd[13:])
+
+                elif startswith(admin_cmd, "!vote "): # Add a voting option to the Admin voting options pool.
+
+                  if len(admin_choices) < 10: # A total maximum of 10 voting options.
+
+                    voting_choice = lstrip(original_admin_cmd[6:])
+
+                    if lower(voting_choice) in (lower(voting_option) for voting_option in iter(admin_choices)):
+
+                      say("^2[Admin] ^7%s is already present within the admin voting options." % (voting_choice))
+
+                    else:
+
+                      admin_choice(voting_choice)
+                      svsay("^2[Admin] ^7%s was added as an admin voting option." % (voting_choice))
+
+                  else:
+
+                    say("^2[Admin] ^7Admin voting is full.")
+
+                else:
+
+                  admin_cmd = split(admin_cmd)
+
+                  if len(admin_cmd) == 2:
+
+                    if admin_cmd[0] == "!enable": # Enable RTV/RTM/Recently played maps immediately.
+
+                      if admin_cmd[1] == "maps":
+
+                        recently_played = defaultdict(int)
+
+                      elif admin_cmd[1] == "rtv":
+
+                        if config.rtv:
+
+                          status.times[0] = 0
+
+                      elif admin_cmd[1] == "rtm" and config.rtm:
+
+                        status.times[1] = 0
+
+                    elif admin_cmd[0] == "!force": # Force a RTV/RTM/Admin voting immediately.
+
+                      if admin_cmd[1] == "rtv":
+
+                        if config.rtv:
+
+                          players = dict((player_id, [timer, True, rtm_vote, nomination, None])
+                                         for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                         in players_items()) # Force RTV for all connected players.
+                          players_values = players.itervalues
+                          players_items = players.iteritems
+                          check_votes = True
+
+                      elif admin_cmd[1] == "rtm":
+
+                        if config.rtm:
+
+                          players = dict((player_id, [timer, rtv_vote, True, nomination, None])
+                                         for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                         in players_items()) # Force RTM for all connected players.
+                          players_values = players.itervalues
+                          players_items = players.iteritems
+                          check_votes = True
+
+                      elif admin_cmd[1] == "admin":
+
+                        if not voting_description:
+
+                          svsay("^2[Admin] ^7Admin voting failed to start! No voting description is set.")
+                          print("CONSOLE: (%s) [Admin] Admin voting failed to start! No voting description is set."
+                                % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+
+                        elif not admin_choices:
+
+                          svsay("^2[Admin] ^7Admin voting failed to start! No voting options were added.")
+                          print("CONSOLE: (%s) [Admin] Admin voting failed to start! No voting options were added."
+                                % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+
+                        elif len(admin_choices) < 2:
+
+                          svsay("^2[Admin] ^7Admin voting failed to start! Two or more voting options are required.")
+                          print("CONSOLE: (%s) [Admin] Admin voting failed to start! Two or more voting options are required."
+                                % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+
+                        else:
+
+                          votes = SortableDict(((i+1), [0, None, None, admin_choices[i]])
+                                               for i in xrange(len(admin_choices)))
+                          votes_values = votes.itervalues
+                          votes_items = votes.sorteditems
+                          voting_name = "Admin"
+                          voting_type = "admin"
+                          voting_method, voting_countdown = config.admin_voting
+                          voting_minimum_votes = config.admin_minimum_votes
+                          voting_skip_voting = config.admin_skip_voting
+                          voting_second_turn = None
+                          status.rtv = status.rtm = voting_instructions = start_voting = True
+
+                  elif len(admin_cmd) == 3 and admin_cmd[0] == "!disable" and isdigit(admin_cmd[2]): # Disable RTV/RTM.
+
+                    if admin_cmd[1] == "rtv":
+
+                      if config.rtv:
+
+                        svsay("^2[RTV] ^7Rock the vote was forcefully disabled!")
+                        print("CONSOLE: (%s) [RTV] Rock the vote was forcefully disabled!" %
+                              (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                        disable_time = int(admin_cmd[2])
+                        status.rtv = False
+                        status.times[0] = (time() + disable_time) if disable_time else object()
+                        players = dict((player_id, [timer, False, rtm_vote, nomination, None])
+                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                       in players_items()) # Reset RTV votes.
+                        players_values = players.itervalues
+                        players_items = players.iteritems
+
+                    elif admin_cmd[1] == "rtm" and config.rtm:
+
+                      svsay("^2[RTM] ^7Rock the mode was forcefully disabled!")
+                      print("CONSOLE: (%s) [RTM] Rock the mode was forcefully disabled!" %
+                            (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                      disable_time = int(admin_cmd[2])
+                      status.rtm = False
+                      status.times[1] = (time() + disable_time) if disable_time else object()
+                      players = dict((player_id, [timer, rtv_vote, False, nomination, None])
+                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                     in players_items()) # Reset RTM votes.
+                      players_values = players.itervalues
+                      players_items = players.iteritems
+
+              elif admin_cmd == "!cancel":
+
+                if not change_instructions: # Cancel current voting.
+
+                  if not voting_instructions and not start_second_turn:
+
+                    svsay("^2[Voting] ^7The %s voting was canceled!" % (voting_type), VOTING)
+                    print("CONSOLE: (%s) [Voting] The %s voting was canceled!" %
+                          (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_type))
+                    players = dict((player_id, [timer, False, False, None, None])
+                                   for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                   in players_items()) # Reset players options with the exception of their timer.
+                    players_values = players.itervalues
+                    players_items = players.iteritems
+                    nomination_order[:] = []
+                    voting_description = None
+                    admin_choices[:] = []
+                    status.rtv = status.rtm = start_voting = False
+                    recover = True
+                    del votes
+
+                elif change_instructions is not True: # Cancel next map/mode change.
+
+                  svsay("^2[Nextgame] ^7The next %s (%s) was canceled!" %
+                        (voting_type,
+                         (change_instructions[0] if voting_type == "map" else
+                          gamemodes[change_instructions[0]])), VOTING)
+                  print("CONSOLE: (%s) [Nextgame] The next %s (%s) was canceled!" %
+                        (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_type,
+                         (change_instructions[0] if voting_type == "map" else
+                          gamemodes[change_instructions[0]])))
+                           
+                  change_instructions = None
+                  status.rtv = status.rtm = start_voting = False
+                  recover = True
+
+              elif admin_cmd == "!nextgame" and change_instructions > True: # Force a queued map/mode change
+                                                                            # before the next round.
+                mbmode(("%i %s" % (current_mode, change_instructions[0]) if voting_type == "map" else
+                        change_instructions[0]))
+                wait_time = (time() + change_instructions[2])
+
+                if wait_time > status.times[change_instructions[1]]:
+                            
+                  status.times[change_instructions[1]] = wait_time
+
+                change_instructions = recover = True
+
+          elif not start_voting:
+
+            if event_type is Exit and event.reason == "Kill limit hit.":
+
+              if config.roundlimit and players: # Initiate an automatic Roundlimit voting.
+
+                nominated_maps = [nomination
+                                  for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                  in players_values() if nomination]
+
+                if config.nomination_type:
+
+                  map_duplicates = defaultdict(bool)
+                  voting_maps = [(count(nominated_maps, players[player_id][3]),
+                                  config.map_catalog.priority(players[player_id][3]),
+                                  players[player_id][3])
+                                 for player_id in iter(nomination_order)
+                                 if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
+                                     not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
+                  sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
+
+                  while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
+
+                    min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
+                                           iter(voting_maps)))
+                    compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
+                                           iter(voting_maps) if nomination_count == min_nominations]
+
+                    if (len(voting_maps) - len(compare_nominations)) >= 5:
+
+                      voting_maps[:] = voting_maps[:-len(compare_nominations)]
+
+                    else: # Compare maps with the map priority system
+                          # to define which maps remain.
+                      for i in xrange(3):
+
+                        decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
+
+                        if not decrease_maps:
+
+                          break
+                          
+                        filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
+                                                if priority == i] # Map priority.
+
+                        if filtered_nominations:
+
+                          if len(filtered_nominations) > decrease_maps:
+
+                            filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
+
+                          voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
+                                         in iter(voting_maps)
+                                         if nomination not in filtered_nominations]
+
+                  voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
+                    
+                else:
+
+                  voting_maps = [(config.map_catalog.priority(players[player_id][3]),
+                                  players[player_id][3])
+                                 for player_id in iter(nomination_order)]
+
+                missing_maps = (5 - len(voting_maps))
+
+                if missing_maps: # Not all 5 map slots are filled.
+
+                  available_maps = config.maps
+                  available_secondary_maps = []
+                  current_time = time()
+
+                  if config.pick_secondary_maps == 2:
+
+                    available_maps += config.secondary_maps
+
+                  elif config.pick_secondary_maps:
+
+                    available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
+                                                if (mapname not in nominated_maps and
+                                                    lower(mapname) != current_map and
+                                                    recently_played[lower(mapname)] <= current_time)]
+
+                  available_maps = [mapname for mapname in iter(available_maps)
+                                    if (mapname not in nominated_maps and
+                                        lower(mapname) != current_map and
+                                        recently_played[lower(mapname)] <= current_time)]
+                    
+                  if missing_maps == 5 and not available_maps and not available_secondary_maps:
+
+                    svsay("^2[Roundlimit] ^7Roundlimit voting failed to start! No map is currently available.")
+                    print("CONSOLE: (%s) [Roundlimit] Roundlimit voting failed to start! No map is currently available."
+                          % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                    players = dict((player_id, [timer, False, rtm_vote, None, None])
+                                   for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
+                                   players_items()) # Reset RTV votes.
+                    players_values = players.itervalues
+                    players_items = players.iteritems
+                    continue
+
+                  append_map = voting_maps.append
+                  remove_map = available_maps.remove
+
+                  try:
+
+                    for i in xrange(missing_maps):
+
+# Fill any remaining map slots with random maps.
+
+                      mapname = choice(available_maps)
+                      append_map((config.map_catalog.priority(mapname),
+                                  mapname))
+                      remove_map(mapname)
+
+                  except IndexError: # Not enough maps to fill all 5 slots.
+
+                    if available_secondary_maps: # Fill with secondary maps if we have no new
+                                                 # primary map to use.
+                      remove_map = available_secondary_maps.remove
+
+                      try:
+                        
+                        for i in xrange((5 - len(voting_maps))):
+
+# Fill any remaining map slots with random secondary maps.
+
+                          mapname = choice(available_secondary_maps)
+                          append_map((config.map_priority[1], mapname))
+                          remove_map(mapname)
+
+                      except IndexError: # Not enough maps to fill remaining slots.
+
+                        pass
+
+# Create voting options.
+
+                votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
+                                     for i in xrange(len(voting_maps)))
+
+                if (config.limit_extend[0] == 2 or
+                    (config.limit_extend[0] == 1 and gameinfo["map"][1] < config.limit_extend[1])):
+          
+                  votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
+                  
+                votes_values = votes.itervalues
+                votes_items = votes.sorteditems
+                voting_name = "Roundlimit"
+                voting_type = "map"
+                voting_method, voting_countdown = config.limit_voting
+                voting_minimum_votes = config.limit_minimum_votes
+                voting_wait_time = 0
+                voting_s_wait_time = config.limit_s_wait_time
+                voting_f_wait_time = config.limit_f_wait_time
+                voting_skip_voting = config.limit_skip_voting
+                voting_second_turn = config.limit_second_turn
+                voting_change_immediately = config.limit_change_immediately
+                status.rtv = status.rtm = voting_instructions = start_voting = True
+
+            elif event_type is Exit and event.reason == "Timelimit hit.":
+
+              if config.timelimit and players: # Initiate an automatic Timelimit voting.
+
+                nominated_maps = [nomination
+                                  for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                  in players_values() if nomination]
+
+                if config.nomination_type:
+
+                  map_duplicates = defaultdict(bool)
+                  voting_maps = [(count(nominated_maps, players[player_id][3]),
+                                  config.map_catalog.priority(players[player_id][3]),
+                                  players[player_id][3])
+                                 for player_id in iter(nomination_order)
+                                 if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
+                                     not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
+                  sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
+
+                  while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
+
+                    min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
+                                           iter(voting_maps)))
+                    compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
+                                           iter(voting_maps) if nomination_count == min_nominations]
+
+                    if (len(voting_maps) - len(compare_nominations)) >= 5:
+
+                      voting_maps[:] = voting_maps[:-len(compare_nominations)]
+
+                    else: # Compare maps with the map priority system
+                          # to define which maps remain.
+                      for i in xrange(3):
+
+                        decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
+
+                        if not decrease_maps:
+
+                          break
+                          
+                        filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
+                                                if priority == i] # Map priority.
 
-                            if len(filtered_nominations) > decrease_maps:
+                        if filtered_nominations:
+
+                          if len(filtered_nominations) > decrease_maps:
 
-                              filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
+                            filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
 
-                            voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
-                                           in iter(voting_maps)
-                                           if nomination not in filtered_nominations]
+                          voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
+                                         in iter(voting_maps)
+                                         if nomination not in filtered_nominations]
 
-                    voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
+                  voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
                     
-                  else:
+                else:
 
-                    voting_maps = [((config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                    players[player_id][3])
-                                   for player_id in iter(nomination_order)]
+                  voting_maps = [(config.map_catalog.priority(players[player_id][3]),
+                                  players[player_id][3])
+                                 for player_id in iter(nomination_order)]
 
-                  missing_maps = (5 - len(voting_maps))
+                missing_maps = (5 - len(voting_maps))
 
-                  if missing_maps: # Not all 5 map slots are filled.
+                if missing_maps: # Not all 5 map slots are filled.
 
-                    available_maps = config.maps
-                    available_secondary_maps = []
-                    current_time = time()
+                  available_maps = config.maps
+                  available_secondary_maps = []
+                  current_time = time()
 
-                    if config.pick_secondary_maps == 2:
+                  if config.pick_secondary_maps == 2:
 
-                      available_maps += config.secondary_maps
+                    available_maps += config.secondary_maps
 
-                    elif config.pick_secondary_maps:
+                  elif config.pick_secondary_maps:
 
-                      available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
-                                                  if (mapname not in nominated_maps and
-                                                      lower(mapname) != current_map and
-                                                      recently_played[lower(mapname)] <= current_time)]
+                    available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
+                                                if (mapname not in nominated_maps and
+                                                    lower(mapname) != current_map and
+                                                    recently_played[lower(mapname)] <= current_time)]
 
-                    available_maps = [mapname for mapname in iter(available_maps)
-                                      if (mapname not in nominated_maps and
-                                          lower(mapname) != current_map and
-                                          recently_played[lower(mapname)] <= current_time)]
+                  available_maps = [mapname for mapname in iter(available_maps)
+                                    if (mapname not in nominated_maps and
+                                        lower(mapname) != current_map and
+                                        recently_played[lower(mapname)] <= current_time)]
                     
-                    if missing_maps == 5 and not available_maps and not available_secondary_maps:
+                  if missing_maps == 5 and not available_maps and not available_secondary_maps:
 
-                      svsay("^2[Roundlimit] ^7Roundlimit voting failed to start! No map is currently available.")
-                      print("CONSOLE: (%s) [Roundlimit] Roundlimit voting failed to start! No map is currently available."
-                            % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                      players = dict((player_id, [timer, False, rtm_vote, None, None])
-                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
-                                     players_items()) # Reset RTV votes.
-                      players_values = players.itervalues
-                      players_items = players.iteritems
-                      continue
+                    svsay("^2[Timelimit] ^7Timelimit voting failed to start! No map is currently available.")
+                    print("CONSOLE: (%s) [Timelimit] Timelimit voting failed to start! No map is currently available."
+                          % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                    players = dict((player_id, [timer, False, rtm_vote, None, None])
+                                   for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
+                                   players_items()) # Reset RTV votes.
+                    players_values = players.itervalues
+                    players_items = players.iteritems
+                    continue
 
-                    append_map = voting_maps.append
-                    remove_map = available_maps.remove
+                  append_map = voting_maps.append
+                  remove_map = available_maps.remove
 
-                    try:
+                  try:
 
-                      for i in xrange(missing_maps):
+                    for i in xrange(missing_maps):
 
 # Fill any remaining map slots with random maps.
 
-                        mapname = choice(available_maps)
-                        append_map(((config.map_priority[0] if mapname in config.maps else config.map_priority[1]),
-                                    mapname))
-                        remove_map(mapname)
+                      mapname = choice(available_maps)
+                      append_map((config.map_catalog.priority(mapname),
+                                  mapname))
+                      remove_map(mapname)
 
-                    except IndexError: # Not enough maps to fill all 5 slots.
+                  except IndexError: # Not enough maps to fill all 5 slots.
 
-                      if available_secondary_maps: # Fill with secondary maps if we have no new
-                                                   # primary map to use.
-                        remove_map = available_secondary_maps.remove
+                    if available_secondary_maps: # Fill with secondary maps if we have no new
+                                                 # primary map to use.
+                      remove_map = available_secondary_maps.remove
 
-                        try:
+                      try:
                         
-                          for i in xrange((5 - len(voting_maps))):
+                        for i in xrange((5 - len(voting_maps))):
 
 # Fill any remaining map slots with random secondary maps.
 
-                            mapname = choice(available_secondary_maps)
-                            append_map((config.map_priority[1], mapname))
-                            remove_map(mapname)
+                          mapname = choice(available_secondary_maps)
+                          append_map((config.map_priority[1], mapname))
+                          remove_map(mapname)
 
-                        except IndexError: # Not enough maps to fill remaining slots.
+                      except IndexError: # Not enough maps to fill remaining slots.
 
-                          pass
+                        pass
 
 # Create voting options.
 
-                  votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
-                                       for i in xrange(len(voting_maps)))
+                votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
+                                     for i in xrange(len(voting_maps)))
 
-                  if (config.limit_extend[0] == 2 or
-                      (config.limit_extend[0] == 1 and gameinfo["map"][1] < config.limit_extend[1])):
+                if (config.limit_extend[0] == 2 or
+                    (config.limit_extend[0] == 1 and gameinfo["map"][1] < config.limit_extend[1])):
           
-                    votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
+                  votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
                   
-                  votes_values = votes.itervalues
-                  votes_items = votes.sorteditems
-                  voting_name = "Roundlimit"
-                  voting_type = "map"
-                  voting_method, voting_countdown = config.limit_voting
-                  voting_minimum_votes = config.limit_minimum_votes
-                  voting_wait_time = 0
-                  voting_s_wait_time = config.limit_s_wait_time
-                  voting_f_wait_time = config.limit_f_wait_time
-                  voting_skip_voting = config.limit_skip_voting
-                  voting_second_turn = config.limit_second_turn
-                  voting_change_immediately = config.limit_change_immediately
-                  status.rtv = status.rtm = voting_instructions = start_voting = True
+                votes_values = votes.itervalues
+                votes_items = votes.sorteditems
+                voting_name = "Timelimit"
+                voting_type = "map"
+                voting_method, voting_countdown = config.limit_voting
+                voting_minimum_votes = config.limit_minimum_votes
+                voting_wait_time = 0
+                voting_s_wait_time = config.limit_s_wait_time
+                voting_f_wait_time = config.limit_f_wait_time
+                voting_skip_voting = config.limit_skip_voting
+                voting_second_turn = config.limit_second_turn
+                voting_change_immediately = config.limit_change_immediately
+                status.rtv = status.rtm = voting_instructions = start_voting = True
 
-              elif line == "Exit: Timelimit hit.":
+            elif not recover: # Standard commands.
 
-                if config.timelimit and players: # Initiate an automatic Timelimit voting.
+              if event_type is Say:
 
-                  nominated_maps = [nomination
-                                    for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                    in players_values() if nomination]
+                player_id = event.player_id
+                player_name = event.name
+                original_msg = strip(remove_color(event.text))
+                msg = lower(original_msg)
+                current_time = time()
 
-                  if config.nomination_type:
+                if player_id not in players: # Connected before the log file starts or dropped after a server query.
 
-                    map_duplicates = defaultdict(bool)
-                    voting_maps = [(count(nominated_maps, players[player_id][3]),
-                                    (config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                    players[player_id][3])
-                                   for player_id in iter(nomination_order)
-                                   if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
-                                       not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
-                    sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
+                  players[player_id] = [0, False, False, None, None] # Timer, RTV, RTM, Nomination, Vote Option.
+                  client_names[player_id] = player_name
+                  rtv_players, rtm_players = [base if base else 1 for base in (((len(players) / 2) + 1) if not rate else
+                                                                               int(round(((rate * len(players)) / 100.0)))
+                                                                               for rate in (config.rtv_rate, config.rtm_rate))]
 
-                    while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
+                if players[player_id][0] <= current_time: # Flood protection.
+
+                  if msg in ("rtv", "!rtv"):
+
+                    if not config.rtv:
+
+                      say("^2[RTV] ^7Rock the vote is unavailable.")
+
+                    elif not status.rtv:
+
+                      if isinstance(status.times[0], float):
+
+                        say("^2[RTV] ^7Rock the vote is currently disabled. Time remaining: %s"
+                            % (calculate_time(current_time, status.times[0])))
+
+                      else:
 
-                      min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
-                                             iter(voting_maps)))
-                      compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
-                                             iter(voting_maps) if nomination_count == min_nominations]
+                        say("^2[RTV] ^7Rock the vote is temporarily disabled.")
+                        
+                    else:
 
-                      if (len(voting_maps) - len(compare_nominations)) >= 5:
+                      available_maps = config.maps
 
-                        voting_maps[:] = voting_maps[:-len(compare_nominations)]
+                      if config.pick_secondary_maps:
 
-                      else: # Compare maps with the map priority system
-                            # to define which maps remain.
-                        for i in xrange(3):
+                        available_maps += config.secondary_maps
 
-                          decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
+                      available_maps = (lower(mapname) for mapname in iter(available_maps))
+                      available_maps = sum((True for mapname in available_maps
+                                            if (mapname != current_map and
+                                                recently_played[mapname] <= current_time)))
+                      available_maps += len(nomination_order)
 
-                          if not decrease_maps:
+                      if not available_maps:
 
-                            break
+                        say("^2[RTV] ^7Rock the vote is disabled because no map is currently available.")
+                        players = dict((player_id, [timer, False, rtm_vote, None, None])
+                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                       in players_items()) # Reset RTV votes.
+                        players_values = players.itervalues
+                        players_items = players.iteritems
+                          
+                      elif players[player_id][1]:
+                          
+                        say("^2[RTV] ^7%s ^7already wanted to rock the vote (%i/%i)."
+                            % (player_name,
+                               sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                    in players_values())),
+                               rtv_players))
                           
-                          filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
-                                                  if priority == i] # Map priority.
+                      else:
 
-                          if filtered_nominations:
+                        players[player_id][1] = check_votes = True
+                        svsay("^2[RTV] ^7%s ^7wants to rock the vote (%i/%i)."
+                              % (player_name,
+                                 sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                      in players_values())),
+                                 rtv_players))
 
-                            if len(filtered_nominations) > decrease_maps:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                              filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
+                  elif msg in ("unrtv", "!unrtv"):
 
-                            voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
-                                           in iter(voting_maps)
-                                           if nomination not in filtered_nominations]
+                    if not config.rtv:
 
-                    voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
-                    
-                  else:
+                      say("^2[RTV] ^7Rock the vote is unavailable.")
 
-                    voting_maps = [((config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                    players[player_id][3])
-                                   for player_id in iter(nomination_order)]
+                    elif not status.rtv:
 
-                  missing_maps = (5 - len(voting_maps))
+                      if isinstance(status.times[0], float):
 
-                  if missing_maps: # Not all 5 map slots are filled.
+                        say("^2[RTV] ^7Rock the vote is currently disabled. Time remaining: %s"
+                            % (calculate_time(current_time, status.times[0])))
 
-                    available_maps = config.maps
-                    available_secondary_maps = []
-                    current_time = time()
+                      else:
 
-                    if config.pick_secondary_maps == 2:
+                        say("^2[RTV] ^7Rock the vote is temporarily disabled.")
+                        
+                    else:
 
-                      available_maps += config.secondary_maps
+                      available_maps = config.maps
 
-                    elif config.pick_secondary_maps:
+                      if config.pick_secondary_maps:
 
-                      available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
-                                                  if (mapname not in nominated_maps and
-                                                      lower(mapname) != current_map and
-                                                      recently_played[lower(mapname)] <= current_time)]
+                        available_maps += config.secondary_maps
 
-                    available_maps = [mapname for mapname in iter(available_maps)
-                                      if (mapname not in nominated_maps and
-                                          lower(mapname) != current_map and
-                                          recently_played[lower(mapname)] <= current_time)]
-                    
-                    if missing_maps == 5 and not available_maps and not available_secondary_maps:
+                      available_maps = (lower(mapname) for mapname in iter(available_maps))
+                      available_maps = sum((True for mapname in available_maps
+                                            if (mapname != current_map and
+                                                recently_played[mapname] <= current_time)))
+                      available_maps += len(nomination_order)
 
-                      svsay("^2[Timelimit] ^7Timelimit voting failed to start! No map is currently available.")
-                      print("CONSOLE: (%s) [Timelimit] Timelimit voting failed to start! No map is currently available."
-                            % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                      players = dict((player_id, [timer, False, rtm_vote, None, None])
-                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
-                                     players_items()) # Reset RTV votes.
+                      if not available_maps:
+
+                        say("^2[RTV] ^7Rock the vote is disabled because no map is currently available.")
+                        players = dict((player_id, [timer, False, rtm_vote, None, None])
+                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                       in players_items()) # Reset RTV votes.
+                        players_values = players.itervalues
+                        players_items = players.iteritems
+                          
+                      elif not players[player_id][1]:
+                          
+                        say("^2[RTV] ^7%s ^7didn't want to rock the vote yet (%i/%i)."
+                            % (player_name,
+                               sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                    in players_values())),
+                               rtv_players))
+                          
+                      else:
+
+                        players[player_id][1] = False
+                        svsay("^2[RTV] ^7%s ^7no longer wants to rock the vote (%i/%i)."
+                              % (player_name,
+                                 sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                      in players_values())),
+                                 rtv_players))
+
+                    players[player_id][0] = (current_time + config.flood_protection)
+
+                  elif msg in ("rtm", "!rtm"):
+
+                    if not config.rtm:
+
+                      say("^2[RTM] ^7Rock the mode is unavailable.")
+
+                    elif not status.rtm:
+
+                      if isinstance(status.times[1], float):
+
+                        say("^2[RTM] ^7Rock the mode is currently disabled. Time remaining: %s"
+                            % (calculate_time(current_time, status.times[1])))
+
+                      else:
+
+                        say("^2[RTM] ^7Rock the mode is temporarily disabled.")
+
+                    elif not [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]:
+
+                      say("^2[RTV] ^7Rock the mode is disabled because no mode is currently available.")
+                      players = dict((player_id, [timer, rtv_vote, False, nomination, None])
+                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                     in players_items()) # Reset RTM votes.
                       players_values = players.itervalues
                       players_items = players.iteritems
-                      continue
+                        
+                    elif players[player_id][2]:
+                          
+                      say("^2[RTM] ^7%s ^7already wanted to rock the mode (%i/%i)."
+                          % (player_name,
+                             sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                  in players_values())),
+                             rtm_players))
+                          
+                    else:
 
-                    append_map = voting_maps.append
-                    remove_map = available_maps.remove
+                      players[player_id][2] = check_votes = True
+                      svsay("^2[RTM] ^7%s ^7wants to rock the mode (%i/%i)."
+                            % (player_name,
+                               sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                    in players_values())),
+                               rtm_players))
 
-                    try:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      for i in xrange(missing_maps):
+                  elif msg in ("unrtm", "!unrtm"):
 
-# Fill any remaining map slots with random maps.
+                    if not config.rtm:
 
-                        mapname = choice(available_maps)
-                        append_map(((config.map_priority[0] if mapname in config.maps else config.map_priority[1]),
-                                    mapname))
-                        remove_map(mapname)
+                      say("^2[RTM] ^7Rock the mode is unavailable.")                    
 
-                    except IndexError: # Not enough maps to fill all 5 slots.
+                    elif not status.rtm:
 
-                      if available_secondary_maps: # Fill with secondary maps if we have no new
-                                                   # primary map to use.
-                        remove_map = available_secondary_maps.remove
+                      if isinstance(status.times[1], float):
 
-                        try:
-                        
-                          for i in xrange((5 - len(voting_maps))):
+                        say("^2[RTM] ^7Rock the mode is currently disabled. Time remaining: %s"
+                            % (calculate_time(current_time, status.times[1])))
 
-# Fill any remaining map slots with random secondary maps.
+                      else:
 
-                            mapname = choice(available_secondary_maps)
-                            append_map((config.map_priority[1], mapname))
-                            remove_map(mapname)
+                        say("^2[RTM] ^7Rock the mode is temporarily disabled.")
 
-                        except IndexError: # Not enough maps to fill remaining slots.
+                    elif not [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]:
 
-                          pass
+                      say("^2[RTV] ^7Rock the mode is disabled because no mode is currently available.")
+                      players = dict((player_id, [timer, rtv_vote, False, nomination, None])
+                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                     in players_items()) # Reset RTM votes.
+                      players_values = players.itervalues
+                      players_items = players.iteritems
 
-# Create voting options.
+                    elif not players[player_id][2]:
+                          
+                      say("^2[RTM] ^7%s ^7didn't want to rock the mode yet (%i/%i)."
+                          % (player_name,
+                             sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                  in players_values())),
+                             rtm_players))
+                          
+                    else:
 
-                  votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
-                                       for i in xrange(len(voting_maps)))
+                      players[player_id][2] = False
+                      svsay("^2[RTM] ^7%s ^7no longer wants to rock the mode (%i/%i)."
+                            % (player_name,
+                               sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                    in players_values())),
+                               rtm_players))
 
-                  if (config.limit_extend[0] == 2 or
-                      (config.limit_extend[0] == 1 and gameinfo["map"][1] < config.limit_extend[1])):
-          
-                    votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
-                  
-                  votes_values = votes.itervalues
-                  votes_items = votes.sorteditems
-                  voting_name = "Timelimit"
-                  voting_type = "map"
-                  voting_method, voting_countdown = config.limit_voting
-                  voting_minimum_votes = config.limit_minimum_votes
-                  voting_wait_time = 0
-                  voting_s_wait_time = config.limit_s_wait_time
-                  voting_f_wait_time = config.limit_f_wait_time
-                  voting_skip_voting = config.limit_skip_voting
-                  voting_second_turn = config.limit_second_turn
-                  voting_change_immediately = config.limit_change_immediately
-                  status.rtv = status.rtm = voting_instructions = start_voting = True
-
-              elif not recover: # Standard commands.
-
-                line = split(line, ":", 2)
-
-                if len(line) == 3 and isdigit(line[0]) and line[1] in (" say", " sayteam"):
-
-                  player_id = int(line[0])
-                  player_name, original_msg = split(line[2], '"', 1)
-                  player_name = player_name[1:-2]
-                  original_msg = strip(remove_color(original_msg[:-1]))
-                  msg = lower(original_msg)
-                  current_time = time()
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                  if players[player_id][0] <= current_time: # Flood protection.
+                  elif msg in ("nominate", "!nominate"):
 
-                    if msg in ("rtv", "!rtv"):
+                    if not config.maps:
 
-                      if not config.rtv:
+                      say("^2[Voting] ^7Map voting is unavailable.")
+                            
+                    elif config.nomination_type is None:
 
-                        say("^2[RTV] ^7Rock the vote is unavailable.")
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                      elif not status.rtv:
+                    else:
 
-                        if isinstance(status.times[0], float):
+                      say("^2[Nominate] ^7Usage: %s mapname" % (original_msg))
 
-                          say("^2[RTV] ^7Rock the vote is currently disabled. Time remaining: %s"
-                              % (calculate_time(current_time, status.times[0])))
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                        else:
+                  elif startswith(msg, "nominate ") or startswith(msg, "!nominate "):
 
-                          say("^2[RTV] ^7Rock the vote is temporarily disabled.")
-                        
-                      else:
+                    if not config.maps:
 
-                        available_maps = config.maps
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                        if config.pick_secondary_maps:
+                    elif config.nomination_type is None:
 
-                          available_maps += config.secondary_maps
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                        available_maps = (lower(mapname) for mapname in iter(available_maps))
-                        available_maps = sum((True for mapname in available_maps
-                                              if (mapname != current_map and
-                                                  recently_played[mapname] <= current_time)))
-                        available_maps += len(nomination_order)
+                    else:
 
-                        if not available_maps:
+                      nominated_map = lstrip(msg[9:])
+                      compare_map = config.map_catalog.get(nominated_map) # Look up nominated mapname in both map lists.
+                      nominated_maps = [nomination
+                                        for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                        in players_values() if nomination]
+
+                      if config.nomination_type:
+
+                        if not compare_map:
+
+                          say("^2[Nominate] ^7Invalid map. Please use <!>maplist or <!>search expression.")
+
+                        elif nominated_map == current_map:
+
+                          say("^2[Nominate] ^7%s cannot be nominated (current map)."
+                              % (compare_map[0]))
+
+                        elif recently_played[nominated_map] > current_time:
+
+                          say("^2[Nominate] ^7%s cannot be nominated (recently played) (%s left)."
+                              % (compare_map[0], calculate_time(current_time, recently_played[nominated_map])))
 
-                          say("^2[RTV] ^7Rock the vote is disabled because no map is currently available.")
-                          players = dict((player_id, [timer, False, rtm_vote, None, None])
-                                         for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                         in players_items()) # Reset RTV votes.
-                          players_values = players.itervalues
-                          players_items = players.iteritems
-                          
-                        elif players[player_id][1]:
-                          
-                          say("^2[RTV] ^7%s ^7already wanted to rock the vote (%i/%i)."
-                              % (player_name,
-                                 sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                      in players_values())),
-                                 rtv_players))
-                          
                         else:
 
-                          players[player_id][1] = check_votes = True
-                          svsay("^2[RTV] ^7%s ^7wants to rock the vote (%i/%i)."
-                                % (player_name,
-                                   sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                        in players_values())),
-                                   rtv_players))
+                          nominations = count(nominated_maps, compare_map[0])
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                          if players[player_id][3] == compare_map[0]:
 
-                    elif msg in ("unrtv", "!unrtv"):
+                            say("^2[Nominate] ^7%s ^7already nominated %s (%i nomination%s)."
+                                % (player_name, compare_map[0], nominations,
+                                   ("" if nominations == 1 else "s")))
 
-                      if not config.rtv:
+                          else:
 
-                        say("^2[RTV] ^7Rock the vote is unavailable.")
+                            nominations += 1
 
-                      elif not status.rtv:
+                            if players[player_id][3]:
 
-                        if isinstance(status.times[0], float):
+                              remove_nomination(player_id)
+                              svsay("^2[Nominate] ^7%s ^7nomination changed to %s (%i nomination%s)."
+                                    % (player_name, compare_map[0], nominations,
+                                       ("" if nominations == 1 else "s")))
 
-                          say("^2[RTV] ^7Rock the vote is currently disabled. Time remaining: %s"
-                              % (calculate_time(current_time, status.times[0])))
+                            else:
 
-                        else:
+                              svsay("^2[Nominate] ^7%s ^7nominated %s (%i nomination%s)!"
+                                    % (player_name, compare_map[0], nominations,
+                                       ("" if nominations == 1 else "s")))
 
-                          say("^2[RTV] ^7Rock the vote is temporarily disabled.")
-                        
-                      else:
+                            players[player_id][3] = compare_map[0]
+                            add_nomination(player_id)
 
-                        available_maps = config.maps
+                      elif len(nominated_maps) < 5 or players[player_id][3]:
 
-                        if config.pick_secondary_maps:
+                        if not compare_map:
 
-                          available_maps += config.secondary_maps
+                          say("^2[Nominate] ^7Invalid map. Please use <!>maplist or <!>search expression.")
 
-                        available_maps = (lower(mapname) for mapname in iter(available_maps))
-                        available_maps = sum((True for mapname in available_maps
-                                              if (mapname != current_map and
-                                                  recently_played[mapname] <= current_time)))
-                        available_maps += len(nomination_order)
+                        elif nominated_map == current_map:
 
-                        if not available_maps:
+                          say("^2[Nominate] ^7%s cannot be nominated (current map)."
+                              % (compare_map[0]))
+
+                        elif recently_played[nominated_map] > current_time:
+
+                          say("^2[Nominate] ^7%s cannot be nominated (recently played) (%s left)."
+                              % (compare_map[0], calculate_time(current_time, recently_played[nominated_map])))
+
+                        elif compare_map[0] in nominated_maps:
+
+                          say("^2[Nominate] ^7%s cannot be nominated (already nominated)."
+                              % (compare_map[0]))
 
-                          say("^2[RTV] ^7Rock the vote is disabled because no map is currently available.")
-                          players = dict((player_id, [timer, False, rtm_vote, None, None])
-                                         for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                         in players_items()) # Reset RTV votes.
-                          players_values = players.itervalues
-                          players_items = players.iteritems
-                          
-                        elif not players[player_id][1]:
-                          
-                          say("^2[RTV] ^7%s ^7didn't want to rock the vote yet (%i/%i)."
-                              % (player_name,
-                                 sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                      in players_values())),
-                                 rtv_players))
-                          
                         else:
 
-                          players[player_id][1] = False
-                          svsay("^2[RTV] ^7%s ^7no longer wants to rock the vote (%i/%i)."
-                                % (player_name,
-                                   sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                        in players_values())),
-                                   rtv_players))
+                          if players[player_id][3]:
+
+                            remove_nomination(player_id)
+                            svsay("^2[Nominate] ^7%s ^7nomination changed to %s."
+                                  % (player_name, compare_map[0]))
+
+                          else:
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                            svsay("^2[Nominate] ^7%s ^7nominated %s!"
+                                  % (player_name, compare_map[0]))
 
-                    elif msg in ("rtm", "!rtm"):
+                          players[player_id][3] = compare_map[0]
+                          add_nomination(player_id)
 
-                      if not config.rtm:
+                      else:
 
-                        say("^2[RTM] ^7Rock the mode is unavailable.")
+                        say("^2[Nominate] ^7Maximum number of nominations (5) reached.")
+                                          
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      elif not status.rtm:
+                  elif msg in ("revoke", "!revoke"):
 
-                        if isinstance(status.times[1], float):
+                    if not config.maps:
 
-                          say("^2[RTM] ^7Rock the mode is currently disabled. Time remaining: %s"
-                              % (calculate_time(current_time, status.times[1])))
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                        else:
+                    elif config.nomination_type is None:
 
-                          say("^2[RTM] ^7Rock the mode is temporarily disabled.")
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                      elif not [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]:
+                    elif not players[player_id][3]:
+
+                      say("^2[Revoke] ^7%s ^7has no nominated map." %
+                          (player_name))
+
+                    else:
+
+                      if config.nomination_type:
+
+                        nominations = (count([nomination
+                                              for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                              in players_values()], players[player_id][3]) - 1)
+                        svsay("^2[Revoke] ^7%s ^7nomination to %s was revoked (%i nomination%s)." %
+                              (player_name, players[player_id][3], nominations,
+                               ("" if nominations == 1 else "s")))
 
-                        say("^2[RTV] ^7Rock the mode is disabled because no mode is currently available.")
-                        players = dict((player_id, [timer, rtv_vote, False, nomination, None])
-                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                       in players_items()) # Reset RTM votes.
-                        players_values = players.itervalues
-                        players_items = players.iteritems
-                        
-                      elif players[player_id][2]:
-                          
-                        say("^2[RTM] ^7%s ^7already wanted to rock the mode (%i/%i)."
-                            % (player_name,
-                               sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                    in players_values())),
-                               rtm_players))
-                          
                       else:
 
-                        players[player_id][2] = check_votes = True
-                        svsay("^2[RTM] ^7%s ^7wants to rock the mode (%i/%i)."
-                              % (player_name,
-                                 sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                      in players_values())),
-                                 rtm_players))
+                        svsay("^2[Revoke] ^7%s ^7nomination revoked!" %
+                              (player_name))
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                      players[player_id][3] = None
+                      remove_nomination(player_id)
 
-                    elif msg in ("unrtm", "!unrtm"):
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      if not config.rtm:
+                  elif msg in ("maplist", "!maplist"):
 
-                        say("^2[RTM] ^7Rock the mode is unavailable.")                    
+                    if not config.maps:
 
-                      elif not status.rtm:
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                        if isinstance(status.times[1], float):
+                    elif config.nomination_type is None:
 
-                          say("^2[RTM] ^7Rock the mode is currently disabled. Time remaining: %s"
-                              % (calculate_time(current_time, status.times[1])))
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                        else:
+                    else:
+
+                      sorted_maps = iter(sorted((mapname for mapname in iter(config.map_catalog.names)
+                                                 if (lower(mapname) != current_map and
+                                                     recently_played[lower(mapname)] <= current_time)),
+                                                key=lower)) # Create an alphanumeric sorted map list.
+
+                      if not config.nomination_type: # Remove nominated maps.
+                          
+                        nominated_maps = [nomination
+                                          for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                          in players_values() if nomination]
+                        sorted_maps = (mapname for mapname in sorted_maps if mapname not in nominated_maps)
+
+# Create split lists for display in the server based on a maximum of MAPLIST_MAX_SIZE bytes per
+# list string.
 
-                          say("^2[RTM] ^7Rock the mode is temporarily disabled.")
+                      maplist = {1: []}
+                      append_map = maplist[1].append
+                      maplist_number = 1
+                      maplist_length = 16
 
-                      elif not [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]:
+                      for mapname in sorted_maps:
 
-                        say("^2[RTV] ^7Rock the mode is disabled because no mode is currently available.")
-                        players = dict((player_id, [timer, rtv_vote, False, nomination, None])
-                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                       in players_items()) # Reset RTM votes.
-                        players_values = players.itervalues
-                        players_items = players.iteritems
+                        maplist_length += len(mapname)
 
-                      elif not players[player_id][2]:
-                          
-                        say("^2[RTM] ^7%s ^7didn't want to rock the mode yet (%i/%i)."
-                            % (player_name,
-                               sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                    in players_values())),
-                               rtm_players))
-                          
-                      else:
+                        if maplist_length > MAPLIST_MAX_SIZE:
 
-                        players[player_id][2] = False
-                        svsay("^2[RTM] ^7%s ^7no longer wants to rock the mode (%i/%i)."
-                              % (player_name,
-                                 sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                      in players_values())),
-                                 rtm_players))
+                          maplist_number += 1
+                          maplist[maplist_number] = []
+                          append_map = maplist[maplist_number].append
+                          maplist_length = (15 + len(str(maplist_number)) + len(mapname))
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                        maplist_length += 2
+                        append_map(mapname)
 
-                    elif msg in ("nominate", "!nominate"):
+                      if not maplist[1]:
 
-                      if not config.maps:
+                        say("^2[Maplist] ^7No map is currently available for nomination.")
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
-                            
-                      elif config.nomination_type is None:
+                      elif len(maplist) > 1:
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+                        say("^2[Maplist] ^7Usage: %s number (Available map lists: %i)" %
+                            (original_msg, len(maplist)))
 
                       else:
+                          
+                        say("^2[Maplist] ^7%s" % (join(", ", maplist[1])))
 
-                        say("^2[Nominate] ^7Usage: %s mapname" % (original_msg))
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                  elif startswith(msg, "maplist ") or startswith(msg, "!maplist "):
 
-                    elif startswith(msg, "nominate ") or startswith(msg, "!nominate "):
+                    if not config.maps:
 
-                      if not config.maps:
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                    elif config.nomination_type is None:
 
-                      elif config.nomination_type is None:
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+                    else:
 
-                      else:
+                      sorted_maps = iter(sorted((mapname for mapname in iter(config.map_catalog.names)
+                                                 if (lower(mapname) != current_map and
+                                                     recently_played[lower(mapname)] <= current_time)),
+                                                key=lower)) # Create an alphanumeric sorted map list.
 
-                        nominated_map = lstrip(msg[9:])
-                        compare_map = [mapname for mapname in iter(config.maps + config.secondary_maps)
-                                       if lower(mapname) == nominated_map] # Compare nominated mapname against both map lists.
+                      if not config.nomination_type: # Remove nominated maps.
+                          
                         nominated_maps = [nomination
                                           for (timer, rtv_vote, rtm_vote, nomination, vote_option)
                                           in players_values() if nomination]
+                        sorted_maps = (mapname for mapname in sorted_maps if mapname not in nominated_maps)
 
-                        if config.nomination_type:
+# Create split lists for display in the server based on a maximum of MAPLIST_MAX_SIZE bytes per
+# list string.
 
-                          if not compare_map:
+                      maplist = {1: []}
+                      append_map = maplist[1].append
+                      maplist_number = 1
+                      maplist_length = 16
 
-                            say("^2[Nominate] ^7Invalid map. Please use <!>maplist or <!>search expression.")
+                      for mapname in sorted_maps:
 
-                          elif nominated_map == current_map:
+                        maplist_length += len(mapname)
 
-                            say("^2[Nominate] ^7%s cannot be nominated (current map)."
-                                % (compare_map[0]))
+                        if maplist_length > MAPLIST_MAX_SIZE:
 
-                          elif recently_played[nominated_map] > current_time:
+                          maplist_number += 1
+                          maplist[maplist_number] = []
+                          append_map = maplist[maplist_number].append
+                          maplist_length = (15 + len(str(maplist_number)) + len(mapname))
 
-                            say("^2[Nominate] ^7%s cannot be nominated (recently played) (%s left)."
-                                % (compare_map[0], calculate_time(current_time, recently_played[nominated_map])))
+                        maplist_length += 2
+                        append_map(mapname)
 
-                          else:
+                      if not maplist[1]:
 
-                            nominations = count(nominated_maps, compare_map[0])
+                        say("^2[Maplist] ^7No map is currently available for nomination.")
 
-                            if players[player_id][3] == compare_map[0]:
+                      else:
 
-                              say("^2[Nominate] ^7%s ^7already nominated %s (%i nomination%s)."
-                                  % (player_name, compare_map[0], nominations,
-                                     ("" if nominations == 1 else "s")))
+                        try:
+                            
+                          maplist_number = int(msg[8:])
+                          say("^2[Maplist %i] ^7%s" % (maplist_number, join(", ", maplist[maplist_number])))
 
-                            else:
+                        except (ValueError, KeyError):
 
-                              nominations += 1
+                          say("^2[Maplist] ^7Invalid map list number (Available map lists: %i)."
+                              % (len(maplist)))
 
-                              if players[player_id][3]:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                                remove_nomination(player_id)
-                                svsay("^2[Nominate] ^7%s ^7nomination changed to %s (%i nomination%s)."
-                                      % (player_name, compare_map[0], nominations,
-                                         ("" if nominations == 1 else "s")))
+                  elif msg in ("search", "!search"):
 
-                              else:
+                    if not config.maps:
 
-                                svsay("^2[Nominate] ^7%s ^7nominated %s (%i nomination%s)!"
-                                      % (player_name, compare_map[0], nominations,
-                                         ("" if nominations == 1 else "s")))
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                              players[player_id][3] = compare_map[0]
-                              add_nomination(player_id)
+                    elif config.nomination_type is None:
 
-                        elif len(nominated_maps) < 5 or players[player_id][3]:
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                          if not compare_map:
+                    else:
 
-                            say("^2[Nominate] ^7Invalid map. Please use <!>maplist or <!>search expression.")
+                      say("^2[Search] ^7Usage: %s expression" % (original_msg))
 
-                          elif nominated_map == current_map:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                            say("^2[Nominate] ^7%s cannot be nominated (current map)."
-                                % (compare_map[0]))
+                  elif startswith(msg, "search ") or startswith(msg, "!search "):
 
-                          elif recently_played[nominated_map] > current_time:
+                    if not config.maps:
 
-                            say("^2[Nominate] ^7%s cannot be nominated (recently played) (%s left)."
-                                % (compare_map[0], calculate_time(current_time, recently_played[nominated_map])))
+                      say("^2[Voting] ^7Map voting is unavailable.")
 
-                          elif compare_map[0] in nominated_maps:
+                    elif config.nomination_type is None:
 
-                            say("^2[Nominate] ^7%s cannot be nominated (already nominated)."
-                                % (compare_map[0]))
+                      say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
 
-                          else:
+                    else:
 
-                            if players[player_id][3]:
+                      search_expression = lstrip(msg[7:])
 
-                              remove_nomination(player_id)
-                              svsay("^2[Nominate] ^7%s ^7nomination changed to %s."
-                                    % (player_name, compare_map[0]))
+                      if search_expression != "*": # No wildcard.
+                                                   # Search for given expression.
+                        maplist = [mapname for mapname in iter(config.map_catalog.names)
+                                   if search_expression in lower(mapname)]
 
-                            else:
+                      else:
 
-                              svsay("^2[Nominate] ^7%s ^7nominated %s!"
-                                    % (player_name, compare_map[0]))
+                        maplist = list(config.map_catalog.names)
 
-                            players[player_id][3] = compare_map[0]
-                            add_nomination(player_id)
+                      if not maplist:
 
-                        else:
+                        say("^2[Search] ^7No matches found for expression ''%s''."
+                            % (lstrip(original_msg[7:])))
 
-                          say("^2[Nominate] ^7Maximum number of nominations (5) reached.")
-                                          
-                      players[player_id][0] = (current_time + config.flood_protection)
+                      else:
 
-                    elif msg in ("revoke", "!revoke"):
+                        sort(maplist, key=lower)
+                        maplist = join(", ", maplist)
 
-                      if not config.maps:
+                        if (len(maplist) + 13) > MAPLIST_MAX_SIZE:
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                          say("^2[Search] ^7Result for expression ''%s'' is too long (greater than %i characters)." %
+                              (lstrip(original_msg[7:]), MAPLIST_MAX_SIZE))
 
-                      elif config.nomination_type is None:
+                        else:
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+                          say("^2[Search] ^7%s" % (maplist))
 
-                      elif not players[player_id][3]:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                        say("^2[Revoke] ^7%s ^7has no nominated map." %
-                            (player_name))
+                  elif msg in ("elapsed", "!elapsed"):
 
-                      else:
+                    say("^2[Elapsed] ^7Usage: %s map/mode" % (original_msg))
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                        if config.nomination_type:
+                  elif startswith(msg, "elapsed ") or startswith(msg, "!elapsed "):
 
-                          nominations = (count([nomination
-                                                for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                                in players_values()], players[player_id][3]) - 1)
-                          svsay("^2[Revoke] ^7%s ^7nomination to %s was revoked (%i nomination%s)." %
-                                (player_name, players[player_id][3], nominations,
-                                 ("" if nominations == 1 else "s")))
+                    elapse = lstrip(msg[8:])
 
-                        else:
+                    try:
 
-                          svsay("^2[Revoke] ^7%s ^7nomination revoked!" %
-                                (player_name))
+                      say("^2[Elapsed] ^7Time elapsed for the current %s: %s%s" %
+                          (elapse, calculate_time(gameinfo[elapse][0], current_time),
+                           (" (%i extension%s)" % (gameinfo[elapse][1],
+                                                   ("" if gameinfo[elapse][1] == 1 else "s"))
+                            if gameinfo[elapse][1] else "")))
 
-                        players[player_id][3] = None
-                        remove_nomination(player_id)
+                    except KeyError:
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                      say("^2[Elapsed] ^7Incorrect format (map/mode).")
 
-                    elif msg in ("maplist", "!maplist"):
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      if not config.maps:
+                  elif msg in ("nextgame", "!nextgame"):
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                    say("^2[Nextgame] ^7No next game is set.")
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                      elif config.nomination_type is None:
+          elif not voting_instructions and not start_second_turn and not recover:
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+            if event_type is Say:
 
-                      else:
+              player_id = event.player_id
+              original_msg = strip(remove_color(event.text))
+              msg = lower(original_msg)
 
-                        sorted_maps = iter(sorted((mapname for mapname in iter(config.maps + config.secondary_maps)
-                                                   if (lower(mapname) != current_map and
-                                                       recently_played[lower(mapname)] <= current_time)),
-                                                  key=lower)) # Create an alphanumeric sorted map list.
+              if not change_instructions: # Voting related commands.
 
-                        if not config.nomination_type: # Remove nominated maps.
-                          
-                          nominated_maps = [nomination
-                                            for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                            in players_values() if nomination]
-                          sorted_maps = (mapname for mapname in sorted_maps if mapname not in nominated_maps)
+                if startswith(msg, "!") and isdigit(msg[1:]):
 
-# Create split lists for display in the server based on a maximum of MAPLIST_MAX_SIZE bytes per
-# list string.
+                  vote = int(msg[1:])
 
-                        maplist = {1: []}
-                        append_map = maplist[1].append
-                        maplist_number = 1
-                        maplist_length = 16
+                  try:
 
-                        for mapname in sorted_maps:
+                    votes[vote][0] += 1 # Add +1 to whichever option the player voted for.
+                      
+                  except KeyError:
 
-                          maplist_length += len(mapname)
+                    pass
 
-                          if maplist_length > MAPLIST_MAX_SIZE:
+                  else:
 
-                            maplist_number += 1
-                            maplist[maplist_number] = []
-                            append_map = maplist[maplist_number].append
-                            maplist_length = (15 + len(str(maplist_number)) + len(mapname))
+                    if players[player_id][4]: # Vote change.
 
-                          maplist_length += 2
-                          append_map(mapname)
+                      votes[players[player_id][4]][0] -= 1 # Remove -1 from whichever option the player
+                                                           # previously voted for.
+                    players[player_id][4] = vote
 
-                        if not maplist[1]:
+                elif msg in ("unvote", "!unvote"):
 
-                          say("^2[Maplist] ^7No map is currently available for nomination.")
+                  try:
 
-                        elif len(maplist) > 1:
+                    votes[players[player_id][4]][0] -= 1 # Remove -1 from whichever option the player
+                                                         # voted for.
+                  except KeyError:
 
-                          say("^2[Maplist] ^7Usage: %s number (Available map lists: %i)" %
-                              (original_msg, len(maplist)))
+                    pass
 
-                        else:
-                          
-                          say("^2[Maplist] ^7%s" % (join(", ", maplist[1])))
+                  else:
+                        
+                    players[player_id][4] = None
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+              elif change_instructions is not True:
 
-                    elif startswith(msg, "maplist ") or startswith(msg, "!maplist "):
+                current_time = time()
 
-                      if not config.maps:
+                if players[player_id][0] <= current_time: # Flood protection.
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                  if msg in ("elapsed", "!elapsed"):
 
-                      elif config.nomination_type is None:
+                    say("^2[Elapsed] ^7Usage: %s map/mode" % (original_msg))
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+                  elif startswith(msg, "elapsed ") or startswith(msg, "!elapsed "):
 
-                      else:
+                    elapse = lstrip(msg[8:])
 
-                        sorted_maps = iter(sorted((mapname for mapname in iter(config.maps + config.secondary_maps)
-                                                   if (lower(mapname) != current_map and
-                                                       recently_played[lower(mapname)] <= current_time)),
-                                                  key=lower)) # Create an alphanumeric sorted map list.
+                    try:
 
-                        if not config.nomination_type: # Remove nominated maps.
-                          
-                          nominated_maps = [nomination
-                                            for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                            in players_values() if nomination]
-                          sorted_maps = (mapname for mapname in sorted_maps if mapname not in nominated_maps)
+                      say("^2[Elapsed] ^7Time elapsed for the current %s: %s%s" %
+                          (elapse, calculate_time(gameinfo[elapse][0], current_time),
+                           (" (%i extension%s)" % (gameinfo[elapse][1],
+                                                   ("" if gameinfo[elapse][1] == 1 else "s"))
+                            if gameinfo[elapse][1] else "")))
 
-# Create split lists for display in the server based on a maximum of MAPLIST_MAX_SIZE bytes per
-# list string.
+                    except KeyError:
 
-                        maplist = {1: []}
-                        append_map = maplist[1].append
-                        maplist_number = 1
-                        maplist_length = 16
+                      say("^2[Elapsed] ^7Incorrect format (map/mode).")
 
-                        for mapname in sorted_maps:
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                          maplist_length += len(mapname)
+                  elif msg in ("nextgame", "!nextgame"):
 
-                          if maplist_length > MAPLIST_MAX_SIZE:
+                    say("^2[Nextgame] ^7Next %s: %s" %
+                        (voting_type,
+                         (change_instructions[0] if voting_type == "map" else
+                          gamemodes[change_instructions[0]])))
+                    players[player_id][0] = (current_time + config.flood_protection)
 
-                            maplist_number += 1
-                            maplist[maplist_number] = []
-                            append_map = maplist[maplist_number].append
-                            maplist_length = (15 + len(str(maplist_number)) + len(mapname))
+          if check_votes:
 
-                          maplist_length += 2
-                          append_map(mapname)
+            check_votes = False
 
-                        if not maplist[1]:
+            if (sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                     in players_values())) >= rtv_players): # Start a RTV voting.
 
-                          say("^2[Maplist] ^7No map is currently available for nomination.")
+              nominated_maps = [nomination
+                                for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                                in players_values() if nomination]
 
-                        else:
+              if config.nomination_type:
 
-                          try:
-                            
-                            maplist_number = int(msg[8:])
-                            say("^2[Maplist %i] ^7%s" % (maplist_number, join(", ", maplist[maplist_number])))
+                map_duplicates = defaultdict(bool)
+                voting_maps = [(count(nominated_maps, players[player_id][3]),
+                                config.map_catalog.priority(players[player_id][3]),
+                                players[player_id][3])
+                               for player_id in iter(nomination_order)
+                               if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
+                                   not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
+                sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
 
-                          except (ValueError, KeyError):
+                while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
 
-                            say("^2[Maplist] ^7Invalid map list number (Available map lists: %i)."
-                                % (len(maplist)))
+                  min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
+                                         iter(voting_maps)))
+                  compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
+                                         iter(voting_maps) if nomination_count == min_nominations]
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                  if (len(voting_maps) - len(compare_nominations)) >= 5:
 
-                    elif msg in ("search", "!search"):
+                    voting_maps[:] = voting_maps[:-len(compare_nominations)]
 
-                      if not config.maps:
+                  else: # Compare maps with the map priority system
+                        # to define which maps remain.
+                    for i in xrange(3):
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                      decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
 
-                      elif config.nomination_type is None:
+                      if not decrease_maps:
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+                        break
+                        
+                      filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
+                                              if priority == i] # Map priority.
 
-                      else:
+                      if filtered_nominations:
 
-                        say("^2[Search] ^7Usage: %s expression" % (original_msg))
+                        if len(filtered_nominations) > decrease_maps:
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                          filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
 
-                    elif startswith(msg, "search ") or startswith(msg, "!search "):
+                        voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
+                                       in iter(voting_maps)
+                                       if nomination not in filtered_nominations]
 
-                      if not config.maps:
+                voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
+                  
+              else:
 
-                        say("^2[Voting] ^7Map voting is unavailable.")
+                voting_maps = [(config.map_catalog.priority(players[player_id][3]),
+                                players[player_id][3])
+                               for player_id in iter(nomination_order)]
 
-                      elif config.nomination_type is None:
+              missing_maps = (5 - len(voting_maps))
 
-                        say("^2[Nominate] ^7Map nomination is unavailable because the number of maps is less than or equal 5.")
+              if missing_maps: # Not all 5 map slots are filled.
 
-                      else:
+                available_maps = config.maps
+                available_secondary_maps = []
+                current_time = time()
 
-                        search_expression = lstrip(msg[7:])
+                if config.pick_secondary_maps == 2:
 
-                        if search_expression != "*": # No wildcard.
-                                                     # Search for given expression.
-                          maplist = [mapname for mapname in iter(config.maps + config.secondary_maps)
-                                     if search_expression in lower(mapname)]
+                  available_maps += config.secondary_maps
 
-                        else:
+                elif config.pick_secondary_maps:
 
-                          maplist = list(config.maps + config.secondary_maps)
+                  available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
+                                              if (mapname not in nominated_maps and
+                                                  lower(mapname) != current_map and
+                                                  recently_played[lower(mapname)] <= current_time)]
 
-                        if not maplist:
+                available_maps = [mapname for mapname in iter(available_maps)
+                                  if (mapname not in nominated_maps and
+                                      lower(mapname) != current_map and
+                                      recently_played[lower(mapname)] <= current_time)]
+                  
+                if missing_maps == 5 and not available_maps and not available_secondary_maps:
 
-                          say("^2[Search] ^7No matches found for expression ''%s''."
-                              % (lstrip(original_msg[7:])))
+                  svsay("^2[RTV] ^7Rock the vote failed to start! No map is currently available.")
+                  print("CONSOLE: (%s) [RTV] Rock the vote failed to start! No map is currently available."
+                        % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                  players = dict((player_id, [timer, False, rtm_vote, None, None])
+                                 for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
+                                 players_items()) # Reset RTV votes.
+                  players_values = players.itervalues
+                  players_items = players.iteritems
 
-                        else:
+                  if (sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                           in players_values())) >= rtm_players): # Make sure RTM is checked even
+                                                                  # if RTV failed to start.
+                    voting_modes = [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]
 
-                          sort(maplist, key=lower)
-                          maplist = join(", ", maplist)
+                    if not voting_modes:
 
-                          if (len(maplist) + 13) > MAPLIST_MAX_SIZE:
+                      svsay("^2[RTM] ^7Rock the mode failed to start! No mode is currently available.")
+                      print("CONSOLE: (%s) [RTM] Rock the mode failed to start! No mode is currently available."
+                            % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                      players = dict((player_id, [timer, rtv_vote, False, nomination, None])
+                                     for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                                     in players_items()) # Reset RTM votes.
+                      players_values = players.itervalues
+                      players_items = players.iteritems
 
-                            say("^2[Search] ^7Result for expression ''%s'' is too long (greater than %i characters)." %
-                                (lstrip(original_msg[7:]), MAPLIST_MAX_SIZE))
+                    else: # Create voting options.
+                      
+                      votes = SortableDict(((i+1), [0, config.mode_priority[voting_modes[i]], voting_modes[i], gamemodes[voting_modes[i]]])
+                                           for i in xrange(len(voting_modes)))
 
-                          else:
+                      if (config.rtm_extend[0] == 2 or
+                          (config.rtm_extend[0] == 1 and gameinfo["mode"][1] < config.rtm_extend[1])):
+          
+                        votes[(len(votes) + 1)] = [0, config.mode_priority[3], None, "Don't change"] # Add the "Don't change" option.
+                        
+                      votes_values = votes.itervalues
+                      votes_items = votes.sorteditems
+                      voting_name = "RTM"
+                      voting_type = "mode"
+                      voting_method, voting_countdown = config.rtm_voting
+                      voting_minimum_votes = config.rtm_minimum_votes
+                      voting_wait_time = 1
+                      voting_s_wait_time = config.rtm_s_wait_time
+                      voting_f_wait_time = config.rtm_f_wait_time
+                      voting_skip_voting = config.rtm_skip_voting
+                      voting_second_turn = config.rtm_second_turn
+                      voting_change_immediately = config.rtm_change_immediately
+                      status.rtv = status.rtm = voting_instructions = start_voting = True
+                    
+                  continue
 
-                            say("^2[Search] ^7%s" % (maplist))
+                append_map = voting_maps.append
+                remove_map = available_maps.remove
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                try:
 
-                    elif msg in ("elapsed", "!elapsed"):
+                  for i in xrange(missing_maps):
 
-                      say("^2[Elapsed] ^7Usage: %s map/mode" % (original_msg))
-                      players[player_id][0] = (current_time + config.flood_protection)
+# Fill any remaining map slots with random maps.
 
-                    elif startswith(msg, "elapsed ") or startswith(msg, "!elapsed "):
+                    mapname = choice(available_maps)
+                    append_map((config.map_catalog.priority(mapname),
+                                mapname))
+                    remove_map(mapname)
 
-                      elapse = lstrip(msg[8:])
+                except IndexError: # Not enough maps to fill all 5 slots.
 
-                      try:
+                  if available_secondary_maps: # Fill with secondary maps if we have no new
+                                               # primary map to use.
+                    remove_map = available_secondary_maps.remove
 
-                        say("^2[Elapsed] ^7Time elapsed for the current %s: %s%s" %
-                            (elapse, calculate_time(gameinfo[elapse][0], current_time),
-                             (" (%i extension%s)" % (gameinfo[elapse][1],
-                                                     ("" if gameinfo[elapse][1] == 1 else "s"))
-                              if gameinfo[elapse][1] else "")))
+                    try:
+                      
+                      for i in xrange((5 - len(voting_maps))):
 
-                      except KeyError:
+# Fill any remaining map slots with random secondary maps.
 
-                        say("^2[Elapsed] ^7Incorrect format (map/mode).")
+                        mapname = choice(available_secondary_maps)
+                        append_map((config.map_priority[1], mapname))
+                        remove_map(mapname)
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+                    except IndexError: # Not enough maps to fill remaining slots.
 
-                    elif msg in ("nextgame", "!nextgame"):
+                      pass
 
-                      say("^2[Nextgame] ^7No next game is set.")
-                      players[player_id][0] = (current_time + config.flood_protection)
+# Create voting options.
 
-            elif not voting_instructions and not start_second_turn and not recover:
+              votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
+                                   for i in xrange(len(voting_maps)))
 
-              line = split(line, ":", 2)
+              if (config.rtv_extend[0] == 2 or
+                  (config.rtv_extend[0] == 1 and gameinfo["map"][1] < config.rtv_extend[1])):
+          
+                votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
+                        
+              votes_values = votes.itervalues
+              votes_items = votes.sorteditems
+              voting_name = "RTV"
+              voting_type = "map"
+              voting_method, voting_countdown = config.rtv_voting
+              voting_minimum_votes = config.rtv_minimum_votes
+              voting_wait_time = 0
+              voting_s_wait_time = config.rtv_s_wait_time
+              voting_f_wait_time = config.rtv_f_wait_time
+              voting_skip_voting = config.rtv_skip_voting
+              voting_second_turn = config.rtv_second_turn
+              voting_change_immediately = config.rtv_change_immediately
+              status.rtv = status.rtm = voting_instructions = start_voting = True
+
+            elif (sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
+                       in players_values())) >= rtm_players): # Start a RTM voting.
+                
+              voting_modes = [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]
 
-              if len(line) == 3 and isdigit(line[0]) and line[1] in (" say", " sayteam"):
+              if not voting_modes:
 
-                player_id = int(line[0])
-                original_msg = strip(remove_color(line[2][(index(line[2], '"') + 1):-1]))
-                msg = lower(original_msg)
+                svsay("^2[RTM] ^7Rock the mode failed to start! No mode is currently available.")
+                print("CONSOLE: (%s) [RTM] Rock the mode failed to start! No mode is currently available."
+                      % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+                players = dict((player_id, [timer, rtv_vote, False, nomination, None])
+                               for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
+                               in players_items()) # Reset RTM votes.
+                players_values = players.itervalues
+                players_items = players.iteritems
 
-                if not change_instructions: # Voting related commands.
+              else: # Create voting options.
+                
+                votes = SortableDict(((i+1), [0, config.mode_priority[voting_modes[i]], voting_modes[i], gamemodes[voting_modes[i]]])
+                                     for i in xrange(len(voting_modes)))
 
-                  if startswith(msg, "!") and isdigit(msg[1:]):
+                if (config.rtm_extend[0] == 2 or
+                    (config.rtm_extend[0] == 1 and gameinfo["mode"][1] < config.rtm_extend[1])):
+          
+                  votes[(len(votes) + 1)] = [0, config.mode_priority[3], None, "Don't change"] # Add the "Don't change" option.
+                        
+                votes_values = votes.itervalues
+                votes_items = votes.sorteditems
+                voting_name = "RTM"
+                voting_type = "mode"
+                voting_method, voting_countdown = config.rtm_voting
+                voting_minimum_votes = config.rtm_minimum_votes
+                voting_wait_time = 1
+                voting_s_wait_time = config.rtm_s_wait_time
+                voting_f_wait_time = config.rtm_f_wait_time
+                voting_skip_voting = config.rtm_skip_voting
+                voting_second_turn = config.rtm_second_turn
+                voting_change_immediately = config.rtm_change_immediately
+                status.rtv = status.rtm = voting_instructions = start_voting = True
+  
+      if event is None:
 
-                    vote = int(msg[1:])
+        if handshake:
 
-                    try:
+          if handshake.done.is_set():
 
-                      votes[vote][0] += 1 # Add +1 to whichever option the player voted for.
-                      
-                    except KeyError:
+            print("CONSOLE: (%s) Server answered after %.1f seconds. Handling the %i events held meanwhile." %
+                  (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), (time() - handshake.started), len(held)))
+            handshake = None
+            injected.extend(drain(held))
 
-                      pass
+          else:
 
-                    else:
+            tailer.wait(0.25) # Check the handshake again soon. The periodic tasks wait for the server.
 
-                      if players[player_id][4]: # Vote change.
+          continue
 
-                        votes[players[player_id][4]][0] -= 1 # Remove -1 from whichever option the player
-                                                             # previously voted for.
-                      players[player_id][4] = vote
+        log_stat = fstat(fileno)
 
-                  elif msg in ("unvote", "!unvote"):
+        try:
 
-                    try:
+          path_stat = stat(config.logfile)
+          replaced = ((path_stat.st_dev, path_stat.st_ino) != (log_stat.st_dev, log_stat.st_ino))
 
-                      votes[players[player_id][4]][0] -= 1 # Remove -1 from whichever option the player
-                                                           # voted for.
-                    except KeyError:
+        except OSError: # Moved away and not created again yet.
 
-                      pass
+          path_stat = None
+          replaced = True
 
-                    else:
-                        
-                      players[player_id][4] = None
+        if replaced and log_stat.st_size <= tell(): # Rotated by rename (e.g. logrotate's create mode).
+                                                    # Follow the new file once the old one is fully read.
+          if rotation is None or rotation[1] != log_stat.st_size:
 
-                elif change_instructions is not True:
+            rotation = (time(), log_stat.st_size)
 
-                  current_time = time()
+          if not path_stat: # Moved away and not created again yet. Keep reading the old file meanwhile.
 
-                  if players[player_id][0] <= current_time: # Flood protection.
+            tailer.watch()
 
-                    if msg in ("elapsed", "!elapsed"):
+          elif not path_stat.st_size and (time() - rotation[0]) < ROTATION_GRACE:
 
-                      say("^2[Elapsed] ^7Usage: %s map/mode" % (original_msg))
-                      players[player_id][0] = (current_time + config.flood_protection)
+            pass # The server keeps writing to the file it has open (the renamed one) until it opens the log again.
 
-                    elif startswith(msg, "elapsed ") or startswith(msg, "!elapsed "):
+          elif fstat(fileno).st_size > tell(): # Last lines written to the old file. Read them before switching.
 
-                      elapse = lstrip(msg[8:])
+            pass
 
-                      try:
+          else:
 
-                        say("^2[Elapsed] ^7Time elapsed for the current %s: %s%s" %
-                            (elapse, calculate_time(gameinfo[elapse][0], current_time),
-                             (" (%i extension%s)" % (gameinfo[elapse][1],
-                                                     ("" if gameinfo[elapse][1] == 1 else "s"))
-                              if gameinfo[elapse][1] else "")))
+            rotation = None
+            log.close()
+            log = open(config.logfile, "rt+")
+            seek = log.seek
+            tell = log.tell
+            truncate = log.truncate
+            flush = log.flush
+            fileno = log.fileno()
+            log_stat = fstat(fileno)
 
-                      except KeyError:
+            if checkpoint:
 
-                        say("^2[Elapsed] ^7Incorrect format (map/mode).")
+              checkpoint.inode = (log_stat.st_dev, log_stat.st_ino)
 
-                      players[player_id][0] = (current_time + config.flood_protection)
+            if archiver: # The snapshot being compressed belongs to the old file, which is left as it is.
 
-                    elif msg in ("nextgame", "!nextgame"):
+              archiver.finish("")
+              archiver = None
 
-                      say("^2[Nextgame] ^7Next %s: %s" %
-                          (voting_type,
-                           (change_instructions[0] if voting_type == "map" else
-                            gamemodes[change_instructions[0]])))
-                      players[player_id][0] = (current_time + config.flood_protection)
+            next_query = 0 # Lines may have been missed. Check the server status right away.
+            print("CONSOLE: (%s) Log file was rotated. Reading the new log file." %
+                  (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+            tailer.watch()
 
-            if check_votes:
+        elif log_stat.st_size < tell(): # Truncated in place (e.g. logrotate's copytruncate mode).
 
-              check_votes = False
+          seek(0)
+          next_query = 0
+          print("CONSOLE: (%s) Log file was truncated. Reading from the start." %
+                (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
 
-              if (sum((rtv_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                       in players_values())) >= rtv_players): # Start a RTV voting.
+        if (archiver and archiver.compressed.is_set() and log_stat.st_size == tell() and
+            not replaced): # Background compression is done.
 
-                nominated_maps = [nomination
-                                  for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                                  in players_values() if nomination]
+          if not archiver.error:
 
-                if config.nomination_type:
+            try:
 
-                  map_duplicates = defaultdict(bool)
-                  voting_maps = [(count(nominated_maps, players[player_id][3]),
-                                  (config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                  players[player_id][3])
-                                 for player_id in iter(nomination_order)
-                                 if (players[player_id][3] not in map_duplicates and # Get nominations in nomination order without
-                                     not map_duplicates[players[player_id][3]])]     # duplicates and with the amount of nominations received.
-                  sort(voting_maps, key=lambda nomination: nomination[0], reverse=True) # Re-order nominations by nomination count.
+              with open(config.logfile, "rb") as logcopy: # Hand over the lines written since the snapshot.
 
-                  while len(voting_maps) > 5: # Reduce the number of maps to 5 for the voting.
+                logcopy.seek(archiver.size)
+                archiver.finish(logcopy.read((log_stat.st_size - archiver.size))) # Only lines already read.
 
-                    min_nominations = min((nomination_count for (nomination_count, priority, nomination) in
-                                           iter(voting_maps)))
-                    compare_nominations = [(priority, nomination) for (nomination_count, priority, nomination) in
-                                           iter(voting_maps) if nomination_count == min_nominations]
+            except IOError, err:
 
-                    if (len(voting_maps) - len(compare_nominations)) >= 5:
+              archiver.error = err
+              archiver.finish(None) # Let the thread end without closing the archive.
 
-                      voting_maps[:] = voting_maps[:-len(compare_nominations)]
+            archiver.join() # Writing the tail may fail too (e.g. disk full).
 
-                    else: # Compare maps with the map priority system
-                          # to define which maps remain.
-                      for i in xrange(3):
+          if archiver.error: # Never clean the log file without an archive of it.
 
-                        decrease_maps = (len(voting_maps) - 5) # Number of remaining maps to remove.
+            next_archive = (time() + LogArchiver.RETRY_DELAY)
+            print("CONSOLE: (%s) Log file was kept. Compressing it again in %i seconds." %
+                  (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), LogArchiver.RETRY_DELAY))
 
-                        if not decrease_maps:
+          elif not truncate_log(log_stat.st_size): # The archive would overlap the next one, which starts over.
 
-                          break
-                        
-                        filtered_nominations = [nomination for (priority, nomination) in iter(compare_nominations)
-                                                if priority == i] # Map priority.
+            try:
 
-                        if filtered_nominations:
+              remove(archiver.path)
 
-                          if len(filtered_nominations) > decrease_maps:
+            except OSError:
 
-                            filtered_nominations[:] = filtered_nominations[(len(filtered_nominations) - decrease_maps):]
+              pass
 
-                          voting_maps = [(nomination_count, priority, nomination) for (nomination_count, priority, nomination)
-                                         in iter(voting_maps)
-                                         if nomination not in filtered_nominations]
+            print("CONSOLE: (%s) Log file was kept, lines were written while archiving it. Its archive was dropped." %
+                  (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
 
-                  voting_maps = [(priority, nomination) for (nomination_count, priority, nomination) in iter(voting_maps)]
-                  
-                else:
+          archiver = None
 
-                  voting_maps = [((config.map_priority[0] if players[player_id][3] in config.maps else config.map_priority[1]),
-                                  players[player_id][3])
-                                 for player_id in iter(nomination_order)]
+        elif (not archiver and config.clean_log and log_stat.st_size >= config.clean_log[1] and
+              log_stat.st_size == tell() and not replaced): # Clean log file once fully read (never a renamed one).
 
-                missing_maps = (5 - len(voting_maps))
+          if config.clean_log[0] == 2: # Compress log file in the background.
 
-                if missing_maps: # Not all 5 map slots are filled.
+            if next_archive <= time(): # Not right after a failed compression.
 
-                  available_maps = config.maps
-                  available_secondary_maps = []
-                  current_time = time()
+              archiver = LogArchiver(config.logfile, log_stat.st_size, config.compression)
+              archiver.start()
 
-                  if config.pick_secondary_maps == 2:
+          else:
 
-                    available_maps += config.secondary_maps
+            truncate_log(log_stat.st_size) # Lines written meanwhile are read first, then it's tried again.
 
-                  elif config.pick_secondary_maps:
+        recover = False # Reset recover flag when no line is read.
+        log_offset = tell() # Every line up to here was processed.
 
-                    available_secondary_maps = [mapname for mapname in iter(config.secondary_maps)
-                                                if (mapname not in nominated_maps and
-                                                    lower(mapname) != current_map and
-                                                    recently_played[lower(mapname)] <= current_time)]
+        if query and next_query <= time(): # Correct what the log file got wrong with the server status.
 
-                  available_maps = [mapname for mapname in iter(available_maps)
-                                    if (mapname not in nominated_maps and
-                                        lower(mapname) != current_map and
-                                        recently_played[lower(mapname)] <= current_time)]
-                  
-                  if missing_maps == 5 and not available_maps and not available_secondary_maps:
+          next_query = (time() + query_interval)
+          server_status = query.status()
 
-                    svsay("^2[RTV] ^7Rock the vote failed to start! No map is currently available.")
-                    print("CONSOLE: (%s) [RTV] Rock the vote failed to start! No map is currently available."
-                          % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                    players = dict((player_id, [timer, False, rtm_vote, None, None])
-                                   for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option)) in
-                                   players_items()) # Reset RTV votes.
-                    players_values = players.itervalues
-                    players_items = players.iteritems
+          if server_status:
 
-                    if (sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                             in players_values())) >= rtm_players): # Make sure RTM is checked even
-                                                                    # if RTV failed to start.
-                      voting_modes = [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]
+            infostring, server_cvars, server_players = server_status
 
-                      if not voting_modes:
+            try:
 
-                        svsay("^2[RTM] ^7Rock the mode failed to start! No mode is currently available.")
-                        print("CONSOLE: (%s) [RTM] Rock the mode failed to start! No mode is currently available."
-                              % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                        players = dict((player_id, [timer, rtv_vote, False, nomination, None])
-                                       for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                       in players_items()) # Reset RTM votes.
-                        players_values = players.itervalues
-                        players_items = players.iteritems
+              if (lower(server_cvars["mapname"]) != current_map or
+                  int(server_cvars["g_authenticity"]) != current_mode): # Missed a map/mode change.
 
-                      else: # Create voting options.
-                      
-                        votes = SortableDict(((i+1), [0, config.mode_priority[voting_modes[i]], voting_modes[i], gamemodes[voting_modes[i]]])
-                                             for i in xrange(len(voting_modes)))
+                injected.append(InitGame("InitGame: %s" % (infostring)))
 
-                        if (config.rtm_extend[0] == 2 or
-                            (config.rtm_extend[0] == 1 and gameinfo["mode"][1] < config.rtm_extend[1])):
-          
-                          votes[(len(votes) + 1)] = [0, config.mode_priority[3], None, "Don't change"] # Add the "Don't change" option.
-                        
-                        votes_values = votes.itervalues
-                        votes_items = votes.sorteditems
-                        voting_name = "RTM"
-                        voting_type = "mode"
-                        voting_method, voting_countdown = config.rtm_voting
-                        voting_minimum_votes = config.rtm_minimum_votes
-                        voting_wait_time = 1
-                        voting_s_wait_time = config.rtm_s_wait_time
-                        voting_f_wait_time = config.rtm_f_wait_time
-                        voting_skip_voting = config.rtm_skip_voting
-                        voting_second_turn = config.rtm_second_turn
-                        voting_change_immediately = config.rtm_change_immediately
-                        status.rtv = status.rtm = voting_instructions = start_voting = True
-                    
-                    continue
+            except (KeyError, ValueError):
 
-                  append_map = voting_maps.append
-                  remove_map = available_maps.remove
+              pass
 
-                  try:
+            injected.extend((ClientDisconnect(player_id) for player_id in
+                             iter(stale_players(players, client_names, server_players))))
 
-                    for i in xrange(missing_maps):
+            if injected:
 
-# Fill any remaining map slots with random maps.
+              print("CONSOLE: (%s) [Query] The log file is out of date. Server: %s (%s), %i players. Log file: %s (%s), "
+                    "%i players." % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), server_cvars.get("mapname"),
+                                     server_cvars.get("g_authenticity"), len(server_players), current_map, current_mode,
+                                     len(players)))
+              continue # Handle the corrections right away.
 
-                      mapname = choice(available_maps)
-                      append_map(((config.map_priority[0] if mapname in config.maps else config.map_priority[1]),
-                                  mapname))
-                      remove_map(mapname)
+            elif len(server_players) != len(players):
 
-                  except IndexError: # Not enough maps to fill all 5 slots.
+              print("CONSOLE: (%s) [Query] The server lists %i players, the log file %i." %
+                    (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), len(server_players), len(players)))
 
-                    if available_secondary_maps: # Fill with secondary maps if we have no new
-                                                 # primary map to use.
-                      remove_map = available_secondary_maps.remove
+        if stats_interval and next_stats <= time():
 
-                      try:
-                      
-                        for i in xrange((5 - len(voting_maps))):
+          next_stats = (time() + stats_interval)
+          stats = ["Events: %s" % (join(", ", ("%s %i" % ((event_type.__name__ if event_type else "Other"),
+                                                          event_counts[event_type])
+                                               for event_type in iter(EVENT_TYPES)))),
+                   "Rcon queue: %i pending, oldest %.1f seconds. Wait: %.2f seconds average, %.2f longest. %s" %
+                   (rcon.pending() + rcon.wait_times() +
+                    (join(", ", ("%s %i" % (counter, rcon.counters[counter])
+                                 for counter in ("sent", "retried", "timed out", "expired", "failed", "coalesced"))),))]
+          stats.extend(("Rcon %s: %s" % (command, rcon.metrics[command])) for command in sorted(rcon.metrics))
 
-# Fill any remaining map slots with random secondary maps.
+          for line in iter(stats):
 
-                          mapname = choice(available_secondary_maps)
-                          append_map((config.map_priority[1], mapname))
-                          remove_map(mapname)
+            print("CONSOLE: (%s) [Stats] %s" % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), line))
 
-                      except IndexError: # Not enough maps to fill remaining slots.
+          if stats_file:
 
-                        pass
+            try:
 
-# Create voting options.
+              with open("%s.tmp" % (stats_file), "w") as stats_copy: # Replaced at once for readers.
 
-                votes = SortableDict(((i+1), [0, voting_maps[i][0], voting_maps[i][1], voting_maps[i][1]])
-                                     for i in xrange(len(voting_maps)))
+                stats_copy.write("%s\n%s\n" % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), join("\n", stats)))
 
-                if (config.rtv_extend[0] == 2 or
-                    (config.rtv_extend[0] == 1 and gameinfo["map"][1] < config.rtv_extend[1])):
-          
-                  votes[(len(votes) + 1)] = [0, config.map_priority[2], None, "Don't change"] # Add the "Don't change" option.
-                        
-                votes_values = votes.itervalues
-                votes_items = votes.sorteditems
-                voting_name = "RTV"
-                voting_type = "map"
-                voting_method, voting_countdown = config.rtv_voting
-                voting_minimum_votes = config.rtv_minimum_votes
-                voting_wait_time = 0
-                voting_s_wait_time = config.rtv_s_wait_time
-                voting_f_wait_time = config.rtv_f_wait_time
-                voting_skip_voting = config.rtv_skip_voting
-                voting_second_turn = config.rtv_second_turn
-                voting_change_immediately = config.rtv_change_immediately
-                status.rtv = status.rtm = voting_instructions = start_voting = True
+              if platform == "win32": # rename() doesn't replace existing files on Windows.
 
-              elif (sum((rtm_vote for (timer, rtv_vote, rtm_vote, nomination, vote_option)
-                         in players_values())) >= rtm_players): # Start a RTM voting.
-                
-                voting_modes = [gamemode for gamemode in iter(config.rtm) if gamemode != current_mode]
+                try:
 
-                if not voting_modes:
+                  remove(stats_file)
 
-                  svsay("^2[RTM] ^7Rock the mode failed to start! No mode is currently available.")
-                  print("CONSOLE: (%s) [RTM] Rock the mode failed to start! No mode is currently available."
-                        % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
-                  players = dict((player_id, [timer, rtv_vote, False, nomination, None])
-                                 for (player_id, (timer, rtv_vote, rtm_vote, nomination, vote_option))
-                                 in players_items()) # Reset RTM votes.
-                  players_values = players.itervalues
-                  players_items = players.iteritems
+                except OSError:
 
-                else: # Create voting options.
-                
-                  votes = SortableDict(((i+1), [0, config.mode_priority[voting_modes[i]], voting_modes[i], gamemodes[voting_modes[i]]])
-                                       for i in xrange(len(voting_modes)))
+                  pass
 
-                  if (config.rtm_extend[0] == 2 or
-                      (config.rtm_extend[0] == 1 and gameinfo["mode"][1] < config.rtm_extend[1])):
-          
-                    votes[(len(votes) + 1)] = [0, config.mode_priority[3], None, "Don't change"] # Add the "Don't change" option.
-                        
-                  votes_values = votes.itervalues
-                  votes_items = votes.sorteditems
-                  voting_name = "RTM"
-                  voting_type = "mode"
-                  voting_method, voting_countdown = config.rtm_voting
-                  voting_minimum_votes = config.rtm_minimum_votes
-                  voting_wait_time = 1
-                  voting_s_wait_time = config.rtm_s_wait_time
-                  voting_f_wait_time = config.rtm_f_wait_time
-                  voting_skip_voting = config.rtm_skip_voting
-                  voting_second_turn = config.rtm_second_turn
-                  voting_change_immediately = config.rtm_change_immediately
-                  status.rtv = status.rtm = voting_instructions = start_voting = True
-  
-      if line is None:
+              rename(("%s.tmp" % (stats_file)), stats_file)
 
-        if config.clean_log and getsize(config.logfile) >= config.clean_log[1]: # Clean log file.
+            except (IOError, OSError), err:
 
-          if config.clean_log[0] == 2: # Compress log file.
+              print("CONSOLE: (%s) [Stats] Could not write the statistics file (ERRNO: %s)." %
+                    (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), err.errno))
 
-            compressed_log = TarFile(join_path(dirname(config.logfile),
-                                               "%s-%s.tar.gz" % (basename(config.logfile),
-                                                                 strftime(timenow(), "%Y%m%d%H%M%S"))),
-                                     "w:gz")
-            compressed_log.add(config.logfile, arcname=basename(config.logfile))
-            compressed_log.close()
-            
-          truncate(0)
-          flush()
-          fsync(fileno)
-          seek(0)
-          print("CONSOLE: (%s) Log file was cleaned." % (strftime(timenow(), "%d/%m/%Y %H:%M:%S")))
+        if checkpoint and checkpoint.next_save <= time():
 
-        recover = False # Reset recover flag when no line is read.
+          save_checkpoint()
 
         if change_instructions:
 
-          sleep(SLEEP_INTERVAL) # Polling "wait" time.
-                                # Prevents overloading CPU with I/O polling.
+          wait_log() # Nothing to do until the next log line.
+
         elif start_voting:
 
           if voting_instructions: # Check instructions and send the first voting message.
@@ -5909,7 +8112,7 @@ def main(argv):
               if voting_change_immediately:
 
                 svsay("^2[%s] ^7Changing %s to %s."
-                      % (voting_name, voting_type, votes[1][3]))
+                      % (voting_name, voting_type, votes[1][3]), VOTING)
                 print("CONSOLE: (%s) [%s] Changing %s to %s."
                       % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name, voting_type,
                          votes[1][3]))
@@ -5925,7 +8128,7 @@ def main(argv):
               else:
 
                 svsay("^2[%s] ^7Changing %s to %s next round."
-                      % (voting_name, voting_type, votes[1][3]))
+                      % (voting_name, voting_type, votes[1][3]), VOTING)
                 print("CONSOLE: (%s) [%s] Changing %s to %s next round."
                       % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name, voting_type,
                          votes[1][3]))
@@ -5962,19 +8165,19 @@ def main(argv):
 
               if voting_type == "admin": # Admin voting.
 
-                svsay("^2[Description] ^7%s" % (voting_description))
+                svsay("^2[Description] ^7%s" % (voting_description), VOTING)
                 svsay("^2[Admin] ^7An admin voting has begun. Type !number to vote.%s" %
-                      (_voting_countdown))
+                      (_voting_countdown), VOTING)
 
               else:
               
                 svsay("^2[%s] ^7Voting for the next %s has begun. Type !number to vote.%s"
-                      % (voting_name, voting_type, _voting_countdown))
+                      % (voting_name, voting_type, _voting_countdown), VOTING)
 
               _voting_countdown = voting_countdown
               svsay("^2[Votes] ^7%s" % (join(", ", ("%i: %s" % (vote_id, vote_display_value)
                                                     for (vote_id, (vote_count, priority, vote_value, vote_display_value))
-                                                    in votes_items()))))
+                                                    in votes_items()))), VOTING)
               voting_time += time()
 
           elif start_second_turn: # Start a second turn voting.
@@ -5987,13 +8190,13 @@ def main(argv):
               voting_countdown_seconds = (voting_countdown * 60) if voting_countdown else 30
               svsay("^2[%s] ^7Second turn voting for the next %s has begun. Type !number to vote. Voting will complete in ^2%i ^7minute%s."
                     % (voting_name, voting_type, _voting_countdown,
-                       ("" if _voting_countdown == 1 else "s")))
-              svsay("^2[Votes] ^71: %s, 2: %s" % (votes[1][3], votes[2][3]))
+                       ("" if _voting_countdown == 1 else "s")), VOTING)
+              svsay("^2[Votes] ^71: %s, 2: %s" % (votes[1][3], votes[2][3]), VOTING)
               voting_time = (time() + (_voting_countdown * 60))
 
             else:
 
-              sleep(SLEEP_INTERVAL)
+              wait_log()
 
           else:
 
@@ -6039,7 +8242,7 @@ def main(argv):
                   most_voted_options = [vote_id for (vote_id, (vote_count, priority, vote_value, vote_display_value))
                                         in votes_items() if vote_count == most_voted]
                   vote_percentage = ((100.0 * most_voted) / total_players)
-                  svsay("^2[Description] ^7%s" % (voting_description))
+                  svsay("^2[Description] ^7%s" % (voting_description), VOTING)
                   print("CONSOLE: (%s) [Description] %s"
                         % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"),
                            voting_description))
@@ -6047,7 +8250,7 @@ def main(argv):
                   if len(most_voted_options) > 1: # We have a draw.
 
                     svsay("^2[Admin] ^7Draw (%.1f percent) (%i/%i)!"
-                          % (vote_percentage, total_votes, total_players))
+                          % (vote_percentage, total_votes, total_players), VOTING)
                     print("CONSOLE: (%s) [Admin] Draw (%.1f percent) (%i/%i)!"
                           % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"),
                              vote_percentage, total_votes, total_players))
@@ -6055,12 +8258,12 @@ def main(argv):
                   else:
 
                     svsay("^2[Admin] ^7%s won (%.1f percent) (%i/%i)!"
-                          % (votes[most_voted_options[0]][3], vote_percentage, total_votes, total_players))
+                          % (votes[most_voted_options[0]][3], vote_percentage, total_votes, total_players), VOTING)
                     print("CONSOLE: (%s) [Admin] %s won (%.1f percent) (%i/%i)!"
                           % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"),
                              votes[most_voted_options[0]][3], vote_percentage, total_votes, total_players))
                     
-                  svsay("^2[Result] ^7%s" % (voting_list))
+                  svsay("^2[Result] ^7%s" % (voting_list), VOTING)
                   print("CONSOLE: (%s) [Result] %s"
                         % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_list))
                   status.rtv = status.rtm = start_voting = False
@@ -6135,15 +8338,15 @@ def main(argv):
                   if not voting_method:
                     
                     svsay("^2[%s] ^7A second turn between %s and %s will begin in 5 seconds (%i/%i)." %
-                          (voting_name, votes[1][3], votes[2][3], total_votes, total_players))
-                    svsay("^2[Result] ^7%s" % (voting_list))
+                          (voting_name, votes[1][3], votes[2][3], total_votes, total_players), VOTING)
+                    svsay("^2[Result] ^7%s" % (voting_list), VOTING)
                     sleep(5)
 
                   else:
 
                     svsay("^2[%s] ^7A second turn between %s and %s will begin in the next round (%i/%i)." %
-                          (voting_name, votes[1][3], votes[2][3], total_votes, total_players))
-                    svsay("^2[Result] ^7%s" % (voting_list))
+                          (voting_name, votes[1][3], votes[2][3], total_votes, total_players), VOTING)
+                    svsay("^2[Result] ^7%s" % (voting_list), VOTING)
 
                   start_second_turn = True
                   continue
@@ -6174,12 +8377,12 @@ def main(argv):
 
                       svsay("^2[%s] ^7Changing %s to %s (%.1f percent) (%i/%i)."
                             % (voting_name, voting_type, votes[most_voted_options][3],
-                               vote_percentage, total_votes, total_players))
+                               vote_percentage, total_votes, total_players), VOTING)
                       print("CONSOLE: (%s) [%s] Changing %s to %s (%.1f percent) (%i/%i)."
                             % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name, voting_type,
                                votes[most_voted_options][3], vote_percentage,
                                total_votes, total_players))
-                      svsay("^2[Result] ^7%s" % (voting_list))
+                      svsay("^2[Result] ^7%s" % (voting_list), VOTING)
                       print("CONSOLE: (%s) [Result] %s"
                             % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_list))
                       mbmode(("%i %s" % (current_mode, votes[most_voted_options][2]) if voting_type == "map" else
@@ -6196,12 +8399,12 @@ def main(argv):
 
                       svsay("^2[%s] ^7Changing %s to %s next round (%.1f percent) (%i/%i)."
                             % (voting_name, voting_type, votes[most_voted_options][3],
-                               vote_percentage, total_votes, total_players))
+                               vote_percentage, total_votes, total_players), VOTING)
                       print("CONSOLE: (%s) [%s] Changing %s to %s next round (%.1f percent) (%i/%i)."
                             % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name, voting_type,
                                votes[most_voted_options][3], vote_percentage,
                                total_votes, total_players))
-                      svsay("^2[Result] ^7%s" % (voting_list))
+                      svsay("^2[Result] ^7%s" % (voting_list), VOTING)
                       print("CONSOLE: (%s) [Result] %s"
                             % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_list))
                       change_instructions = (votes[most_voted_options][2], voting_wait_time, voting_s_wait_time)
@@ -6210,11 +8413,11 @@ def main(argv):
                         # Extend map/mode.
                     svsay("^2[%s] ^7The voting has failed (extend %s) (%.1f percent) (%i/%i)!"
                           % (voting_name, voting_type, vote_percentage,
-                             total_votes, total_players))
+                             total_votes, total_players), VOTING)
                     print("CONSOLE: (%s) [%s] The voting has failed (extend %s) (%.1f percent) (%i/%i)!"
                           % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name, voting_type,
                              vote_percentage, total_votes, total_players))
-                    svsay("^2[Result] ^7%s" % (voting_list))
+                    svsay("^2[Result] ^7%s" % (voting_list), VOTING)
                     print("CONSOLE: (%s) [Result] %s"
                           % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_list))
                     gameinfo[voting_type][1] += 1
@@ -6229,7 +8432,7 @@ def main(argv):
               else: # Not enough votes.
 
                 svsay("^2[%s] ^7The voting has failed (not enough votes)!"
-                      % (voting_name))
+                      % (voting_name), VOTING)
                 print("CONSOLE: (%s) [%s] The voting has failed (not enough votes)!"
                       % (strftime(timenow(), "%d/%m/%Y %H:%M:%S"), voting_name))
 
@@ -6262,7 +8465,7 @@ def main(argv):
 
                 if voting_type == "admin":
 
-                  svsay("^2[Description] ^7%s" % (voting_description))
+                  svsay("^2[Description] ^7%s" % (voting_description), VOTING)
 
                 if voting_countdown_seconds < 60:
 
@@ -6277,20 +8480,21 @@ def main(argv):
                 voting_countdown -= 1
                 voting_countdown_seconds = (voting_countdown * 60) if voting_countdown else 30
 
-              else:
+              else: # Wake up for the next countdown message or the end of the voting.
 
-                sleep(SLEEP_INTERVAL)
+                wait_log(voting_remaining_time - max(voting_countdown_seconds, 0))
 
             else:
 
-              sleep(SLEEP_INTERVAL)
+              wait_log()
 
         else:
             
-          sleep(Check_Status()) # Polling "wait" time.
-                                # Prevents overloading CPU with I/O polling.
+          wait_log(Check_Status()) # Wait for new lines or for the next feature to be enabled.
 if __name__ == "__main__":
 
+  freeze_support() # Scan workers of Windows executables.
+
   try:
 
     main(argv)
@@ -0,0 +1,662 @@
+#!/usr/bin/python -u
+# Movie Battles II RTV/RTM tests.
+#
+# Run from this folder: python -m unittest test_rtvrtm
+
+from __future__ import with_statement
+from os import listdir, rename
+from os.path import exists, join as join_path
+from tempfile import mkdtemp
+from shutil import rmtree
+from zipfile import ZipFile
+from collections import defaultdict
+from gzip import GzipFile
+from random import Random
+from time import time
+from unittest import TestCase, main
+
+import rtvrtm
+import fakeserver
+import benchmark
+
+RTM_ONLY_CONFIG = """Log: %(folder)s/games.log
+MBII Folder: %(folder)s
+Address: %(address)s
+Bind:
+Password: secret
+Flood protection: 0
+Use say only: 0
+Name protection: 1
+Default game:
+Clean log: 0
+Admin voting: 0 1
+Admin minimum votes: 0
+Admin skip voting: 1
+Roundlimit: 0
+Timelimit: 0
+RTV: 0
+RTM: 1
+Mode priority: 0 0 0 0 0
+RTM rate: 0
+RTM voting: 0 1
+RTM minimum votes: 0
+RTM extend: 0
+RTM successful wait time: 0
+RTM failed wait time: 0
+RTM skip voting: 1
+RTM second turn: 0
+RTM change immediately: 1
+"""
+
+def write_pk3(folder, name, entries):
+
+  """Write a pk3 file holding the given entries (empty files) and return its name."""
+
+  with ZipFile(join_path(folder, name), "w") as pk3:
+
+    for entry in entries:
+
+      pk3.writestr(entry, "")
+
+  return name
+
+class TempFolderTest(TestCase):
+
+  """Test case with a temporary folder, removed afterwards."""
+
+  def setUp(self):
+
+    self.folder = mkdtemp("", "rtvrtm-test-")
+
+  def tearDown(self):
+
+    rmtree(self.folder)
+
+  def path(self, name):
+
+    return join_path(self.folder, name)
+
+  def write(self, name, data, mode="w"):
+
+    """Write a file in the folder and return its path."""
+
+    with open(self.path(name), mode) as output:
+
+      output.write(data)
+
+    return self.path(name)
+
+class LoadOrderTest(TempFolderTest):
+
+  """Pk3 files are taken in the order the engine loads them."""
+
+  def test_fs_path_key(self):
+
+    pk3s = ["mb2_x.pk3", "mb2a.pk3", "assets0.pk3", "MB2B.pk3", "mb2[x].pk3", "mb2^x.pk3"]
+    self.assertEqual(sorted(pk3s, key=rtvrtm.fs_path_key),
+                     ["assets0.pk3", "mb2a.pk3", "MB2B.pk3", "mb2[x].pk3", "mb2^x.pk3", "mb2_x.pk3"])
+
+  def test_scan_order(self):
+
+    write_pk3(self.folder, "mb2_x.pk3", ["maps/mb2_x.bsp"])
+    write_pk3(self.folder, "mb2a.pk3", ["maps/mb2_a.bsp", "textures/a.jpg"])
+    write_pk3(self.folder, "assets0.pk3", ["maps/mb2_base.bsp"])
+    pk3s = sorted(listdir(self.folder), key=rtvrtm.fs_path_key)
+    index = rtvrtm.BSPIndex(join_path(self.folder, "rtvrtm.bspindex"))
+    archives, warnings = index.scan(self.folder, pk3s)
+    self.assertEqual(warnings, [])
+    self.assertEqual(archives, [("assets0.pk3", ("mb2_base",)), ("mb2a.pk3", ("mb2_a",)), ("mb2_x.pk3", ("mb2_x",))])
+
+class MapIndexTest(TempFolderTest):
+
+  """Maps resolve to the pk3 file the engine loads them from."""
+
+  def test_later_pk3_overrides(self):
+
+    write_pk3(self.folder, "mb2_x.pk3", ["maps/MB2_Dotf.bsp"])
+    write_pk3(self.folder, "mb2a.pk3", ["maps/mb2_dotf.bsp", "maps/mb2_a.bsp"])
+    pk3s = sorted(listdir(self.folder), key=rtvrtm.fs_path_key) # mb2a.pk3 first, so mb2_x.pk3 wins.
+    index = rtvrtm.BSPIndex(join_path(self.folder, "rtvrtm.bspindex"))
+    map_index = rtvrtm.MapIndex(index.scan(self.folder, pk3s)[0])
+    self.assertEqual(map_index.provider("mb2_dotf"), "mb2_x.pk3")
+    self.assertEqual(map_index.provider("MB2_A"), "mb2a.pk3")
+    self.assertEqual(map_index.maps, ("MB2_Dotf", "mb2_a"))
+    self.assertEqual(map_index.shadowed, [("MB2_Dotf", "mb2a.pk3", "mb2_x.pk3")])
+    self.assertEqual(map_index.unused(), ())
+    self.assertEqual(map_index.unused(["mb2_dotf"]), ("mb2a.pk3",))
+
+class ConfigTest(TempFolderTest):
+
+  """Configurations read against a fake game server."""
+
+  def setUp(self):
+
+    TempFolderTest.setUp(self)
+    self.server = fakeserver.FakeServer(("127.0.0.1", 0), "secret")
+    self.server.start()
+    open(join_path(self.folder, "games.log"), "w").close()
+    write_pk3(self.folder, "mb2_maps.pk3", ["maps/mb2_dotf.bsp"])
+
+  def tearDown(self):
+
+    self.server.close()
+    TempFolderTest.tearDown(self)
+
+  def create(self, config):
+
+    config_path = join_path(self.folder, "rtvrtm.cfg")
+
+    with open(config_path, "w") as config_file:
+
+      config_file.write(config % {"folder": self.folder, "address": "%s:%i" % self.server.address})
+
+    config = rtvrtm.Config(config_path)
+    config.create(1)
+    return config
+
+  def test_rtm_only(self):
+
+    config = self.create(RTM_ONLY_CONFIG) # No map lists without RTV, roundlimit and timelimit.
+    self.assertEqual(config.maps, None)
+    self.assertEqual(config.secondary_maps, None)
+    self.assertEqual(config.map_report(), ["Map index: 1 maps from 1 pk3 files, 0 overridden by later pk3 files."])
+    self.assertEqual(config.rcon_rate, False) # Unthrottled unless set.
+
+class CheckpointTest(TempFolderTest):
+
+  """The checkpoint only resumes the log file it was written for."""
+
+  def setUp(self):
+
+    TempFolderTest.setUp(self)
+    self.logfile = self.write("games.log", "  0:00 InitGame: \\mapname\\mb2_dotf\n  0:01 ClientConnect: 0\n")
+    self.checkpoint = rtvrtm.Checkpoint(self.path("rtvrtm.checkpoint"), self.logfile)
+
+  def save(self):
+
+    with open(self.logfile, "rt+") as log:
+
+      self.assertEqual(self.checkpoint.load(log), None) # Sets the inode.
+      log.seek(0, 2)
+      self.checkpoint.save(log.tell(), [(0, [0, False, False, None, None])], None, {"mb2_dotf": 1.0}, "cvars")
+      return log.tell()
+
+  def test_round_trip(self):
+
+    offset = self.save()
+
+    with open(self.logfile, "rt+") as log:
+
+      state = self.checkpoint.load(log)
+      self.assertEqual(log.tell(), 0)
+
+    self.assertEqual(state["offset"], offset)
+    self.assertEqual(state["players"], ((0, [0, False, False, None, None]),))
+    self.assertEqual(state["recently_played"], {"mb2_dotf": 1.0})
+    self.assertEqual(state["cvars"], "cvars")
+
+  def test_replaced_log(self):
+
+    self.save()
+    rename(self.write("games.log.new", open(self.logfile).read()), self.logfile) # Same content, new inode.
+
+    with open(self.logfile, "rt+") as log:
+
+      self.assertEqual(self.checkpoint.load(log), None)
+
+  def test_rewritten_log(self):
+
+    self.save()
+    self.write("games.log", "  0:00 InitGame: \\mapname\\mb2_jawa\n  0:01 ClientConnect: 1\n", "r+")
+
+    with open(self.logfile, "rt+") as log:
+
+      self.assertEqual(self.checkpoint.load(log), None) # Fingerprint mismatch.
+
+  def test_interrupted_save(self):
+
+    def interrupt(*args):
+
+      raise SystemExit(2)
+
+    dump_pickle = rtvrtm.dump_pickle
+    rtvrtm.dump_pickle = interrupt
+
+    try:
+
+      self.assertRaises(SystemExit, self.save)
+
+    finally:
+
+      rtvrtm.dump_pickle = dump_pickle
+
+    self.assertFalse(exists(self.path("rtvrtm.checkpoint.tmp")))
+    self.assertFalse(exists(self.path("rtvrtm.checkpoint")))
+
+SESSION = ("  0:00 InitGame: \\sv_maxclients\\32\\g_authenticity\\0\\mapname\\mb2_dotf\n"
+           "  0:01 ClientConnect: 0\n"
+           "  0:01 ClientUserinfoChanged: 0 n\\Padawan\\t\\0\\model\\kyle\n"
+           "  0:02 ClientConnect: 1\n"
+           "  0:03 Kill: 0 1 12: Padawan killed Bob by MOD_SABER\n"
+           "  0:04 1: say: Bob: \"!rtv\"\n"
+           "  0:05 ClientDisconnect: 0\n"
+           "  0:06  Client 1 class: Jedi  0:06 ClientConnect: 2\n")
+
+class LogScanTest(TempFolderTest):
+
+  """Initial log pass: the last restart line and the memory-mapped scan."""
+
+  def test_find_last_restart(self):
+
+    log = ("x" * 100) + "\n" + rtvrtm.RESTART_LINE + SESSION + rtvrtm.RESTART_LINE + SESSION
+    logfile = self.write("games.log", log, "wb")
+
+    for block_size in (7, 64, 1048576): # Restart lines crossing block boundaries.
+
+      self.assertEqual(rtvrtm.find_last_restart(logfile, block_size), log.rindex(rtvrtm.RESTART_LINE))
+
+  def test_find_last_restart_edges(self):
+
+    self.assertEqual(rtvrtm.find_last_restart(self.write("first.log", rtvrtm.RESTART_LINE + SESSION, "wb")), 0)
+    self.assertEqual(rtvrtm.find_last_restart(self.write("none.log", SESSION, "wb")), None)
+    crlf = SESSION + rtvrtm.RESTART_LINE[:-1] + "\r\n" + SESSION
+    self.assertEqual(rtvrtm.find_last_restart(self.write("crlf.log", crlf, "wb"), 16), len(SESSION))
+    longer = SESSION + rtvrtm.RESTART_LINE[:-1] + "-\n" # Not a restart line.
+    self.assertEqual(rtvrtm.find_last_restart(self.write("longer.log", longer, "wb")), None)
+
+  def test_scan_log_matches_replay(self):
+
+    log = rtvrtm.RESTART_LINE + SESSION + rtvrtm.RESTART_LINE + SESSION + "  0:07 ClientConnect: 3" # Incomplete.
+    logfile = self.write("games.log", log, "wb")
+    replayed = {}
+    expected = rtvrtm.replay_log(log.splitlines(True), replayed)
+
+    for chunk_size in (16, 100, 8388608):
+
+      with open(logfile, "rb") as scanned_log:
+
+        scanned = {}
+        self.assertEqual(rtvrtm.scan_log(scanned_log, scanned, chunk_size=chunk_size), expected)
+        self.assertEqual(scanned, replayed)
+        self.assertEqual(scanned_log.tell(), log.rindex("\n") + 1) # The incomplete line is read later.
+
+    self.assertEqual(sorted(replayed), [1, 2])
+    self.assertEqual(expected[1], True)
+
+class FixLineTest(TestCase):
+
+  """The single scan fix_line() against the split based baseline of the benchmark."""
+
+  def merged_lines(self, count):
+
+    random = Random(0)
+    lines = []
+
+    for i in xrange(count): # Client records glued to up to three others, with and without their timestamp padding.
+
+      minutes = random.randint(0, 999)
+      line = "%3i:%02i  Client %i class: Jedi" % (minutes, random.randint(0, 59), random.randint(0, 31))
+
+      for glued in xrange(random.randint(1, 3)):
+
+        timestamp = random.choice(("%3i:%02i ", "%i:%02i ")) % ((minutes + random.choice((0, 1, 5, 100))),
+                                                                 random.randint(0, 59))
+
+        if glued < 2 and random.random() < 0.5:
+
+          line += "%s Client %i class: Sith" % (timestamp, random.randint(0, 31))
+
+        else:
+
+          line += "%sItem: %i weapon_blaster" % (timestamp, random.randint(0, 31))
+          break
+
+      lines.append(line + "\n")
+
+    return lines
+
+  def test_matches_baseline(self):
+
+    for line in self.merged_lines(5000):
+
+      try:
+
+        expected = benchmark.fix_line_split(line)
+
+      except ValueError: # Glued minutes going backwards. The baseline chokes on them, the rewrite drops the line.
+
+        expected = ""
+
+      self.assertEqual(rtvrtm.fix_line(line), expected, line)
+
+  def test_other_lines(self):
+
+    for line in (" 12:34 Item: 3 weapon_blaster\n", " 12:34 ClientBegin: 3\n", "\n", ""):
+
+      self.assertTrue(rtvrtm.fix_line(line) is line) # Passed through as is.
+
+    self.assertEqual(rtvrtm.fix_line(" 12:34  Client 3 class: Jedi\n"), "") # Nothing glued to it.
+    self.assertEqual(rtvrtm.fix_line(" 12:34  Client 3 class: Jedi 12:35 Item: 3 weapon_blaster\n"),
+                     " 12:35 Item: 3 weapon_blaster\n")
+    self.assertEqual(rtvrtm.fix_line(" 12:34  Client 3 class: Jedi12:35 Item: 3 weapon_blaster\n"),
+                     " 12:35 Item: 3 weapon_blaster\n") # Missing padding.
+
+class RemoveColorTest(TestCase):
+
+  """Single pass color code removal against the replace based baseline, and the newer letter codes."""
+
+  def test_matches_baseline(self):
+
+    random = Random(0)
+    pieces = ("1", "0", " ", "^ ", "^0", "^1", "^7", "^9", "!rtv", "#42")
+
+    for i in xrange(5000): # Digit codes only, never nested (see test_letter_codes()), which the baseline knows about.
+
+      text = "".join(random.choice(pieces) for j in xrange(random.randint(0, 8)))
+      self.assertEqual(rtvrtm.remove_color(text), benchmark.remove_color_replace(text), text)
+
+  def test_letter_codes(self):
+
+    self.assertEqual(rtvrtm.remove_color("^bGrievous^Z ^7!rtv"), "Grievous !rtv")
+    self.assertEqual(rtvrtm.remove_color("^^1^"), "^^")
+    self.assertEqual(rtvrtm.remove_color("^^01"), "^1") # A single pass, like the engine. The baseline strips both.
+    self.assertEqual(rtvrtm.remove_color("^!^ "), "^!^ ")
+    text = "Vader"
+    self.assertTrue(rtvrtm.remove_color(text) is text)
+
+  def test_cache(self):
+
+    cache = {}
+    self.assertEqual(rtvrtm.remove_color("^4Obi-^7Wan", cache), "Obi-Wan")
+    self.assertEqual(cache, {"^4Obi-^7Wan": "Obi-Wan"})
+    self.assertEqual(rtvrtm.remove_color("Bob", cache), "Bob")
+    self.assertEqual(len(cache), 1) # Uncolored strings aren't cached.
+
+    for i in xrange(rtvrtm.COLOR_CACHE_SIZE):
+
+      rtvrtm.remove_color("^1%i" % (i), cache)
+
+    self.assertEqual(len(cache), 1) # Cleared once full.
+    self.assertEqual(rtvrtm.remove_color("^4Obi-^7Wan", cache), "Obi-Wan")
+
+class SplitMessageTest(TestCase):
+
+  """Long svsay messages split at ", " boundaries, carrying the color code over."""
+
+  def test_split(self):
+
+    self.assertEqual(rtvrtm.split_message("a, b, c", 7), ["a, b, c"])
+    self.assertEqual(rtvrtm.split_message("a, b, c", 4), ["a,", "b, c"])
+    self.assertEqual(rtvrtm.split_message("^1mb2_dotf, mb2_deathstar, ^2mb2_jeditemple, mb2_kamino", 20),
+                     ["^1mb2_dotf,", "^1mb2_deathstar,", "^1^2mb2_jeditemple,", "^2mb2_kamino"])
+
+  def test_split_limits(self):
+
+    maps = ", ".join(("mb2_map%i" % (i)) for i in xrange(60))
+
+    for size in (20, 64, rtvrtm.Rcon.SVSAY_LENGTH):
+
+      parts = rtvrtm.split_message(maps, size)
+      self.assertTrue(all(len(part) <= size for part in parts))
+      self.assertEqual(" ".join(parts), maps)
+
+  def test_unsplittable(self):
+
+    self.assertEqual(rtvrtm.split_message("abcdefgh", 4), None) # No ", " at all.
+    self.assertEqual(rtvrtm.split_message("^1mb2_dotf, mb2_deathstar", 9), None) # A part longer than size.
+    self.assertEqual(rtvrtm.split_message("^1, abcdefgh", 5), None) # Only the color code would be carried over.
+
+class LogArchiverTest(TempFolderTest):
+
+  """Background compression of the log file and its failure paths, which must never leave an archive behind."""
+
+  def archive(self, tail):
+
+    logfile = self.write("games.log", SESSION * 10, "wb")
+    archiver = rtvrtm.LogArchiver(logfile, len(SESSION) * 10, ("gzip", 1))
+    archiver.start()
+    archiver.compressed.wait(10)
+    archiver.finish(tail)
+    archiver.join(10)
+    self.assertFalse(archiver.is_alive())
+    return archiver
+
+  def test_archive(self):
+
+    archiver = self.archive(SESSION)
+    self.assertEqual(archiver.error, None)
+
+    with open(archiver.path, "rb") as archive:
+
+      self.assertEqual(GzipFile(fileobj=archive).read(), SESSION * 11)
+
+  def test_compression_failure(self):
+
+    def fail(*args):
+
+      raise IOError(28, "No space left on device")
+
+    rtvrtm.GzipFile = fail
+
+    try:
+
+      archiver = self.archive("")
+
+    finally:
+
+      rtvrtm.GzipFile = GzipFile
+
+    self.assertTrue(isinstance(archiver.error, IOError))
+    self.assertFalse(exists(archiver.path))
+
+  def test_tail_not_read(self):
+
+    error = IOError(5, "Input/output error")
+    logfile = self.write("games.log", SESSION, "wb")
+    archiver = rtvrtm.LogArchiver(logfile, len(SESSION), ("gzip", 1))
+    archiver.start()
+    archiver.compressed.wait(10)
+    archiver.error = error # As set by the main loop.
+    archiver.finish(None)
+    archiver.join(10)
+    self.assertTrue(archiver.error is error)
+    self.assertFalse(exists(archiver.path))
+    self.assertEqual(listdir(self.folder), ["games.log"])
+
+class ParseLogTest(TestCase):
+
+  """Raw log lines into event records."""
+
+  def parse(self, lines):
+
+    counts = defaultdict(int)
+    return (list(rtvrtm.parse_log(lines, counts)), counts)
+
+  def test_dispatch_counts(self):
+
+    events, counts = self.parse((rtvrtm.RESTART_LINE + SESSION +
+                                 "  0:08 Item: 1 weapon_blaster\n"
+                                 "  0:09 ClientBegin: 1\n"
+                                 "  0:10 ShutdownGame:\n"
+                                 "  0:11 Exit: Kill limit hit.\n"
+                                 "  0:12 say: Server: ^1Restarting\n").splitlines(True))
+    self.assertEqual(dict(counts), {rtvrtm.Restart: 1, rtvrtm.InitGame: 1, rtvrtm.ClientConnect: 3,
+                                    rtvrtm.ClientUserinfoChanged: 1, rtvrtm.Kill: 1, rtvrtm.Say: 1,
+                                    rtvrtm.ClientDisconnect: 1, rtvrtm.Item: 1, rtvrtm.ClientBegin: 1, None: 1,
+                                    rtvrtm.Exit: 1, rtvrtm.AdminSay: 1})
+    self.assertEqual([event.__class__ for event in events],
+                     [rtvrtm.Restart, rtvrtm.InitGame, rtvrtm.ClientConnect, rtvrtm.ClientUserinfoChanged,
+                      rtvrtm.ClientConnect, rtvrtm.Say, rtvrtm.ClientDisconnect, rtvrtm.ClientConnect, rtvrtm.Exit,
+                      rtvrtm.AdminSay]) # Counted only types yield nothing.
+
+  def test_event_fields(self):
+
+    events = self.parse(("  0:01 ClientUserinfoChanged: 12 n\\^1Vader\\t\\0\\model\\kyle\n"
+                         "  0:02 ClientUserinfoChanged: 3 t\\0\\model\\kyle\n"
+                         "  0:03 12: say: ^1Vader: \"!nominate mb2_dotf\"\n"
+                         "  0:04 3: sayteam: Bob: \"hi: there\"\n"
+                         "  0:05 3: tell: Bob: \"ignored\"\n"
+                         "  0:06 say: Admin: !rehash\n"
+                         "  0:07 ClientDisconnect: 12\n"
+                         "  0:08 Exit: Timelimit hit.\n"
+                         "  0:09 ClientConnect: 4").splitlines(True))[0] # Incomplete last line.
+    fields = [(event.__class__.__name__, tuple(getattr(event, slot) for slot in event.__slots__)) for event in events]
+    self.assertEqual(fields, [("ClientUserinfoChanged", (12, "^1Vader")), ("ClientUserinfoChanged", (3, None)),
+                              ("Say", (12, False, "^1Vader", "!nominate mb2_dotf")), ("Say", (3, True, "Bob", "hi: there")),
+                              ("AdminSay", ("!rehash",)), ("ClientDisconnect", (12,)), ("Exit", ("Timelimit hit.",))])
+
+class MalformedServer(fakeserver.FakeServer):
+
+  """Game server whose status reply gets cut off in the middle of a player line."""
+
+  def handle(self, data):
+
+    reply = fakeserver.FakeServer.handle(self, data)
+    return reply[:-4] if data.startswith("\xff\xff\xff\xffgetstatus") else reply
+
+class ServerQueryTest(TestCase):
+
+  """Server status through getstatus and the players it no longer lists."""
+
+  def query(self, server_class):
+
+    server = server_class(("127.0.0.1", 0))
+    server.players.update({0: "^1Vader", 3: "Bob"})
+    server.start()
+
+    try:
+
+      return rtvrtm.ServerQuery(server.address, "127.0.0.1", timeout=2).status()
+
+    finally:
+
+      server.close()
+
+  def test_status(self):
+
+    infostring, cvars, players = self.query(fakeserver.FakeServer)
+    self.assertEqual(cvars["mapname"], "mb2_dotf")
+    self.assertEqual(players, [(0, 50, "^1Vader"), (0, 50, "Bob")])
+
+  def test_malformed_status(self):
+
+    self.assertEqual(self.query(MalformedServer), None)
+
+  def test_stale_players(self):
+
+    players = dict.fromkeys((0, 1, 2, 5))
+    client_names = {0: "^1Vader", 1: "Bob", 2: "Bob", 5: "Padawan"}
+    listed = [(0, 50, "Bob"), (0, 50, "^1Vader")]
+    self.assertEqual(rtvrtm.stale_players(players, client_names, listed), [2, 5])
+    self.assertEqual(rtvrtm.stale_players(players, client_names, listed + [(0, 50, "Bob")]), [5])
+    self.assertEqual(rtvrtm.stale_players(players, {0: "^1Vader"}, listed), []) # Unknown names are never dropped.
+    self.assertEqual(rtvrtm.stale_players(players, {}, []), [0, 1, 2, 5]) # Empty server.
+    self.assertEqual(rtvrtm.stale_players(players, client_names, listed * 2), [])
+
+class RconTest(TestCase):
+
+  """Outgoing rcon commands against a fake game server."""
+
+  def setUp(self):
+
+    self.server = fakeserver.FakeServer(("127.0.0.1", 0), "secret")
+    self.server.start()
+
+  def tearDown(self):
+
+    self.server.close()
+
+  def rcon(self, **kwargs):
+
+    rcon = rtvrtm.Rcon(self.server.address, "127.0.0.1", "secret", **kwargs)
+    self.addCleanup(rcon.close)
+    return rcon
+
+  def commands(self):
+
+    return [command for (received, command) in iter(self.server.commands)]
+
+  def test_sender_survives_errors(self):
+
+    rcon = self.rcon()
+    connect = rcon._connect
+    broken = [ValueError("broken socket")]
+
+    def connect_once():
+
+      if broken:
+
+        raise broken.pop()
+
+      return connect()
+
+    rcon._connect = connect_once
+    rcon.say("first")
+    rcon.say("second")
+    rcon.flush(5)
+    self.assertEqual(self.commands(), ["say second"])
+    self.assertEqual((rcon.counters["failed"], rcon.counters["sent"]), (1, 1))
+
+  def test_retries_until_deadline(self):
+
+    rcon = self.rcon()
+    self.server.drop = 1 # Every reply is lost.
+    self.assertFalse(rcon._send("\xff\xff\xff\xffrcon secret say lost", attempts=3, deadline=(time() + 1.5)))
+    self.assertEqual(self.commands(), ["say lost"] * 2) # The third attempt would start past the deadline.
+    self.assertEqual((rcon.counters["retried"], rcon.counters["timed out"], rcon.counters["failed"]), (1, 1, 0))
+    self.assertEqual(rcon.metrics["say"].timeouts, 2)
+    self.server.drop = 0
+    self.assertTrue(rcon._send("\xff\xff\xff\xffrcon secret say found", attempts=1))
+    self.assertEqual(rcon.counters["sent"], 1)
+
+  def test_throttled_past_deadline(self):
+
+    rcon = self.rcon(rate=(1, 2.0))
+    rcon.refilled = time() # Bucket just emptied, so the next command waits half a second.
+    self.assertFalse(rcon._send("\xff\xff\xff\xffrcon secret say late", deadline=(time() + 0.25)))
+    self.assertEqual(self.commands(), [])
+    self.assertEqual(rcon.counters["timed out"], 1)
+
+  def test_priority_order(self):
+
+    rcon = self.rcon()
+
+    with rcon.ready: # The sender can't pick up anything before everything is queued.
+
+      rcon.say("gg")
+      rcon.svsay("Vote for the next map", rcon.VOTING)
+      rcon.say("gg") # Coalesced with the one already waiting.
+      rcon.mbmode("0 mb2_deathstar")
+      rcon.clientkick(3)
+
+    rcon.flush(5)
+    self.assertEqual(self.commands(), ["mbmode 0 mb2_deathstar", "clientkick 3", "svsay Vote for the next map",
+                                       "say gg"])
+    self.assertEqual((rcon.counters["coalesced"], rcon.counters["sent"]), (1, 4))
+    self.assertEqual(rcon.pending(), (0, 0.0))
+
+  def test_expired_messages(self):
+
+    rcon = self.rcon(expiry=0) # Informational messages are already too late once queued.
+    rcon.say("too late")
+    rcon.svsay("Vote for the next map", rcon.VOTING)
+    rcon.flush(5)
+    self.assertEqual(self.commands(), ["svsay Vote for the next map"])
+    self.assertEqual(rcon.counters["expired"], 1)
+
+  def test_svsay_split(self):
+
+    rcon = self.rcon()
+    maps = ", ".join(("mb2_map%i" % (i)) for i in xrange(30))
+    rcon.svsay(maps)
+    rcon.svsay("x" * (rcon.SVSAY_LENGTH + 1)) # Can't be split, sent with say instead.
+    rcon.flush(5)
+    commands = self.commands()
+    self.assertEqual(commands[-1], "say %s" % ("x" * (rcon.SVSAY_LENGTH + 1)))
+    self.assertEqual(" ".join(command[6:] for command in commands[:-1]), maps)
+    self.assertTrue(len(commands) > 2 and all(command.startswith("svsay ") and len(command) <= (rcon.SVSAY_LENGTH + 6)
+                                              for command in commands[:-1]))
+
+if __name__ == "__main__":
+
+  main()